@@ -18,6 +18,102 @@ SERVICE_ACCOUNT_FILE = os.getenv(
 JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "change_this_in_production")
 JWT_ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
+# User IDs whose tokens carry the manager role (comma-separated); every
+# other account, including new signups, gets an agent token. List accounts
+# that already exist, or whoever signs up first with the ID gets the role
+MANAGER_IDS = {uid.strip() for uid in os.getenv("MANAGER_IDS", "").split(",") if uid.strip()}
 
 # Timezone
 TIMEZONE = "Asia/Karachi"
+
+# Sheet snapshot cache (seconds before a worksheet is re-read from Google)
+SHEET_CACHE_TTL_SECONDS = float(os.getenv("SHEET_CACHE_TTL_SECONDS", "15"))
+
+# Write-behind queue for Sheets mutations
+SHEET_FLUSH_INTERVAL_SECONDS = float(os.getenv("SHEET_FLUSH_INTERVAL_SECONDS", "0.5"))
+SHEET_FLUSH_MAX_PENDING = int(os.getenv("SHEET_FLUSH_MAX_PENDING", "50"))
+# A batch Google keeps rejecting (4xx) is dropped after this many attempts;
+# other failures are retried with backoff up to SHEET_FLUSH_MAX_BACKOFF_SECONDS
+SHEET_FLUSH_MAX_ATTEMPTS = int(os.getenv("SHEET_FLUSH_MAX_ATTEMPTS", "3"))
+SHEET_FLUSH_MAX_BACKOFF_SECONDS = float(os.getenv("SHEET_FLUSH_MAX_BACKOFF_SECONDS", "60"))
+# ?confirm=true on a write waits this long for it to reach Google Sheets
+SHEET_CONFIRM_TIMEOUT_SECONDS = float(os.getenv("SHEET_CONFIRM_TIMEOUT_SECONDS", "10"))
+
+# Record_ID allocator (SQLite counter shared by all workers on this host)
+RECORD_ID_DB = os.getenv("RECORD_ID_DB", str(BASE_DIR / "record_ids.sqlite3"))
+RECORD_ID_BLOCK_SIZE = int(os.getenv("RECORD_ID_BLOCK_SIZE", "20"))
+
+# Thread pool used by async endpoints for blocking Sheets calls
+SHEETS_MAX_WORKERS = int(os.getenv("SHEETS_MAX_WORKERS", "8"))
+SHEETS_CALL_TIMEOUT_SECONDS = float(os.getenv("SHEETS_CALL_TIMEOUT_SECONDS", "20"))
+
+# Google Sheets API quota: per-minute read/write budgets, burst size, and
+# retries (jittered exponential backoff) for 429/5xx responses
+SHEETS_READS_PER_MINUTE = float(os.getenv("SHEETS_READS_PER_MINUTE", "60"))
+SHEETS_WRITES_PER_MINUTE = float(os.getenv("SHEETS_WRITES_PER_MINUTE", "60"))
+SHEETS_QUOTA_BURST = float(os.getenv("SHEETS_QUOTA_BURST", "10"))
+SHEETS_MAX_RETRIES = int(os.getenv("SHEETS_MAX_RETRIES", "5"))
+SHEETS_RETRY_BASE_SECONDS = float(os.getenv("SHEETS_RETRY_BASE_SECONDS", "1"))
+SHEETS_RETRY_MAX_SECONDS = float(os.getenv("SHEETS_RETRY_MAX_SECONDS", "32"))
+
+# WebSocket fan-out: per-connection outbound queue and slow-consumer policy
+# ("drop_oldest", "drop_newest" or "disconnect")
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "100"))
+WS_SEND_TIMEOUT_SECONDS = float(os.getenv("WS_SEND_TIMEOUT_SECONDS", "5"))
+WS_SLOW_CONSUMER_POLICY = os.getenv("WS_SLOW_CONSUMER_POLICY", "drop_oldest")
+
+# WebSocket broadcast backend: "local" (single worker), "sqlite" (several
+# workers on one host) or "redis" (any Redis-compatible server)
+BROADCAST_BACKEND = os.getenv("BROADCAST_BACKEND", "local")
+BROADCAST_SQLITE_PATH = os.getenv(
+    "BROADCAST_SQLITE_PATH", str(BASE_DIR / "ws_events.sqlite3")
+)
+BROADCAST_POLL_INTERVAL_SECONDS = float(os.getenv("BROADCAST_POLL_INTERVAL_SECONDS", "0.1"))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+# WebSocket replay: recent events kept per worker so a reconnecting client
+# can resume from its last sequence number
+WS_REPLAY_BUFFER_SIZE = int(os.getenv("WS_REPLAY_BUFFER_SIZE", "1000"))
+
+# User directory (Sheet3) cache: seconds before it is re-read from Google
+USERS_CACHE_TTL_SECONDS = float(os.getenv("USERS_CACHE_TTL_SECONDS", "300"))
+# An unknown user ID (e.g. signed up on another worker) forces a re-read, at
+# most once per this many seconds
+USERS_MISS_REFRESH_SECONDS = float(os.getenv("USERS_MISS_REFRESH_SECONDS", "10"))
+
+# Password hashing: "scrypt" for new hashes (legacy "sha256" hashes are
+# upgraded on login); the KDF runs on a pool of worker processes
+PASSWORD_HASHER = os.getenv("PASSWORD_HASHER", "scrypt")
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+SCRYPT_N = int(os.getenv("SCRYPT_N", "16384"))
+SCRYPT_R = int(os.getenv("SCRYPT_R", "8"))
+SCRYPT_P = int(os.getenv("SCRYPT_P", "1"))
+
+# Verified-token LRU used by the get_current_manager dependency
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "1024"))
+
+# System of record: "sheets" (Google Sheets) or "sqlite" (local WAL database)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "sheets")
+STORAGE_SQLITE_PATH = os.getenv("STORAGE_SQLITE_PATH", str(BASE_DIR / "transactions.sqlite3"))
+# Import the existing sheets (rows, archive and users) into a new sqlite
+# database on first start; 0 only for a deployment with no sheet history
+STORAGE_SQLITE_BOOTSTRAP = os.getenv("STORAGE_SQLITE_BOOTSTRAP", "1") == "1"
+
+# Google Sheets mirror of the sqlite backend's journal
+SHEETS_MIRROR_ENABLED = os.getenv("SHEETS_MIRROR_ENABLED", "1") == "1"
+SHEETS_MIRROR_INTERVAL_SECONDS = float(os.getenv("SHEETS_MIRROR_INTERVAL_SECONDS", "1"))
+SHEETS_MIRROR_BATCH_SIZE = int(os.getenv("SHEETS_MIRROR_BATCH_SIZE", "200"))
+
+# Background poller for edits made directly in Google Sheets (sheets
+# backend): seconds between polls, adapting between the two bounds
+CHANGE_POLL_ENABLED = os.getenv("CHANGE_POLL_ENABLED", "1") == "1"
+CHANGE_POLL_MIN_SECONDS = float(os.getenv("CHANGE_POLL_MIN_SECONDS", "10"))
+CHANGE_POLL_MAX_SECONDS = float(os.getenv("CHANGE_POLL_MAX_SECONDS", "60"))
+
+# Archival of settled rows (sheets backend): "" (off), "sheets" (per-month
+# archive worksheets) or "parquet" (per-month files in ARCHIVE_DIR, needs
+# pyarrow). Keep it set once rows have been archived, or they stop being read.
+ARCHIVE_BACKEND = os.getenv("ARCHIVE_BACKEND", "")
+ARCHIVE_AFTER_DAYS = float(os.getenv("ARCHIVE_AFTER_DAYS", "2"))
+ARCHIVE_INTERVAL_SECONDS = float(os.getenv("ARCHIVE_INTERVAL_SECONDS", "3600"))
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", str(BASE_DIR / "archive"))
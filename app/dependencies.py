@@ -0,0 +1,54 @@
+# app/dependencies.py
+from typing import Optional
+
+from fastapi import Depends, HTTPException, status
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+
+from app.services.auth import ROLE_MANAGER, verify_access_token
+
+_bearer = HTTPBearer(auto_error=False)
+
+
+def _verify(credentials: HTTPAuthorizationCredentials):
+    try:
+        return verify_access_token(credentials.credentials)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=str(e),
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+
+def get_current_manager(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(_bearer),
+) -> str:
+    """
+    User ID from the "Authorization: Bearer <token>" header; 401 if it is
+    missing, invalid or expired, 403 if it is not a manager token.
+    """
+    if credentials is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    user_id, role = _verify(credentials)
+    if role != ROLE_MANAGER:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="Manager access required"
+        )
+    return user_id
+
+
+def get_optional_manager(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(_bearer),
+) -> Optional[str]:
+    """
+    Manager user ID, or None when no token or a non-manager token is sent
+    (endpoints the agent portal also calls). A bad token is still a 401.
+    """
+    if credentials is None:
+        return None
+    user_id, role = _verify(credentials)
+    return user_id if role == ROLE_MANAGER else None
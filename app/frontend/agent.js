@@ -54,6 +54,11 @@ let recentData = [];
 let currentEditRecordId = null;
 let currentView = "new";
 let ws = null;
+// Resume point for the live event stream (see setupWebSocket)
+let wsEpoch = null;
+let wsLastSeq = null;
+let wsReconnectTimer = null;
+let wsReconnectDelay = 1000;
 
 // ================= API CALLS =================
 
@@ -519,22 +524,52 @@ async function loadRecentTransactions() {
 
 // ================= WEBSOCKET HANDLING =================
 
-function setupWebSocket() {
+function closeWebSocket() {
+  clearTimeout(wsReconnectTimer);
+  wsReconnectTimer = null;
   if (ws) {
+    ws.onclose = null;
     ws.close();
     ws = null;
   }
+}
+
+function setupWebSocket() {
+  closeWebSocket();
 
-  ws = new WebSocket(WS_URL);
+  // Only spectrum events, and only the agent shown in the recent view
+  const params = new URLSearchParams();
+  params.set("sheet", "spectrum");
+  const recentAgent = $("recent-agent") ? $("recent-agent").value : "";
+  if (recentAgent) {
+    params.set("agent", recentAgent);
+  }
+  // After a drop, ask the server to replay only the events we missed
+  if (wsEpoch && wsLastSeq !== null) {
+    params.set("epoch", wsEpoch);
+    params.set("last_seq", wsLastSeq);
+  }
+  ws = new WebSocket(WS_URL + "?" + params.toString());
 
   ws.onopen = function () {
-    // Connected
+    wsReconnectDelay = 1000;
   };
 
   ws.onmessage = function (evt) {
     try {
       const msg = JSON.parse(evt.data);
-      if (msg.type === "new_pending") {
+      if (typeof msg.seq === "number" && msg.type !== "hello") {
+        wsLastSeq = msg.seq;
+      }
+      if (msg.type === "hello") {
+        if (msg.epoch !== wsEpoch) {
+          wsEpoch = msg.epoch;
+          wsLastSeq = msg.seq;
+        }
+      } else if (msg.type === "resync") {
+        // Too much was missed to replay: reload the table instead
+        loadRecentTransactions();
+      } else if (msg.type === "new_pending") {
         const { sheet, record } = msg;
         if (sheet === "spectrum") {
           const wrapper = { data: record };
@@ -565,7 +600,11 @@ function setupWebSocket() {
   };
 
   ws.onerror = function () {};
-  ws.onclose = function () {};
+  ws.onclose = function () {
+    ws = null;
+    wsReconnectTimer = setTimeout(setupWebSocket, wsReconnectDelay);
+    wsReconnectDelay = Math.min(wsReconnectDelay * 2, 30000);
+  };
 }
 
 // ================= VIEW SWITCHING (TABS) =================
@@ -656,7 +695,13 @@ function init() {
 
   // Recent filters
   if ($("recent-agent")) {
-    $("recent-agent").addEventListener("change", loadRecentTransactions);
+    $("recent-agent").addEventListener("change", function () {
+      // New filter, new stream: the table is reloaded below
+      wsEpoch = null;
+      wsLastSeq = null;
+      setupWebSocket();
+      loadRecentTransactions();
+    });
   }
 
   // Initial data
@@ -9,12 +9,21 @@ let activeSheet = "spectrum"; // spectrum or insurance for pending view
 let spectrumData = [];
 let insuranceData = [];
 let ws = null;
+// Resume point for the live event stream (see setupWebSocket)
+let wsEpoch = null;
+let wsLastSeq = null;
+let wsReconnectTimer = null;
+let wsReconnectDelay = 1000;
 
 // Analytics data
 let allSpectrum = [];
 let allInsurance = [];
 let analyticsLoaded = false;
 let analyticsChart = null;
+// Server-side aggregates behind the chart and summary cards; the rows
+// above only feed the table and the CSV export
+let analyticsSummary = null;
+let analyticsRequest = 0;
 
 // Helpers
 function $(id) {
@@ -58,7 +67,12 @@ async function apiFetch(path, options = {}) {
     headers["Authorization"] = "Bearer " + authToken;
   }
   headers["Content-Type"] = "application/json";
-  return fetch(url, { ...options, headers });
+  const resp = await fetch(url, { ...options, headers });
+  if ((resp.status === 401 || resp.status === 403) && authToken && !path.startsWith("/auth/")) {
+    // Token expired, revoked or not a manager token: back to the login screen
+    handleLogout();
+  }
+  return resp;
 }
 
 async function apiLogin(user, pass) {
@@ -70,7 +84,11 @@ async function apiLogin(user, pass) {
     const data = await resp.json().catch(() => ({}));
     throw new Error(data.detail || "Login failed");
   }
-  return resp.json();
+  const data = await resp.json();
+  if (data.role !== "manager") {
+    throw new Error("This account does not have manager access.");
+  }
+  return data;
 }
 
 async function apiSignup(user, pass) {
@@ -82,7 +100,11 @@ async function apiSignup(user, pass) {
     const data = await resp.json().catch(() => ({}));
     throw new Error(data.detail || "Signup failed");
   }
-  return resp.json();
+  const data = await resp.json();
+  if (data.role !== "manager") {
+    throw new Error("Account created, but it does not have manager access yet.");
+  }
+  return data;
 }
 
 async function apiGetPending(sheet) {
@@ -122,6 +144,20 @@ async function apiGetAll(sheet) {
   return resp.json();
 }
 
+async function apiGetAnalytics(params) {
+  const resp = await apiFetch(
+    `/transactions/analytics?${params.toString()}`,
+    {
+      method: "GET",
+    }
+  );
+  if (!resp.ok) {
+    const data = await resp.json().catch(() => ({}));
+    throw new Error(data.detail || "Failed to load analytics");
+  }
+  return resp.json();
+}
+
 async function apiGetNightTotal(sheet) {
   const params = new URLSearchParams();
   if (sheet) {
@@ -154,20 +190,49 @@ function playNewLeadSound() {
   }
 }
 
-function setupWebSocket() {
+function closeWebSocket() {
+  clearTimeout(wsReconnectTimer);
+  wsReconnectTimer = null;
   if (ws) {
+    ws.onclose = null;
     ws.close();
     ws = null;
   }
+}
+
+function setupWebSocket() {
+  closeWebSocket();
 
-  ws = new WebSocket(WS_URL);
+  const params = new URLSearchParams();
+  // After a drop, ask the server to replay only the events we missed
+  if (wsEpoch && wsLastSeq !== null) {
+    params.set("epoch", wsEpoch);
+    params.set("last_seq", wsLastSeq);
+  }
+  // The token rides in the subprotocol header, not the URL (which ends up
+  // in proxy and access logs); it lets the server send every agent's events
+  ws = authToken
+    ? new WebSocket(WS_URL + "?" + params.toString(), ["bearer", authToken])
+    : new WebSocket(WS_URL + "?" + params.toString());
   ws.onopen = function () {
-    // Connected
+    wsReconnectDelay = 1000;
   };
   ws.onmessage = function (evt) {
     try {
       const msg = JSON.parse(evt.data);
-      if (msg.type === "status_update") {
+      if (typeof msg.seq === "number" && msg.type !== "hello") {
+        wsLastSeq = msg.seq;
+      }
+      if (msg.type === "hello") {
+        if (msg.epoch !== wsEpoch) {
+          wsEpoch = msg.epoch;
+          wsLastSeq = msg.seq;
+        }
+      } else if (msg.type === "resync") {
+        // Too much was missed to replay: reload the tables instead
+        loadAllPending();
+        loadNightTotal();
+      } else if (msg.type === "status_update") {
         const { sheet, record_id } = msg;
         if (sheet === "spectrum") {
           spectrumData = spectrumData.filter(
@@ -196,7 +261,11 @@ function setupWebSocket() {
   };
 
   ws.onerror = function () {};
-  ws.onclose = function () {};
+  ws.onclose = function () {
+    ws = null;
+    wsReconnectTimer = setTimeout(setupWebSocket, wsReconnectDelay);
+    wsReconnectDelay = Math.min(wsReconnectDelay * 2, 30000);
+  };
 }
 
 // Render lead blocks (styled, collapsible cards)
@@ -412,10 +481,9 @@ function handleLogout() {
   userId = null;
   localStorage.removeItem("token");
   localStorage.removeItem("userId");
-  if (ws) {
-    ws.close();
-    ws = null;
-  }
+  closeWebSocket();
+  wsEpoch = null;
+  wsLastSeq = null;
   show("auth-section");
   hide("dashboard-section");
   const logoutBtn = $("logout-btn");
@@ -535,13 +603,6 @@ function parseTimestamp(ts) {
   return null;
 }
 
-function parseCharge(value) {
-  if (value == null) return 0;
-  const str = String(value).replace(/[^0-9.\-]+/g, "");
-  const num = parseFloat(str);
-  return isNaN(num) ? 0 : num;
-}
-
 function getAnalyticsBaseData() {
   const sheetSelect = $("analytics-sheet");
   const sheetValue = sheetSelect ? sheetSelect.value : "spectrum";
@@ -570,6 +631,8 @@ function collectAnalyticsFilters() {
   const status = statusSelect ? statusSelect.value : "";
   const chartType = chartTypeSelect ? chartTypeSelect.value : "bar";
 
+  let fromText = null;
+  let toText = null;
   let fromDate = null;
   let toDate = null;
 
@@ -579,13 +642,15 @@ function collectAnalyticsFilters() {
     fromTimeInput &&
     fromTimeInput.value
   ) {
-    fromDate = new Date(fromDateInput.value + "T" + fromTimeInput.value);
+    fromText = fromDateInput.value + "T" + fromTimeInput.value;
+    fromDate = new Date(fromText);
   }
   if (toDateInput && toDateInput.value && toTimeInput && toTimeInput.value) {
-    toDate = new Date(toDateInput.value + "T" + toTimeInput.value);
+    toText = toDateInput.value + "T" + toTimeInput.value;
+    toDate = new Date(toText);
   }
 
-  return { agent, status, chartType, fromDate, toDate };
+  return { agent, status, chartType, fromText, toText, fromDate, toDate };
 }
 
 function filterAnalyticsData() {
@@ -604,111 +669,46 @@ function filterAnalyticsData() {
 
     if (status && row["Status"] !== status) continue;
 
-    filtered.push({
-      ...row,
-      _parsedTimestamp: ts,
-      _chargeFloat: parseCharge(row["Charge"]),
-    });
+    filtered.push(row);
   }
   return filtered;
 }
 
-function updateAnalyticsMetrics(filteredRows, groupedByHour) {
-  let totalCharge = 0;
-  let totalTransactions = filteredRows.length;
-  for (const row of filteredRows) {
-    totalCharge += row._chargeFloat || 0;
-  }
-
+function updateAnalyticsMetrics(totals) {
   const metricTotalCharge = $("metric-total-charge");
   const metricTotalTransactions = $("metric-total-transactions");
   const metricAvgPerHour = $("metric-avg-per-hour");
   const metricPeakTimestamp = $("metric-peak-timestamp");
 
   if (metricTotalCharge) {
-    metricTotalCharge.textContent = "$" + totalCharge.toFixed(2);
+    metricTotalCharge.textContent = "$" + totals.charge.toFixed(2);
   }
   if (metricTotalTransactions) {
-    metricTotalTransactions.textContent = String(totalTransactions);
+    metricTotalTransactions.textContent = String(totals.count);
   }
-
-  const hours = Object.keys(groupedByHour);
-  if (hours.length === 0) {
-    if (metricAvgPerHour) metricAvgPerHour.textContent = "$0.00";
-    if (metricPeakTimestamp) metricPeakTimestamp.textContent = "N/A";
-    return;
-  }
-
-  let sumPerHour = 0;
-  let peakHour = null;
-  let peakValue = -Infinity;
-
-  hours.forEach((key) => {
-    const value = groupedByHour[key];
-    sumPerHour += value;
-    if (value > peakValue) {
-      peakValue = value;
-      peakHour = new Date(parseInt(key, 10));
-    }
-  });
-
-  const avgPerHour = sumPerHour / hours.length;
-
   if (metricAvgPerHour) {
-    metricAvgPerHour.textContent = "$" + avgPerHour.toFixed(2);
+    metricAvgPerHour.textContent = "$" + totals.avg_per_hour.toFixed(2);
   }
   if (metricPeakTimestamp) {
-    metricPeakTimestamp.textContent = peakHour
-      ? peakHour.toLocaleString()
+    // Hour keys are naive sheet-local ISO strings, like the row Timestamps
+    metricPeakTimestamp.textContent = totals.peak_hour
+      ? new Date(totals.peak_hour).toLocaleString()
       : "N/A";
   }
 }
 
 function renderAnalyticsChart() {
-  const filtered = filterAnalyticsData();
+  if (!analyticsSummary) return;
   const { chartType } = collectAnalyticsFilters();
   const ctx = $("analytics-chart");
   if (!ctx) return;
 
-  const grouped = {};
-  const groupedStatus = {};
-
-  filtered.forEach((row) => {
-    const ts = row._parsedTimestamp;
-    const charge = row._chargeFloat || 0;
-    const status = row["Status"] || "Unknown";
-
-    const hour = new Date(
-      ts.getFullYear(),
-      ts.getMonth(),
-      ts.getDate(),
-      ts.getHours(),
-      0,
-      0,
-      0
-    );
-    const key = hour.getTime();
-
-    if (!grouped[key]) grouped[key] = 0;
-    grouped[key] += charge;
-
-    if (!groupedStatus[key]) groupedStatus[key] = {};
-    if (!groupedStatus[key][status]) groupedStatus[key][status] = 0;
-    groupedStatus[key][status] += charge;
-  });
-
-  const sortedKeys = Object.keys(grouped)
-    .map((k) => parseInt(k, 10))
-    .sort((a, b) => a - b);
-
-  const labels = sortedKeys.map((ms) => {
-    const d = new Date(ms);
-    return d.toLocaleString();
-  });
-
-  const values = sortedKeys.map((ms) => grouped[ms]);
+  // Hourly buckets come from /transactions/analytics, already sorted
+  const byHour = analyticsSummary.by_hour || [];
+  const labels = byHour.map((bucket) => new Date(bucket.key).toLocaleString());
+  const values = byHour.map((bucket) => bucket.charge);
 
-  updateAnalyticsMetrics(filtered, grouped);
+  updateAnalyticsMetrics(analyticsSummary.totals);
 
   if (analyticsChart) {
     analyticsChart.destroy();
@@ -716,18 +716,22 @@ function renderAnalyticsChart() {
   }
 
   if (chartType === "stacked") {
+    const groupedStatus = {};
+    (analyticsSummary.by_hour_status || []).forEach((bucket) => {
+      if (!groupedStatus[bucket.key]) groupedStatus[bucket.key] = {};
+      groupedStatus[bucket.key][bucket.status] = bucket.charge;
+    });
     const allStatusesSet = new Set();
-    sortedKeys.forEach((key) => {
-      const bucket = groupedStatus[key] || {};
-      Object.keys(bucket).forEach((status) => allStatusesSet.add(status));
+    (analyticsSummary.by_hour_status || []).forEach((bucket) => {
+      allStatusesSet.add(bucket.status);
     });
     const allStatuses = Array.from(allStatusesSet);
 
     const datasets = allStatuses.map((status) => {
       return {
         label: status,
-        data: sortedKeys.map((key) => {
-          const bucket = groupedStatus[key] || {};
+        data: byHour.map((hour) => {
+          const bucket = groupedStatus[hour.key] || {};
           return bucket[status] || 0;
         }),
       };
@@ -906,16 +910,9 @@ function renderAnalyticsDuplicates() {
   const body = $("analytics-duplicates-body");
   if (!wrapper || !empty || !body) return;
 
-  const baseData = getAnalyticsBaseData();
-  const counts = {};
-  baseData.forEach((row) => {
-    const key = String(row["Record_ID"] || "").trim();
-    if (!key) return;
-    counts[key] = (counts[key] || 0) + 1;
-  });
-
-  const duplicates = Object.entries(counts)
-    .filter(([, count]) => count > 1)
+  if (!analyticsSummary) return;
+  const duplicates = (analyticsSummary.duplicates || [])
+    .map((dup) => [dup.record_id, dup.count])
     .sort((a, b) => b[1] - a[1]);
 
   body.innerHTML = "";
@@ -988,10 +985,41 @@ function downloadAnalyticsCSV() {
   URL.revokeObjectURL(url);
 }
 
+async function loadAnalyticsSummary() {
+  const sheetSelect = $("analytics-sheet");
+  const sheetValue = sheetSelect ? sheetSelect.value : "spectrum";
+  const { agent, status, fromText, toText } = collectAnalyticsFilters();
+
+  // Naive bounds: the server reads them in the sheets' local time
+  const params = new URLSearchParams();
+  if (sheetValue === "spectrum" || sheetValue === "insurance") {
+    params.set("sheet", sheetValue);
+  }
+  if (agent) params.set("agent_name", agent);
+  if (status) params.set("status", status);
+  if (fromText) params.set("start", fromText + ":00");
+  if (toText) params.set("end", toText + ":00");
+
+  // Only the latest request may render; filters can change mid-flight
+  const request = ++analyticsRequest;
+  try {
+    const summary = await apiGetAnalytics(params);
+    if (request !== analyticsRequest) return;
+    analyticsSummary = summary;
+    renderAnalyticsChart();
+    renderAnalyticsDuplicates();
+  } catch (err) {
+    if (request !== analyticsRequest) return;
+    showError(
+      "dashboard-error",
+      err.message || "Failed to load analytics."
+    );
+  }
+}
+
 function refreshAnalyticsUI() {
-  renderAnalyticsChart();
   renderAnalyticsTable();
-  renderAnalyticsDuplicates();
+  loadAnalyticsSummary();
 }
 
 async function loadAnalyticsDataIfNeeded() {
@@ -1103,7 +1131,8 @@ function initializeAnalyticsFilters() {
     statusSel.addEventListener("change", refreshAnalyticsUI);
   }
   if (chartSel) {
-    chartSel.addEventListener("change", refreshAnalyticsUI);
+    // Same aggregates, different chart: no refetch
+    chartSel.addEventListener("change", renderAnalyticsChart);
   }
   if (searchInput) {
     searchInput.addEventListener("input", () => {
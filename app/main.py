@@ -1,4 +1,5 @@
 from pathlib import Path
+from typing import Optional
 #1
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
@@ -6,12 +7,47 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 
 from app.routers import auth_router, transactions_router
-from app.ws_manager import manager
+from app.services.google_sheets import (
+    get_cache_stats,
+    get_writer_stats,
+    get_id_allocator_stats,
+    get_night_totals_stats,
+    flush_pending_writes,
+    get_quota_stats,
+    get_archive_stats,
+)
+from app.services import sheets_async
+from app.services.archive import create_archiver
+from app.services.change_detector import create_change_detector
+from app.services.sheets_replicator import create_replicator
+from app.services.storage import storage
+from app.config import BROADCAST_BACKEND
+from app.services.auth import (
+    ROLE_MANAGER,
+    verify_access_token,
+    get_token_cache_stats,
+    get_user_directory_stats,
+    shutdown_hasher,
+)
+from app.ws_manager import manager, parse_resume, parse_topics, restrict_topics
 
 # Paths
 BASE_DIR = Path(__file__).resolve().parent
 FRONTEND_DIR = BASE_DIR / "frontend"
 
+# Mirrors the local journal to Google Sheets (sqlite storage only)
+replicator = create_replicator(storage)
+# Turns edits made directly in Google Sheets into WebSocket events. With a
+# cross-worker bus the polling worker cannot see the others' sockets, so it
+# always polls
+change_detector = create_change_detector(
+    storage,
+    manager.broadcast,
+    (lambda: bool(manager.active_connections)) if BROADCAST_BACKEND == "local" else (lambda: True),
+)
+# Moves old settled rows out of the hot sheets (ARCHIVE_BACKEND)
+archiver = create_archiver(storage)
+
 app = FastAPI(
     title="Client Management System API - Techware Hub",
     version="1.0.0",
@@ -24,6 +60,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Sheet-Version", "X-Total-Count", "X-Next-Cursor"],
 )
 
 # Static files (CSS, JS, images)
@@ -61,15 +98,95 @@ def health_check():
     return {"status": "ok", "message": "Client Management System API is running"}
 
 
+# Internal counters (cache hit ratio etc.) for monitoring
+@app.get("/api/metrics")
+def metrics():
+    return {
+        "storage": storage.stats(),
+        "replicator": replicator.stats() if replicator else None,
+        "change_detector": change_detector.stats() if change_detector else None,
+        "archive": {
+            "store": get_archive_stats(),
+            "job": archiver.stats() if archiver else None,
+        },
+        "sheet_cache": get_cache_stats(),
+        "sheet_writer": get_writer_stats(),
+        "record_ids": get_id_allocator_stats(),
+        "sheets_executor": sheets_async.get_executor_stats(),
+        "sheets_quota": get_quota_stats(),
+        "night_totals": get_night_totals_stats(),
+        "users": get_user_directory_stats(),
+        "auth_tokens": get_token_cache_stats(),
+        "websockets": manager.stats(),
+    }
+
+
+# Connect the WebSocket broadcast backend (cross-worker bus)
+@app.on_event("startup")
+async def start_broadcast_backend():
+    await manager.start()
+    if replicator:
+        replicator.start()
+    if change_detector:
+        change_detector.start()
+    if archiver:
+        archiver.start()
+
+
+# Push any queued Sheets writes before the worker exits
+@app.on_event("shutdown")
+async def shutdown_services():
+    if archiver:
+        archiver.stop()
+    if change_detector:
+        await change_detector.stop()
+    await manager.stop()
+    flush_pending_writes()
+    if replicator:
+        replicator.stop()
+    sheets_async.shutdown()
+    shutdown_hasher()
+
+
 # Include API routers
 app.include_router(auth_router.router)
 app.include_router(transactions_router.router)
 
 
+def _socket_token(websocket: WebSocket) -> Optional[str]:
+    # Browsers cannot set headers on a WebSocket, so the token is offered as
+    # the subprotocol pair "bearer, <token>"
+    offered = [p.strip() for p in websocket.headers.get("sec-websocket-protocol", "").split(",")]
+    if len(offered) == 2 and offered[0] == "bearer" and offered[1]:
+        return offered[1]
+    return None
+
+
+def _is_manager(token: Optional[str]) -> bool:
+    if not token:
+        return False
+    try:
+        _, role = verify_access_token(token)
+    except ValueError:
+        return False
+    return role == ROLE_MANAGER
+
+
 # WebSocket for manager live updates
 @app.websocket("/ws/manager")
 async def websocket_manager(websocket: WebSocket):
-    await manager.connect(websocket)
+    # Optional topic filters: ?sheet=...&agent=...&type=...
+    # Resuming after a drop: &epoch=...&last_seq=...
+    # Managers pass their access token in Sec-WebSocket-Protocol (see
+    # _socket_token); without a manager token only one agent's events are sent
+    query = websocket.query_params
+    token = _socket_token(websocket)
+    await manager.connect(
+        websocket,
+        restrict_topics(parse_topics(query), _is_manager(token)),
+        parse_resume(query),
+        subprotocol="bearer" if token else None,
+    )
     try:
         # Keep connection alive; we do not currently use messages from client
         while True:
@@ -2,22 +2,25 @@
 from fastapi import APIRouter, HTTPException, status
 
 from app.schemas import SignupRequest, LoginRequest, TokenResponse
-from app.services.auth import user_exists, add_user, validate_login, create_access_token
+from app.services.auth import add_user, validate_login, create_access_token, user_role
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
 
 @router.post("/signup", response_model=TokenResponse)
 def signup(payload: SignupRequest):
-    if user_exists(payload.user_id):
+    try:
+        # Checks uniqueness and appends atomically
+        add_user(payload.user_id, payload.password)
+    except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="User ID already exists",
+            detail=str(e),
         )
 
-    add_user(payload.user_id, payload.password)
-    token = create_access_token(subject=payload.user_id)
-    return TokenResponse(access_token=token)
+    role = user_role(payload.user_id)
+    token = create_access_token(subject=payload.user_id, role=role)
+    return TokenResponse(access_token=token, role=role)
 
 
 @router.post("/login", response_model=TokenResponse)
@@ -28,5 +31,6 @@ def login(payload: LoginRequest):
             detail="Invalid ID or password",
         )
 
-    token = create_access_token(subject=payload.user_id)
-    return TokenResponse(access_token=token)
+    role = user_role(payload.user_id)
+    token = create_access_token(subject=payload.user_id, role=role)
+    return TokenResponse(access_token=token, role=role)
@@ -1,9 +1,12 @@
 # app/routers/transactions_router.py
+from datetime import datetime
 from typing import List, Optional
-import json
 
-from fastapi import APIRouter, HTTPException, Query, status
+import pandas as pd
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
 
+from app.dependencies import get_current_manager, get_optional_manager
 from app.schemas import (
     StatusUpdateRequest,
     TransactionRecord,
@@ -11,16 +14,11 @@ from app.schemas import (
     AgentTransactionUpdate,
 )
 
-from app.services.google_sheets import (
-    get_pending_transactions,
-    update_status_by_record_id,
-    get_record_by_id,
-    create_transaction,
-    update_transaction_fields,
-    get_recent_transactions,
-    get_night_charged_total,
-    get_all_transactions,
-)
+from app.services import sheets_async
+from app.services.analytics import get_transaction_analytics
+from app.services.serialization import delta_response, ndjson_lines, records_response
+from app.services.sheets_async import SheetsTimeoutError
+from app.services.storage import storage
 
 
 
@@ -28,122 +26,317 @@ from app.ws_manager import manager
 
 router = APIRouter(prefix="/transactions", tags=["transactions"])
 
+# Manager-portal endpoints; the agent portal does not log in
+MANAGER_ONLY = [Depends(get_current_manager)]
+
+# Left out of rows served to callers without a manager token (the agent
+# portal never shows them, and Record_IDs are easy to guess)
+CARD_FIELDS = ("Card Holder Name", "Card Number", "Expiry Date", "CVC")
+
+CONFIRM_DESCRIPTION = (
+    "Wait (a few seconds at most) for the write to reach the system of "
+    "record; X-Write-State is then 'stored' or 'pending', and a write that "
+    "was dropped returns 502"
+)
+
+SINCE_DESCRIPTION = (
+    "X-Sheet-Version from an earlier response: return only rows added or "
+    "changed after it, as {version, full, upserts, removed}"
+)
+
+
+async def _confirm(sheet: str, record_id, response: Response):
+    stored = await sheets_async.confirm_write(sheet, record_id)
+    if stored is False:
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail="The change could not be saved to Google Sheets",
+        )
+    response.headers["X-Write-State"] = "stored" if stored else "pending"
+
+
+def _not_modified(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = {tag.strip() for tag in header.split(",")}
+    return "*" in candidates or etag in candidates
+
+
+def _not_modified_response(etag: str) -> Response:
+    return Response(
+        status_code=status.HTTP_304_NOT_MODIFIED,
+        headers={"ETag": etag, "Cache-Control": "no-cache"},
+    )
+
+
+def _list_response(sheet: str, df, since: Optional[str], token: str, etag: str):
+    # no-cache: browsers keep the body but revalidate with If-None-Match
+    headers = {"ETag": etag, "X-Sheet-Version": token, "Cache-Control": "no-cache"}
+    if since is None:
+        return records_response(df, headers)
 
-@router.get("/pending", response_model=List[TransactionRecord])
-def list_pending(sheet: str = Query(..., pattern="^(spectrum|insurance)$")):
+    changed = storage.get_changes_since(sheet, since)
+    if changed is None or "Record_ID" not in df.columns:
+        # Unknown or too old a version: the client replaces its whole list
+        return delta_response(df, [], token, True, headers)
+    ids = df["Record_ID"].astype(str).str.strip()
+    removed = sorted(changed - set(ids))
+    return delta_response(df[ids.isin(changed).to_numpy()], removed, token, False, headers)
+
+
+@router.get("/pending", response_model=List[TransactionRecord], dependencies=MANAGER_ONLY)
+def list_pending(
+    request: Request,
+    sheet: str = Query(..., pattern="^(spectrum|insurance)$"),
+    since: Optional[str] = Query(None, description=SINCE_DESCRIPTION),
+):
+    """
+    Pending transactions for a sheet. Supports If-None-Match (304 while the
+    sheet version is unchanged) and `since=` deltas.
+    """
     try:
-        df = get_pending_transactions(sheet)
+        token = storage.get_sheet_token(sheet)
+        etag = f'W/"{token}"'
+        if _not_modified(request, etag):
+            return _not_modified_response(etag)
+        df = storage.get_pending_transactions(sheet)
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
-    if df.empty:
-        return []
-
-    records = [TransactionRecord(data=row.to_dict()) for _, row in df.iterrows()]
-    return records
+    return _list_response(sheet, df, since, token, etag)
 
 @router.get("/recent", response_model=List[TransactionRecord])
 def list_recent(
+    request: Request,
     sheet: str = Query(..., pattern="^(spectrum|insurance)$"),
     minutes: int = Query(20, ge=1, le=1440),
     agent_name: Optional[str] = Query(None),
+    since: Optional[str] = Query(None, description=SINCE_DESCRIPTION),
+    user: Optional[str] = Depends(get_optional_manager),
 ):
     """
     Return recent transactions (last `minutes` minutes) for the given sheet.
-    Optionally filter by agent_name.
+    Optionally filter by agent_name. Without a manager token, card fields
+    are left out.
+
+    Supports If-None-Match and `since=` like /pending. Rows that age out of
+    the window are not reported in `removed`; clients prune those by time.
     """
     try:
-        df = get_recent_transactions(sheet, minutes, agent_name)
+        token = storage.get_sheet_token(sheet)
+        df = storage.get_recent_transactions(sheet, minutes, agent_name)
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
-    if df.empty:
-        return []
+    if user is None:
+        df = df.drop(columns=[c for c in CARD_FIELDS if c in df.columns])
+    # At a fixed version the window only loses rows as time passes, so the
+    # row count tells the client's copy apart from the current one
+    etag = f'W/"{token}.{len(df)}{"" if user else ".public"}"'
+    if _not_modified(request, etag):
+        return _not_modified_response(etag)
+    return _list_response(sheet, df, since, token, etag)
 
-    records = [TransactionRecord(data=row.to_dict()) for _, row in df.iterrows()]
-    return records
+STREAM_CHUNK_ROWS = 500
+
+
+def _project(df, fields: Optional[str]):
+    """
+    Keep only the requested comma-separated columns (unknown ones are
+    ignored, e.g. Provider on the insurance sheet).
+    """
+    if not fields:
+        return df
+    wanted = [f.strip() for f in fields.split(",") if f.strip()]
+    return df[[c for c in wanted if c in df.columns]]
+
+
+def _page(df, cursor: Optional[int], limit: Optional[int]):
+    """
+    One page of `df` in Record_ID order, starting after the Record_ID
+    `cursor`; returns (page, next cursor or None on the last page).
 
-@router.get("/all", response_model=List[TransactionRecord])
+    Keyed on the ID rather than a row offset, so rows archived or added
+    between two requests do not shift the pages. Rows sharing an ID are
+    kept on one page.
+    """
+    if "Record_ID" not in df.columns:
+        return df, None
+    digits = df["Record_ID"].astype(str).str.extract(r"(\d+)", expand=False)
+    keys = pd.to_numeric(digits, errors="coerce").fillna(0).astype("int64").to_numpy()
+    order = keys.argsort(kind="stable")
+    keys = keys[order]
+    start = 0 if cursor is None else int(keys.searchsorted(cursor, side="right"))
+    end = len(keys) if limit is None else min(start + limit, len(keys))
+    if start < end < len(keys):
+        end = int(keys.searchsorted(keys[end - 1], side="right"))
+    next_cursor = str(keys[end - 1]) if start < end < len(keys) else None
+    return df.iloc[order[start:end]], next_cursor
+
+
+@router.get("/all", response_model=List[TransactionRecord], dependencies=MANAGER_ONLY)
 def list_all(
     sheet: str = Query(..., pattern="^(spectrum|insurance)$"),
+    cursor: Optional[int] = Query(None, ge=0, description="Record_ID returned as X-Next-Cursor"),
+    limit: Optional[int] = Query(None, ge=1, le=5000, description="Page size"),
+    fields: Optional[str] = Query(None, description="Comma-separated columns to return"),
+    output: str = Query("json", alias="format", pattern="^(json|ndjson)$"),
 ):
     """
     Return all transactions for the selected sheet.
     Used by manager analytics (full table, charts, duplicates).
+
+    With `limit`, returns one page in Record_ID order, after the Record_ID
+    `cursor`; the next cursor is sent in the X-Next-Cursor header (absent
+    on the last page).
+    format=ndjson streams one JSON object per line instead of an array.
     """
     try:
-        df = get_all_transactions(sheet)
+        df = storage.get_all_transactions(sheet)
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
-    if df.empty:
-        return []
+    total = len(df)
+    headers = {"X-Total-Count": str(total)}
+    if cursor is not None or limit:
+        df, next_cursor = _page(df, cursor, limit)
+        if next_cursor is not None:
+            headers["X-Next-Cursor"] = next_cursor
+    df = _project(df, fields)
+
+    if output == "ndjson":
+        return StreamingResponse(
+            ndjson_lines(df, STREAM_CHUNK_ROWS),
+            media_type="application/x-ndjson",
+            headers=headers,
+        )
 
-    return [TransactionRecord(data=row.to_dict()) for _, row in df.iterrows()]
+    return records_response(df, headers=headers)
+
+@router.get("/analytics", dependencies=MANAGER_ONLY)
+def analytics(
+    sheet: Optional[str] = Query(
+        None,
+        pattern="^(spectrum|insurance)$",
+        description="spectrum, insurance, or omit for both",
+    ),
+    start: Optional[datetime] = Query(None, description="Timestamp >= start"),
+    end: Optional[datetime] = Query(None, description="Timestamp <= end"),
+    status_filter: Optional[List[str]] = Query(None, alias="status"),
+    agent_name: Optional[str] = Query(None),
+):
+    """
+    Grouped totals (per agent, status, LLC, provider, day and hour) for the
+    manager analytics view, computed server-side so no rows are shipped.
+    """
+    return get_transaction_analytics(sheet, start, end, status_filter, agent_name)
 
 @router.post("/agent/submit", response_model=TransactionRecord)
-async def agent_submit(payload: AgentTransactionCreate):
+async def agent_submit(
+    payload: AgentTransactionCreate,
+    response: Response,
+    confirm: bool = Query(False, description=CONFIRM_DESCRIPTION),
+):
+    async def announce(record: dict):
+        event = {
+            "type": "new_pending",
+            "sheet": payload.sheet,
+            "agent_name": record.get("Agent Name"),
+            "record": record,
+        }
+        await manager.broadcast(event)
+
     try:
-        record = create_transaction(payload.sheet, payload.dict(by_alias=True))
+        # After a 504 the record may still be created; it is announced then
+        record = await sheets_async.create_transaction(
+            payload.sheet, payload.dict(by_alias=True), on_late=announce
+        )
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=str(e),
         )
+    except SheetsTimeoutError as e:
+        raise HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail=str(e))
 
-    event = {
-        "type": "new_pending",
-        "sheet": payload.sheet,
-        "record": record,
-    }
-    await manager.broadcast(json.dumps(event))
+    if confirm:
+        await _confirm(payload.sheet, record.get("Record_ID"), response)
+    await announce(record)
 
     return TransactionRecord(data=record)
 
 
 @router.get("/{sheet}/{record_id}", response_model=TransactionRecord)
-def get_transaction(sheet: str, record_id: str):
+def get_transaction(
+    sheet: str, record_id: str, user: Optional[str] = Depends(get_optional_manager)
+):
+    """
+    One transaction; card fields only for callers with a manager token.
+    """
     if sheet not in ("spectrum", "insurance"):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid sheet"
         )
 
-    record = get_record_by_id(sheet, record_id)
+    record = storage.get_record_by_id(sheet, record_id)
     if not record:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Record not found"
         )
 
+    if user is None:
+        record = {k: v for k, v in record.items() if k not in CARD_FIELDS}
     return TransactionRecord(data=record)
 
 
-@router.patch("/{sheet}/{record_id}/status")
-async def update_status(sheet: str, record_id: str, payload: StatusUpdateRequest):
+@router.patch("/{sheet}/{record_id}/status", dependencies=MANAGER_ONLY)
+async def update_status(
+    sheet: str,
+    record_id: str,
+    payload: StatusUpdateRequest,
+    response: Response,
+    confirm: bool = Query(False, description=CONFIRM_DESCRIPTION),
+):
     if sheet not in ("spectrum", "insurance"):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid sheet"
         )
 
+    async def announce(record: dict):
+        event = {
+            "type": "status_update",
+            "sheet": sheet,
+            "agent_name": record.get("Agent Name"),
+            "record_id": record_id,
+            "new_status": payload.new_status,
+        }
+        await manager.broadcast(event)
+
     try:
-        update_status_by_record_id(sheet, record_id, payload.new_status)
+        record = await sheets_async.update_status_by_record_id(
+            sheet, record_id, payload.new_status, on_late=announce
+        )
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except SheetsTimeoutError as e:
+        raise HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail=str(e))
 
-    event = {
-        "type": "status_update",
-        "sheet": sheet,
-        "record_id": record_id,
-        "new_status": payload.new_status,
-    }
-
-    await manager.broadcast(json.dumps(event))
+    if confirm:
+        await _confirm(sheet, record_id, response)
+    await announce(record)
 
     return {"detail": "Status updated"}
 
 
 @router.patch("/agent/{sheet}/{record_id}", response_model=TransactionRecord)
 async def agent_update_transaction(
-    sheet: str, record_id: str, payload: AgentTransactionUpdate
+    sheet: str,
+    record_id: str,
+    payload: AgentTransactionUpdate,
+    response: Response,
+    confirm: bool = Query(False, description=CONFIRM_DESCRIPTION),
+    user: Optional[str] = Depends(get_optional_manager),
 ):
     """
     Allow agents to update basic lead fields (name, phone, address, email, charge, llc, provider).
@@ -162,33 +355,39 @@ async def agent_update_transaction(
         )
 
     try:
-        updated_record = update_transaction_fields(sheet, record_id, updates)
+        updated_record = await sheets_async.update_transaction_fields(
+            sheet, record_id, updates
+        )
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except SheetsTimeoutError as e:
+        raise HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail=str(e))
 
+    if confirm:
+        await _confirm(sheet, record_id, response)
+    if user is None:
+        updated_record = {k: v for k, v in updated_record.items() if k not in CARD_FIELDS}
     return TransactionRecord(data=updated_record)
 
-@router.get("/recent", response_model=List[TransactionRecord])
-def list_recent(
-    sheet: str = Query(..., pattern="^(spectrum|insurance)$"),
-    minutes: int = Query(20, ge=1, le=1440),
-    agent_name: str | None = Query(None),
-):
-    try:
-        df = get_recent_transactions(sheet, minutes, agent_name)
-    except ValueError as e:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
-
-    if df.empty:
-        return []
-
-    return [TransactionRecord(data=row.to_dict()) for _, row in df.iterrows()]
-
 
 @router.get("/night_total")
-def night_total(sheet: Optional[str] = Query(
-    None,
-    description="spectrum, insurance, or omit for both"
-)):
-    total = get_night_charged_total(sheet=sheet)
-    return {"total": total}
\ No newline at end of file
+def night_total(
+    sheet: Optional[str] = Query(
+        None,
+        description="spectrum, insurance, or omit for both"
+    ),
+    verify: bool = Query(
+        False,
+        description="Also rescan all rows and compare with the running total",
+    ),
+):
+    total = storage.get_night_charged_total(sheet=sheet)
+    if not verify:
+        return {"total": total}
+
+    recomputed = storage.recompute_night_charged_total(sheet=sheet)
+    return {
+        "total": total,
+        "recomputed": recomputed,
+        "consistent": abs(total - recomputed) < 0.005,
+    }
\ No newline at end of file
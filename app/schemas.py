@@ -44,6 +44,8 @@ class LoginRequest(BaseModel):
 class TokenResponse(BaseModel):
     access_token: str
     token_type: str = "bearer"
+    # "manager" or "agent" (see MANAGER_IDS)
+    role: str
 
 
 class StatusUpdateRequest(BaseModel):
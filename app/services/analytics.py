@@ -0,0 +1,154 @@
+# app/services/analytics.py
+from datetime import datetime
+from typing import List, Optional
+
+import pandas as pd
+import pytz
+
+from app.config import TIMEZONE
+from app.services.frames import CHARGE_COLUMN
+from app.services.storage import storage
+
+GROUP_COLUMNS = {
+    "by_agent": "Agent Name",
+    "by_status": "Status",
+    "by_llc": "LLC",
+    "by_provider": "Provider",
+}
+
+tz = pytz.timezone(TIMEZONE)
+
+
+def _local(value: Optional[datetime]) -> Optional[datetime]:
+    """
+    Sheet Timestamps are naive local time: convert an aware bound to it.
+    """
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(tz).replace(tzinfo=None)
+
+
+def _grouped(df: pd.DataFrame, column: str) -> List[dict]:
+    """
+    Count and charge total per value of `column`, largest charge first.
+    """
+    grouped = (
+        df.groupby(column, sort=False)["_charge"]
+        .agg(["size", "sum"])
+        .rename(columns={"size": "count", "sum": "charge"})
+        .sort_values("charge", ascending=False)
+        .rename_axis("key")
+        .reset_index()
+    )
+    grouped["charge"] = grouped["charge"].round(2)
+    return grouped.to_dict(orient="records")
+
+
+def _time_buckets(df: pd.DataFrame, freq: str, fmt: str, by_status: bool = False) -> List[dict]:
+    """
+    Count and charge total per time bucket (optionally split by Status),
+    in chronological order.
+    """
+    keys = ["key", "status"] if by_status else ["key"]
+    buckets = (
+        df.assign(key=df["_ts"].dt.floor(freq).dt.strftime(fmt), status=df["Status"])
+        .groupby(keys, sort=True)["_charge"]
+        .agg(["size", "sum"])
+        .rename(columns={"size": "count", "sum": "charge"})
+        .reset_index()
+    )
+    buckets["charge"] = buckets["charge"].round(2)
+    return buckets.to_dict(orient="records")
+
+
+def summarize(
+    df: pd.DataFrame,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    statuses: Optional[List[str]] = None,
+    agent_name: Optional[str] = None,
+) -> dict:
+    """
+    Grouped totals over a typed transactions DataFrame (one or both
+    sheets). Only aggregates are returned, never the rows themselves.
+    Aware `start`/`end` are compared in the sheets' local time.
+    """
+    empty = {
+        "totals": {"count": 0, "charge": 0.0, "avg_per_hour": 0.0, "peak_hour": None},
+        "by_day": [],
+        "by_hour": [],
+        "by_hour_status": [],
+        "duplicates": [],
+        **{name: [] for name in GROUP_COLUMNS},
+    }
+    if df.empty or "Timestamp" not in df.columns:
+        return empty
+
+    # Duplicate Record_IDs are counted before any filter, like the old UI
+    if "Record_ID" in df.columns:
+        ids = df["Record_ID"].astype(str).str.strip()
+        counts = ids[ids != ""].value_counts()
+        empty["duplicates"] = [
+            {"record_id": record_id, "count": int(count)}
+            for record_id, count in counts[counts > 1].items()
+        ]
+
+    start, end = _local(start), _local(end)
+    ts = df["Timestamp"]
+    mask = ts.notna()
+    if start is not None:
+        mask &= ts >= start
+    if end is not None:
+        mask &= ts <= end
+    if statuses:
+        mask &= df["Status"].isin(statuses)
+    if agent_name and "Agent Name" not in df.columns:
+        return empty
+    if agent_name:
+        mask &= df["Agent Name"].astype(str).str.strip() == agent_name.strip()
+
+    if not mask.any():
+        return empty
+
+    work = pd.DataFrame({"_ts": ts[mask], "_charge": df.loc[mask, CHARGE_COLUMN]})
+    for column in GROUP_COLUMNS.values():
+        # Missing on one sheet (Provider on insurance) or blank: "Unknown"
+        values = df.loc[mask, column] if column in df.columns else ""
+        values = pd.Series(values, index=work.index).fillna("").astype(str).str.strip()
+        work[column] = values.replace("", "Unknown")
+
+    result = dict(empty)
+    for name, column in GROUP_COLUMNS.items():
+        result[name] = _grouped(work, column)
+
+    result["by_day"] = _time_buckets(work, "D", "%Y-%m-%d")
+    result["by_hour"] = _time_buckets(work, "h", "%Y-%m-%dT%H:00:00")
+    result["by_hour_status"] = _time_buckets(work, "h", "%Y-%m-%dT%H:00:00", by_status=True)
+
+    hourly = pd.DataFrame(result["by_hour"])
+    peak = hourly.loc[hourly["charge"].idxmax()]
+    result["totals"] = {
+        "count": int(len(work)),
+        "charge": round(float(work["_charge"].sum()), 2),
+        "avg_per_hour": round(float(hourly["charge"].mean()), 2),
+        "peak_hour": peak["key"],
+    }
+    return result
+
+
+def get_transaction_analytics(
+    sheet: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    statuses: Optional[List[str]] = None,
+    agent_name: Optional[str] = None,
+) -> dict:
+    """
+    Analytics for one sheet ('spectrum' / 'insurance') or both (None),
+    computed from the cached snapshots and the archive.
+    """
+    sheets = [sheet] if sheet else ["spectrum", "insurance"]
+    frames = [storage.get_all_transactions(s) for s in sheets]
+    frames = [f for f in frames if not f.empty]
+    df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    return summarize(df, start, end, statuses, agent_name)
@@ -0,0 +1,386 @@
+# app/services/archive.py
+import importlib.util
+import os
+from abc import ABC, abstractmethod
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import pandas as pd
+
+from app.config import (
+    BROADCAST_BACKEND,
+    ARCHIVE_BACKEND,
+    ARCHIVE_AFTER_DAYS,
+    ARCHIVE_INTERVAL_SECONDS,
+    ARCHIVE_DIR,
+    RECORD_ID_DB,
+)
+from app.services.sheets_quota import QuotaScheduler, QuotaWorksheet
+
+try:
+    import fcntl
+except ImportError:  # not on Windows: every worker may run the job
+    fcntl = None
+
+# Final statuses; rows in them are never edited again
+SETTLED_STATUSES = ("Charged", "Declined", "Charge Back")
+
+# /recent looks back at most a day and the night window is shorter, so
+# archived rows are never needed by the hot-path queries
+MIN_ARCHIVE_AGE = timedelta(days=1)
+
+
+class RowsLock:
+    """
+    Readers-writer lock over the row layout of the transaction sheets,
+    shared by every worker on the host (flock on `path`, one open file per
+    holder, so it also works between threads).
+
+    Writers that look a Record_ID up and then write to its row hold it
+    `shared()` from the lookup until the write returns; the archiver holds
+    it `exclusive()` while it deletes rows. Without fcntl (Windows) it falls
+    back to an in-process lock.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fallback = threading.RLock()
+
+    @contextmanager
+    def _hold(self, mode: int):
+        if fcntl is None:
+            with self._fallback:
+                yield
+            return
+        with open(self.path, "a") as handle:
+            fcntl.flock(handle, mode)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def shared(self):
+        return self._hold(fcntl.LOCK_SH if fcntl is not None else 0)
+
+    def exclusive(self):
+        return self._hold(fcntl.LOCK_EX if fcntl is not None else 0)
+
+
+class ArchiveStore(ABC):
+    """
+    Settled rows moved out of Sheet1/Sheet2, one partition per month
+    ("YYYY-MM" of the row's Timestamp). Rows are stored as the sheet had
+    them (header -> cell value) and read back as records, so the hot and
+    archived data go through the same DataFrame builder.
+
+    A row archived again (a pass that could not delete it from the hot
+    sheet, or an archived copy that was later edited there) is stored once
+    more; the last copy of each Record_ID is the one read back.
+
+    Loaded partitions are cached per sheet until this process appends to
+    them or `invalidate()` is called.
+    """
+
+    name = "base"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # sheet -> (signature, records, {Record_ID: record}, built frame or None)
+        self._cache: Dict[str, tuple] = {}
+        self._stats = {"loads": 0, "rows_archived": 0}
+
+    # Engine-specific
+    @abstractmethod
+    def _load(self, sheet: str) -> List[dict]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def _append(self, sheet: str, month: str, headers: List[str], records: List[dict]):
+        raise NotImplementedError
+
+    def _signature(self, sheet: str) -> Any:
+        """
+        Cheap token that changes when another process writes the archive
+        (None: rely on invalidate()).
+        """
+        return None
+
+    # Shared
+    def append(self, sheet: str, month: str, headers: List[str], records: List[dict]):
+        self._append(sheet, month, headers, records)
+        with self._lock:
+            self._stats["rows_archived"] += len(records)
+        self.invalidate(sheet)
+
+    def _entry(self, sheet: str) -> tuple:
+        signature = self._signature(sheet)
+        with self._lock:
+            entry = self._cache.get(sheet)
+            if entry is not None and entry[0] == signature:
+                return entry
+        index = {}
+        for record in self._load(sheet):
+            key = str(record.get("Record_ID", "")).strip()
+            # Latest copy wins, in its latest position
+            index.pop(key, None)
+            index[key] = record
+        records = list(index.values())
+        entry = (signature, records, index, None)
+        with self._lock:
+            self._stats["loads"] += 1
+            self._cache[sheet] = entry
+        return entry
+
+    def frame(self, sheet: str, build_frame: Callable[[List[dict]], pd.DataFrame]) -> pd.DataFrame:
+        """
+        Archived rows of a sheet as a DataFrame built by `build_frame`
+        (built once per load; callers must not mutate it).
+        """
+        signature, records, index, df = self._entry(sheet)
+        if df is None:
+            df = build_frame(records) if records else pd.DataFrame()
+            with self._lock:
+                if self._cache.get(sheet, (None,))[0] == signature:
+                    self._cache[sheet] = (signature, records, index, df)
+        return df
+
+    def records(self, sheet: str) -> List[dict]:
+        """
+        Archived rows of a sheet (last copy of each Record_ID), oldest first.
+        """
+        return [dict(record) for record in self._entry(sheet)[1]]
+
+    def find(self, sheet: str, record_id: str) -> Optional[dict]:
+        record = self._entry(sheet)[2].get(str(record_id).strip())
+        return dict(record) if record is not None else None
+
+    def invalidate(self, sheet: Optional[str] = None):
+        with self._lock:
+            if sheet is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(sheet, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self._stats,
+                "backend": self.name,
+                "cached_rows": {sheet: len(entry[1]) for sheet, entry in self._cache.items()},
+            }
+
+
+class SheetsArchive(ArchiveStore):
+    """
+    One worksheet per sheet and month ("Sheet1 Archive 2025-01") in the
+    main spreadsheet, so archives survive redeploys like the sheet itself.
+    """
+
+    name = "sheets"
+
+    def __init__(self, get_spreadsheet: Callable[[], Any], quota: QuotaScheduler, tabs: Dict[str, str]):
+        super().__init__()
+        self._get_spreadsheet = get_spreadsheet
+        self._quota = quota
+        self.tabs = tabs
+
+    def _prefix(self, sheet: str) -> str:
+        return f"{self.tabs[sheet]} Archive "
+
+    def _worksheets(self, sheet: str) -> Dict[str, QuotaWorksheet]:
+        prefix = self._prefix(sheet)
+        worksheets = self._quota.call("read", self._get_spreadsheet().worksheets)
+        return {
+            ws.title[len(prefix):]: QuotaWorksheet(ws, self._quota)
+            for ws in worksheets
+            if ws.title.startswith(prefix)
+        }
+
+    def _load(self, sheet):
+        records: List[dict] = []
+        for _, ws in sorted(self._worksheets(sheet).items()):
+            records.extend(ws.get_all_records())
+        return records
+
+    def _append(self, sheet, month, headers, records):
+        ws = self._worksheets(sheet).get(month)
+        if ws is None:
+            created = self._quota.call(
+                "write",
+                self._get_spreadsheet().add_worksheet,
+                title=self._prefix(sheet) + month,
+                rows=len(records) + 1,
+                cols=len(headers),
+                idempotent=False,
+            )
+            ws = QuotaWorksheet(created, self._quota)
+            values = [list(headers)]
+        else:
+            headers = ws.row_values(1)
+            values = []
+        values.extend([record.get(h, "") for h in headers] for record in records)
+        # RAW, like the write-behind appends
+        ws.append_rows(values)
+
+
+class ParquetArchive(ArchiveStore):
+    """
+    One Parquet file per sheet and month (<directory>/<sheet>/YYYY-MM.parquet)
+    on local disk. Needs pyarrow (or fastparquet). Cells are stored as text.
+    """
+
+    name = "parquet"
+
+    def __init__(self, directory: str):
+        super().__init__()
+        if not any(importlib.util.find_spec(m) for m in ("pyarrow", "fastparquet")):
+            raise RuntimeError("ARCHIVE_BACKEND=parquet needs pyarrow or fastparquet")
+        self.directory = Path(directory)
+
+    def _files(self, sheet: str) -> List[Path]:
+        return sorted((self.directory / sheet).glob("*.parquet"))
+
+    def _signature(self, sheet):
+        return tuple((f.name, f.stat().st_mtime_ns) for f in self._files(sheet))
+
+    def _load(self, sheet):
+        files = self._files(sheet)
+        if not files:
+            return []
+        df = pd.concat([pd.read_parquet(f) for f in files], ignore_index=True)
+        return df.to_dict(orient="records")
+
+    def _append(self, sheet, month, headers, records):
+        path = self.directory / sheet / f"{month}.parquet"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        df = pd.DataFrame(records, columns=headers).astype(str)
+        if path.exists():
+            df = pd.concat([pd.read_parquet(path), df], ignore_index=True)
+        # Write-then-rename, so readers never see a half-written file
+        tmp = path.with_suffix(".tmp")
+        df.to_parquet(tmp, index=False)
+        os.replace(tmp, path)
+
+
+def create_archive_store(get_spreadsheet, quota, tabs) -> Optional[ArchiveStore]:
+    """
+    Archive for ARCHIVE_BACKEND ("sheets" or "parquet"), or None when
+    archiving is off.
+    """
+    if ARCHIVE_BACKEND == "sheets":
+        return SheetsArchive(get_spreadsheet, quota, tabs)
+    if ARCHIVE_BACKEND == "parquet":
+        return ParquetArchive(ARCHIVE_DIR)
+    return None
+
+
+class Archiver:
+    """
+    Background job that moves settled rows older than `min_age` out of the
+    hot sheets every `interval` seconds (see google_sheets.archive_settled_rows).
+
+    Only one worker per host runs a pass at a time (a non-blocking file
+    lock next to the Record_ID counter); the others skip it. Deleting rows
+    is coordinated with the other workers' writes through RowsLock, which
+    only spans one host.
+    """
+
+    def __init__(
+        self,
+        sheets: List[str],
+        archive_rows: Callable[[str, datetime], int],
+        now: Callable[[], datetime],
+        min_age: timedelta,
+        interval: float,
+        lock_path: str,
+    ):
+        self.sheets = sheets
+        self._archive_rows = archive_rows
+        self._now = now
+        self.min_age = max(min_age, MIN_ARCHIVE_AGE)
+        self.interval = interval
+        self.lock_path = lock_path
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats = {
+            "runs": 0,
+            "skipped": 0,
+            "rows_moved": 0,
+            "failures": 0,
+            "last_error": None,
+            "last_run_at": None,
+        }
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sheet-archiver", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                self._stats["failures"] += 1
+                self._stats["last_error"] = str(e)
+
+    def run_once(self) -> int:
+        """
+        One archival pass over every sheet. Returns the rows moved.
+        """
+        with open(self.lock_path, "a") as lock:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    self._stats["skipped"] += 1
+                    return 0
+            cutoff = self._now() - self.min_age
+            moved = sum(self._archive_rows(sheet, cutoff) for sheet in self.sheets)
+        self._stats["runs"] += 1
+        self._stats["rows_moved"] += moved
+        self._stats["last_run_at"] = time.time()
+        return moved
+
+    def stats(self) -> dict:
+        return {
+            **self._stats,
+            "running": self._thread is not None and self._thread.is_alive(),
+            "min_age_days": self.min_age / timedelta(days=1),
+            "interval_seconds": self.interval,
+        }
+
+
+def create_archiver(storage) -> Optional[Archiver]:
+    """
+    Archival job for the sheets backend (None for other backends or when
+    ARCHIVE_BACKEND is unset).
+    """
+    if storage.name != "sheets" or not ARCHIVE_BACKEND:
+        return None
+    if BROADCAST_BACKEND == "redis":
+        # Workers on other hosts would not see RowsLock
+        raise RuntimeError("ARCHIVE_BACKEND needs every worker on one host (not BROADCAST_BACKEND=redis)")
+    from app.services import google_sheets
+
+    return Archiver(
+        ["spectrum", "insurance"],
+        google_sheets.archive_settled_rows,
+        lambda: datetime.now(google_sheets.tz).replace(tzinfo=None),
+        timedelta(days=ARCHIVE_AFTER_DAYS),
+        ARCHIVE_INTERVAL_SECONDS,
+        f"{RECORD_ID_DB}.archive.lock",
+    )
@@ -1,47 +1,287 @@
 # app/services/auth.py
 import hashlib
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Dict, Optional, Tuple
 
-from jose import jwt
+from jose import ExpiredSignatureError, JWTError, jwt
 
-from app.config import JWT_SECRET_KEY, JWT_ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES
-from app.services.google_sheets import get_users_ws, load_users_df
+from app.config import (
+    JWT_SECRET_KEY,
+    JWT_ALGORITHM,
+    ACCESS_TOKEN_EXPIRE_MINUTES,
+    MANAGER_IDS,
+    USERS_CACHE_TTL_SECONDS,
+    USERS_MISS_REFRESH_SECONDS,
+    TOKEN_CACHE_SIZE,
+)
+from app.services.storage import storage
+from app.services.passwords import PasswordHasher
+
+_hasher = PasswordHasher()
+
+# Token roles ("role" claim); tokens without one are agent tokens
+ROLE_MANAGER = "manager"
+ROLE_AGENT = "agent"
 
 
 def hash_password(password: str) -> str:
-    return hashlib.sha256(password.encode()).hexdigest()
+    return _hasher.hash(password)
+
+
+class UserDirectory:
+    """
+    In-memory user ID -> password hash map of the users table (Sheet3 on
+    the Sheets backend).
+
+    The sheet is re-read at most every `ttl_seconds`; signups and rehashes
+    update the map in place, so a new user can log in straight away. Uniqueness is
+    checked and the row appended under one lock, so two signups for the
+    same ID cannot both succeed in this process.
+
+    An ID missing from the map (a user who signed up on another worker)
+    forces one re-read before it is rejected, at most once every
+    `miss_refresh_seconds`, so unknown IDs cannot be used to hammer the
+    users sheet.
+    """
+
+    def __init__(self, ttl_seconds: float, miss_refresh_seconds: float = 10.0):
+        self.ttl_seconds = ttl_seconds
+        self.miss_refresh_seconds = miss_refresh_seconds
+        self._users: Dict[str, str] = {}
+        self._loaded_at: Optional[float] = None
+        self._miss_refreshed_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._stats = {
+            "lookups": 0,
+            "reloads": 0,
+            "miss_reloads": 0,
+            "signups": 0,
+            "rehashes": 0,
+            "rehash_failures": 0,
+        }
+
+    def _refresh(self):
+        # Caller holds the lock
+        if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl_seconds:
+            return
+        users = {}
+        for record in storage.load_users():
+            # First row wins if an ID was ever entered twice
+            users.setdefault(str(record.get("ID", "")), str(record.get("Password", "")))
+        self._users = users
+        self._loaded_at = time.monotonic()
+        self._stats["reloads"] += 1
+
+    def _refresh_on_miss(self, user_id: str):
+        # Caller holds the lock
+        if user_id in self._users:
+            return
+        now = time.monotonic()
+        last = self._miss_refreshed_at
+        if last is not None and now - last < self.miss_refresh_seconds:
+            return
+        self._miss_refreshed_at = now
+        self._loaded_at = None
+        self._refresh()
+        self._stats["miss_reloads"] += 1
+
+    def get_hash(self, user_id: str) -> Optional[str]:
+        """
+        Stored hash for `user_id`, or None. Callers still verify against a
+        dummy hash on None (see PasswordHasher.verify), so a rejected ID
+        costs the same KDF work as a wrong password.
+        """
+        with self._lock:
+            self._refresh()
+            self._refresh_on_miss(user_id)
+            self._stats["lookups"] += 1
+            return self._users.get(user_id)
+
+    def add(self, user_id: str, hashed_pw: str):
+        """
+        Append a user to Sheet3 and the map. Raises ValueError if the ID
+        is taken.
+        """
+        with self._lock:
+            self._refresh()
+            self._refresh_on_miss(user_id)
+            if user_id in self._users:
+                raise ValueError("User ID already exists")
+            storage.add_user(user_id, hashed_pw)
+            self._users[user_id] = hashed_pw
+            self._stats["signups"] += 1
+
+    def update_hash(self, user_id: str, hashed_pw: str):
+        """
+        Replace a user's stored hash (rehash on login). Best effort: if the
+        write fails the old hash stays valid and is upgraded next time.
+
+        The write runs outside the lock, so a slow Sheets call does not hold
+        up other logins; both hashes match the password in the meantime.
+        """
+        try:
+            storage.update_user_hash(user_id, hashed_pw)
+        except Exception:
+            with self._lock:
+                self._stats["rehash_failures"] += 1
+            return
+        with self._lock:
+            self._users[user_id] = hashed_pw
+            self._stats["rehashes"] += 1
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self._stats,
+                "users": len(self._users),
+                "age_seconds": (
+                    round(time.monotonic() - self._loaded_at, 3)
+                    if self._loaded_at is not None
+                    else None
+                ),
+                "ttl_seconds": self.ttl_seconds,
+            }
+
+
+_users = UserDirectory(USERS_CACHE_TTL_SECONDS, USERS_MISS_REFRESH_SECONDS)
+
+
+def get_user_directory_stats() -> dict:
+    return {**_users.stats(), "hashing": _hasher.stats()}
+
+
+def shutdown_hasher():
+    _hasher.shutdown()
 
 
 def user_exists(user_id: str) -> bool:
-    df = load_users_df()
-    if df.empty:
-        return False
-    return user_id in df["ID"].astype(str).values
+    return _users.get_hash(user_id) is not None
 
 
 def add_user(user_id: str, password: str):
-    ws = get_users_ws()
+    # Hashed before taking the directory lock
     hashed_pw = hash_password(password)
-    ws.append_row([user_id, hashed_pw])
+    _users.add(user_id, hashed_pw)
 
 
 def validate_login(user_id: str, password: str) -> bool:
-    df = load_users_df()
-    if df.empty:
+    stored = _users.get_hash(user_id)
+    if not _hasher.verify(password, stored):
         return False
+    if _hasher.needs_update(stored):
+        # Legacy SHA-256 (or older scrypt cost): upgrade now that we have
+        # the plain password
+        _users.update_hash(user_id, hash_password(password))
+    return True
 
-    hashed_pw = hash_password(password)
-    df["ID"] = df["ID"].astype(str)
-    match = df[(df["ID"] == user_id) & (df["Password"] == hashed_pw)]
-    return not match.empty
 
+def user_role(user_id: str) -> str:
+    return ROLE_MANAGER if user_id in MANAGER_IDS else ROLE_AGENT
 
-def create_access_token(subject: str, expires_delta: Optional[timedelta] = None) -> str:
+
+def create_access_token(
+    subject: str, expires_delta: Optional[timedelta] = None, role: Optional[str] = None
+) -> str:
     if expires_delta is None:
         expires_delta = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
 
     expire = datetime.utcnow() + expires_delta
-    to_encode = {"sub": subject, "exp": expire}
+    to_encode = {"sub": subject, "role": role or user_role(subject), "exp": expire}
     encoded_jwt = jwt.encode(to_encode, JWT_SECRET_KEY, algorithm=JWT_ALGORITHM)
     return encoded_jwt
+
+
+class TokenCache:
+    """
+    Bounded LRU of access tokens that already passed jwt.decode, keyed by
+    the token's SHA-256 (the raw token is never kept). Each entry holds the
+    subject, role and `exp`; an entry past its `exp` is dropped and the
+    token rejected, so caching never extends a token's life.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries: "OrderedDict[bytes, Tuple[str, str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "expired": 0, "invalid": 0, "evictions": 0}
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def verify(self, token: str) -> Tuple[str, str]:
+        """
+        Return the token's (subject, role). Raises ValueError if the token
+        is invalid or expired.
+        """
+        key = self._key(token)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                subject, role, exp = entry
+                if exp > now:
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return subject, role
+                del self._entries[key]
+                self._stats["expired"] += 1
+                raise ValueError("Token expired")
+            self._stats["misses"] += 1
+
+        try:
+            claims = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
+        except ExpiredSignatureError:
+            with self._lock:
+                self._stats["expired"] += 1
+            raise ValueError("Token expired")
+        except JWTError:
+            with self._lock:
+                self._stats["invalid"] += 1
+            raise ValueError("Invalid token")
+
+        subject = claims.get("sub")
+        if not subject or "exp" not in claims:
+            with self._lock:
+                self._stats["invalid"] += 1
+            raise ValueError("Invalid token")
+        role = claims.get("role") or ROLE_AGENT
+
+        with self._lock:
+            self._entries[key] = (subject, role, float(claims["exp"]))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+        return subject, role
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "hit_ratio": (self._stats["hits"] / lookups) if lookups else 0.0,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+            }
+
+
+_tokens = TokenCache(TOKEN_CACHE_SIZE)
+
+
+def verify_access_token(token: str) -> Tuple[str, str]:
+    """
+    (subject, role) of a valid token; ValueError otherwise.
+    """
+    return _tokens.verify(token)
+
+
+def get_token_cache_stats() -> dict:
+    return _tokens.stats()
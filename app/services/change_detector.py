@@ -0,0 +1,260 @@
+# app/services/change_detector.py
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, List, Optional
+
+from app.config import (
+    CHANGE_POLL_ENABLED,
+    CHANGE_POLL_MIN_SECONDS,
+    CHANGE_POLL_MAX_SECONDS,
+    RECORD_ID_DB,
+)
+from app.services.sheet_cache import SheetSnapshot
+
+try:
+    import fcntl
+except ImportError:  # not on Windows: every worker leads
+    fcntl = None
+
+
+def change_events(sheet: str, snapshot: SheetSnapshot) -> List[dict]:
+    """
+    WebSocket events for rows a reload found added or modified:
+    new_pending for new Pending rows (and rows moved back to Pending),
+    status_update for any other status change. Edits that leave the status
+    alone only bump row versions, which since= deltas already pick up.
+    """
+    events = []
+    with snapshot.lock:
+        for pos in snapshot.added:
+            record = dict(snapshot.records[pos])
+            if record.get("Status") == "Pending":
+                events.append(
+                    {
+                        "type": "new_pending",
+                        "sheet": sheet,
+                        "agent_name": record.get("Agent Name"),
+                        "record": record,
+                        "source": "sheet",
+                    }
+                )
+        for pos, old in snapshot.modified:
+            record = dict(snapshot.records[pos])
+            new_status = record.get("Status")
+            if new_status == old.get("Status"):
+                continue
+            if new_status == "Pending":
+                event = {"type": "new_pending", "record": record}
+            else:
+                event = {
+                    "type": "status_update",
+                    "record_id": str(record.get("Record_ID", "")).strip(),
+                    "new_status": new_status,
+                }
+            events.append(
+                {
+                    **event,
+                    "sheet": sheet,
+                    "agent_name": record.get("Agent Name"),
+                    "source": "sheet",
+                }
+            )
+    return events
+
+
+class ChangeDetector:
+    """
+    Picks up edits made directly in Google Sheets.
+
+    A task on the event loop re-reads each worksheet in the background and
+    the snapshot cache diffs it against the cached copy (per-row hashes keyed
+    by Record_ID). Every reload that finds changes, whether from this poller
+    or from a request whose snapshot expired, is turned into WebSocket events
+    and sent through `publish` (ConnectionManager.broadcast), so every worker
+    numbers and replays them like any other event.
+
+    Only one worker per host polls and publishes: the holder of a
+    non-blocking file lock at `lock_path`; the others retry for it every
+    `max_interval`. Each host leads separately, so with BROADCAST_BACKEND=redis
+    enable polling on one host only.
+
+    The interval drops to `min_interval` when a poll finds changes and grows
+    by half after each quiet poll, up to `max_interval`; with no clients
+    connected it stays at `max_interval`. Sheets reloaded more recently than
+    the current interval are skipped.
+    """
+
+    def __init__(
+        self,
+        sheets: List[str],
+        peek: Callable[[str], Optional[SheetSnapshot]],
+        refresh: Callable[[str], SheetSnapshot],
+        publish: Callable[[dict], Awaitable[Any]],
+        min_interval: float,
+        max_interval: float,
+        active: Callable[[], bool] = lambda: True,
+        lock_path: Optional[str] = None,
+    ):
+        self.sheets = sheets
+        self._peek = peek
+        self._refresh = refresh
+        self._publish = publish
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self._active = active
+        self.lock_path = lock_path
+        self._lock_file = None
+        self.interval = min_interval
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._lock = threading.Lock()
+        self._stats = {
+            "polls": 0,
+            "skipped": 0,
+            "standby": 0,
+            "changes": 0,
+            "events": 0,
+            "failures": 0,
+            "last_error": None,
+        }
+
+    # Lifecycle (call from the event loop)
+
+    def start(self):
+        if self._task is not None and not self._task.done():
+            return
+        self._loop = asyncio.get_running_loop()
+        self._task = self._loop.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        if self._lock_file is not None:
+            # Closing releases the flock for another worker
+            self._lock_file.close()
+            self._lock_file = None
+
+    def _count(self, key: str, n: int = 1):
+        with self._lock:
+            self._stats[key] += n
+
+    def _fail(self, e: BaseException, key: Optional[str] = "failures"):
+        with self._lock:
+            if key is not None:
+                self._stats[key] += 1
+            self._stats["last_error"] = str(e)
+
+    @property
+    def leader(self) -> bool:
+        return self.lock_path is None or fcntl is None or self._lock_file is not None
+
+    def _lead(self) -> bool:
+        """
+        Take the host-wide lead if it is free; True if this worker leads.
+        """
+        if self.leader:
+            return True
+        handle = open(self.lock_path, "a")
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            handle.close()
+            return False
+        self._lock_file = handle
+        return True
+
+    # Reload listener (any thread)
+
+    def on_reload(self, sheet: str, snapshot: SheetSnapshot):
+        # Other workers get the leader's events over the bus
+        if sheet not in self.sheets or self._loop is None or not self.leader:
+            return
+        try:
+            events = change_events(sheet, snapshot)
+        except Exception as e:
+            self._fail(e, None)
+            return
+        self._count("changes")
+        self._count("events", len(events))
+        if events:
+            future = asyncio.run_coroutine_threadsafe(self._publish_all(events), self._loop)
+            future.add_done_callback(self._published)
+
+    async def _publish_all(self, events: List[dict]):
+        # One at a time, so the events keep their order on the bus
+        for event in events:
+            await self._publish(event)
+
+    def _published(self, future):
+        if not future.cancelled() and future.exception() is not None:
+            self._fail(future.exception())
+
+    # Polling
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.interval)
+            if not self._lead():
+                self._count("standby")
+                self.interval = self.max_interval
+                continue
+            if not self._active():
+                self.interval = self.max_interval
+                continue
+            changed = False
+            try:
+                for sheet in self.sheets:
+                    snapshot = self._peek(sheet)
+                    if snapshot is not None and snapshot.age() < self.interval:
+                        self._count("skipped")
+                        continue
+                    self._count("polls")
+                    snapshot = await loop.run_in_executor(None, self._refresh, sheet)
+                    changed = changed or bool(snapshot.added or snapshot.modified)
+            except Exception as e:
+                self._fail(e)
+                self.interval = self.max_interval
+                continue
+            if changed:
+                self.interval = self.min_interval
+            else:
+                self.interval = min(self.interval * 1.5, self.max_interval)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self._stats,
+                "running": self._task is not None and not self._task.done(),
+                "leader": self.leader,
+                "interval_seconds": round(self.interval, 2),
+            }
+
+
+def create_change_detector(storage, publish, active) -> Optional[ChangeDetector]:
+    """
+    Poller for the sheets backend (None for other backends or when
+    CHANGE_POLL_ENABLED is off).
+    """
+    if storage.name != "sheets" or not CHANGE_POLL_ENABLED:
+        return None
+    from app.services import google_sheets
+
+    detector = ChangeDetector(
+        ["spectrum", "insurance"],
+        google_sheets.peek_snapshot,
+        google_sheets.refresh_snapshot,
+        publish,
+        CHANGE_POLL_MIN_SECONDS,
+        CHANGE_POLL_MAX_SECONDS,
+        active,
+        f"{RECORD_ID_DB}.changes.lock",
+    )
+    google_sheets.add_reload_listener(detector.on_reload)
+    return detector
@@ -0,0 +1,86 @@
+# app/services/frames.py
+import re
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# Format of the Timestamp column written by build_transaction_row
+TIMESTAMP_FORMAT = "%Y-%m-%d %I:%M:%S %p"
+
+# Float copy of Charge ("$1,200.50" -> 1200.5). Columns starting with "_"
+# are internal and never serialized.
+CHARGE_COLUMN = "_charge"
+
+# Original text of Timestamp cells that did not parse (None elsewhere), so
+# a hand-edited cell is served as typed instead of as null
+TIMESTAMP_RAW_COLUMN = "_timestamp_raw"
+
+_CHARGE_CLEAN = re.compile(r"[^0-9.\-]+")
+
+
+def parse_timestamp(value) -> pd.Timestamp:
+    """
+    Parse one Timestamp cell to a naive Timestamp (NaT if unparseable).
+    Cells in another format (edited by hand in Google Sheets) go through
+    the generic parser.
+    """
+    text = str(value).strip()
+    try:
+        return pd.Timestamp(datetime.strptime(text, TIMESTAMP_FORMAT))
+    except ValueError:
+        pass
+    parsed = pd.to_datetime(text, errors="coerce") if text else pd.NaT
+    if pd.isna(parsed):
+        return pd.NaT
+    return parsed.tz_localize(None) if parsed.tzinfo else parsed
+
+
+def parse_timestamps(values: pd.Series) -> pd.Series:
+    """
+    Vectorized parse_timestamp: one pass with the known format, then the
+    generic parser for the (few) cells that did not match it.
+    """
+    parsed = pd.to_datetime(values, format=TIMESTAMP_FORMAT, errors="coerce")
+    parsed = parsed.astype("datetime64[ns]")
+    leftover = parsed.isna() & values.astype(str).str.strip().ne("")
+    if leftover.any():
+        parsed[leftover] = pd.to_datetime(
+            [parse_timestamp(v) for v in values[leftover]]
+        ).astype("datetime64[ns]")
+    return parsed
+
+
+def parse_charge(value) -> float:
+    try:
+        return float(_CHARGE_CLEAN.sub("", str(value)))
+    except ValueError:
+        return 0.0
+
+
+def parse_charges(values: pd.Series) -> pd.Series:
+    cleaned = values.astype(str).str.replace(_CHARGE_CLEAN.pattern, "", regex=True)
+    return pd.to_numeric(cleaned, errors="coerce").fillna(0.0).astype(float)
+
+
+def type_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Give a transactions DataFrame its typed columns, in place: Timestamp as
+    datetime64 (NaT when unparseable, with the text kept in
+    TIMESTAMP_RAW_COLUMN), Status as a categorical and the float
+    CHARGE_COLUMN next to the original Charge text.
+    """
+    if "Timestamp" in df.columns:
+        raw = df["Timestamp"]
+        parsed = parse_timestamps(raw)
+        text = raw.fillna("").astype(str).str.strip().to_numpy(dtype=object)
+        unparsed = parsed.isna().to_numpy() & (text != "")
+        df[TIMESTAMP_RAW_COLUMN] = pd.Series(
+            np.where(unparsed, text, None), index=df.index, dtype=object
+        )
+        df["Timestamp"] = parsed
+    if "Charge" in df.columns:
+        df[CHARGE_COLUMN] = parse_charges(df["Charge"])
+    if "Status" in df.columns:
+        df["Status"] = df["Status"].astype(str).astype("category")
+    return df
@@ -5,13 +5,38 @@ import gspread
 import pandas as pd
 from datetime import datetime, timedelta, time
 import pytz
-from typing import Optional
-
-from app.config import SHEET_NAME, SERVICE_ACCOUNT_FILE, TIMEZONE
+from typing import List, Optional, Set
+
+from app.config import (
+    SHEET_NAME,
+    SERVICE_ACCOUNT_FILE,
+    TIMEZONE,
+    SHEET_CACHE_TTL_SECONDS,
+    SHEET_FLUSH_INTERVAL_SECONDS,
+    SHEET_FLUSH_MAX_PENDING,
+    SHEET_FLUSH_MAX_ATTEMPTS,
+    SHEET_FLUSH_MAX_BACKOFF_SECONDS,
+    RECORD_ID_DB,
+    RECORD_ID_BLOCK_SIZE,
+    SHEETS_READS_PER_MINUTE,
+    SHEETS_WRITES_PER_MINUTE,
+    SHEETS_QUOTA_BURST,
+    SHEETS_MAX_RETRIES,
+    SHEETS_RETRY_BASE_SECONDS,
+    SHEETS_RETRY_MAX_SECONDS,
+)
+from app.services.archive import SETTLED_STATUSES, RowsLock, create_archive_store
+from app.services.frames import TIMESTAMP_FORMAT, parse_timestamp, type_columns
+from app.services.id_allocator import RecordIdAllocator
+from app.services.night_totals import NightTotals, charged_total, night_window
+from app.services.sheet_cache import SheetCache, SheetSnapshot
+from app.services.sheet_writer import SheetWriteQueue
+from app.services.sheets_quota import QuotaScheduler, QuotaWorksheet, background
 
 tz = pytz.timezone(TIMEZONE)
 
 _gc = None
+_spreadsheet = None
 _spectrum_ws = None
 _insurance_ws = None
 _users_ws = None
@@ -19,6 +44,24 @@ _users_ws = None
 # New: read JSON content if provided
 SERVICE_ACCOUNT_JSON = os.getenv("GOOGLE_SERVICE_ACCOUNT_JSON")
 
+# Snapshots of Sheet1/Sheet2 shared by every read path
+_cache = SheetCache(SHEET_CACHE_TTL_SECONDS)
+
+_id_allocator = RecordIdAllocator(RECORD_ID_DB, RECORD_ID_BLOCK_SIZE)
+_night_totals = NightTotals()
+_sheet_headers = {}
+
+# Every Sheets API call made through the worksheets below is paced against
+# the per-minute read/write quotas and retried on 429/5xx
+_quota = QuotaScheduler(
+    SHEETS_READS_PER_MINUTE,
+    SHEETS_WRITES_PER_MINUTE,
+    SHEETS_QUOTA_BURST,
+    SHEETS_MAX_RETRIES,
+    SHEETS_RETRY_BASE_SECONDS,
+    SHEETS_RETRY_MAX_SECONDS,
+)
+
 def normalize_card_number(card: str) -> str:
     """
     Remove all non-digit characters from the card number.
@@ -90,27 +133,37 @@ def get_gc() -> gspread.Client:
     return _gc
 
 
+def get_spreadsheet() -> gspread.Spreadsheet:
+    global _spreadsheet
+    if _spreadsheet is None:
+        gc = get_gc()
+        _spreadsheet = _quota.call("read", gc.open, SHEET_NAME)
+    return _spreadsheet
+
+
+def _open_ws(title: str) -> QuotaWorksheet:
+    ws = _quota.call("read", get_spreadsheet().worksheet, title)
+    return QuotaWorksheet(ws, _quota)
+
+
 def get_spectrum_ws():
     global _spectrum_ws
     if _spectrum_ws is None:
-        gc = get_gc()
-        _spectrum_ws = gc.open(SHEET_NAME).worksheet("Sheet1")
+        _spectrum_ws = _open_ws("Sheet1")
     return _spectrum_ws
 
 
 def get_insurance_ws():
     global _insurance_ws
     if _insurance_ws is None:
-        gc = get_gc()
-        _insurance_ws = gc.open(SHEET_NAME).worksheet("Sheet2")
+        _insurance_ws = _open_ws("Sheet2")
     return _insurance_ws
 
 
 def get_users_ws():
     global _users_ws
     if _users_ws is None:
-        gc = get_gc()
-        _users_ws = gc.open(SHEET_NAME).worksheet("Sheet3")
+        _users_ws = _open_ws("Sheet3")
     return _users_ws
 
 
@@ -120,10 +173,97 @@ def load_users_df() -> pd.DataFrame:
     return pd.DataFrame(records)
 
 
-def load_data(ws) -> pd.DataFrame:
-    records = ws.get_all_records()
+def get_transactions_ws(sheet: str):
+    if sheet == "spectrum":
+        return get_spectrum_ws()
+    if sheet == "insurance":
+        return get_insurance_ws()
+    raise ValueError("sheet must be 'spectrum' or 'insurance'")
+
+
+def _headers(sheet: str, ws) -> list:
+    # Any loaded snapshot (even stale) knows the headers; no sheet read needed
+    snapshot = _cache.peek(sheet)
+    headers = snapshot.headers if snapshot is not None else []
+    if not headers:
+        headers = _sheet_headers.get(sheet) or ws.row_values(1)
+        _sheet_headers[sheet] = headers
+    return headers
+
+
+def _sheet_rows(sheet: str):
+    """
+    Header row and Record_ID -> current row number of a worksheet, read
+    from Google (one call) when the write-behind queue flushes cell updates.
+    """
+    ws = get_transactions_ws(sheet)
+    headers = _headers(sheet, ws)
+    if "Record_ID" not in headers:
+        raise ValueError("Sheet missing required columns")
+    ids = ws.col_values(headers.index("Record_ID") + 1)
+    rows = {}
+    # Row 1 is the header; first occurrence wins, like the snapshot index
+    for row, value in enumerate(ids[1:], start=2):
+        rows.setdefault(str(value).strip(), row)
+    return headers, rows
+
+
+# Archiving deletes rows: resolving Record_IDs to row numbers and writing
+# to them never overlaps a deletion, in any worker on this host
+_rows_lock = RowsLock(f"{RECORD_ID_DB}.rows.lock")
+
+
+def _restore_orphans(sheet: str, missing: dict) -> Set[str]:
+    # Cell writes queued here for rows another worker archived meanwhile
+    return {
+        record_id
+        for record_id, values in missing.items()
+        if _restore_archived(sheet, record_id, values) is not None
+    }
+
+
+# Cell updates and appends are batched and written in the background
+_writer = SheetWriteQueue(
+    get_transactions_ws,
+    _sheet_rows,
+    SHEET_FLUSH_INTERVAL_SECONDS,
+    SHEET_FLUSH_MAX_PENDING,
+    row_guard=_rows_lock.shared,
+    on_orphaned=_restore_orphans,
+    max_attempts=SHEET_FLUSH_MAX_ATTEMPTS,
+    max_backoff=SHEET_FLUSH_MAX_BACKOFF_SECONDS,
+)
+
+# Settled rows moved out of Sheet1/Sheet2 (None when archiving is off)
+TRANSACTION_TABS = {"spectrum": "Sheet1", "insurance": "Sheet2"}
+_archive = create_archive_store(get_spreadsheet, _quota, TRANSACTION_TABS)
+
+
+def _reload_archive(sheet: str, snapshot: SheetSnapshot):
+    # Rows gone from the hot sheet were most likely archived by another
+    # worker: drop our cached copy of the archive too
+    if snapshot.removed:
+        _archive.invalidate(sheet)
+
+
+if _archive is not None:
+    _cache.listeners.append(_reload_archive)
+
+
+def _records_to_df(records: list) -> pd.DataFrame:
+    """
+    Snapshot DataFrame with typed columns (see frames.type_columns), built
+    once per snapshot version so queries never re-parse.
+    """
     df = pd.DataFrame(records)
 
+    if "Record_ID" in df.columns:
+        # gspread reads numeric IDs back as ints, while rows appended by this
+        # process hold strings until the next reload; type them like SQLite
+        ids = pd.to_numeric(df["Record_ID"], errors="coerce")
+        if len(ids) and ids.notna().all() and (ids % 1 == 0).all():
+            df["Record_ID"] = ids.astype("int64")
+
     if "Expiry Date" in df.columns:
         df["Expiry Date"] = (
             df["Expiry Date"]
@@ -132,7 +272,174 @@ def load_data(ws) -> pd.DataFrame:
             .str.strip()
             .str.zfill(4)
         )
-    return df
+    return type_columns(df)
+
+
+def load_data(ws) -> pd.DataFrame:
+    return _records_to_df(ws.get_all_records())
+
+
+def load_snapshot(sheet: str) -> SheetSnapshot:
+    """
+    Return the cached snapshot for a sheet, re-reading it from Google
+    only when it is older than SHEET_CACHE_TTL_SECONDS.
+    """
+    return _cache.get(sheet, lambda: _fetch_records(sheet), _records_to_df)
+
+
+def peek_snapshot(sheet: str) -> Optional[SheetSnapshot]:
+    return _cache.peek(sheet)
+
+
+def refresh_snapshot(sheet: str) -> SheetSnapshot:
+    """
+    Re-read a sheet now, whatever its age, at background quota priority.
+    """
+    with background():
+        return _cache.get(
+            sheet, lambda: _fetch_records(sheet), _records_to_df, force=True
+        )
+
+
+def add_reload_listener(listener):
+    """
+    Call listener(sheet, snapshot) whenever a reload finds changed rows.
+    """
+    _cache.listeners.append(listener)
+
+
+def _fetch_records(sheet: str) -> list:
+    """
+    Read a sheet for a new snapshot. Queued writes are pushed first so the
+    read already contains them; whatever is still queued afterwards (the
+    flush failed, or writes came in meanwhile) is laid over the rows read,
+    so a reload never reverts our own unflushed writes.
+    """
+    ws = get_transactions_ws(sheet)
+    records, appends, cells = _writer.read_through(sheet, ws.get_all_records)
+    if not appends and not cells:
+        return records
+
+    headers = list(records[0].keys()) if records else _headers(sheet, ws)
+    by_id = {}
+    for record in records:
+        by_id.setdefault(str(record.get("Record_ID", "")).strip(), record)
+    for record_id, values in appends:
+        if record_id not in by_id:
+            record = dict(zip(headers, values))
+            records.append(record)
+            by_id[record_id] = record
+    for (record_id, column), value in cells.items():
+        record = by_id.get(record_id)
+        if record is not None and column in record:
+            record[column] = value
+    return records
+
+
+def locate_record(sheet: str, record_id: str):
+    """
+    Resolve a Record_ID to (snapshot, row values) via the snapshot index;
+    the values are None if the ID is not in the sheet.
+
+    Any loaded snapshot is used, even past its TTL: it only has to know the
+    ID and the headers, since queued writes find the row by Record_ID when
+    they are flushed. The sheet is re-read only when the ID is unknown to a
+    stale snapshot (e.g. a row added directly in Google Sheets).
+    """
+    snapshot = _cache.peek(sheet)
+    if snapshot is None:
+        snapshot = load_snapshot(sheet)
+    record = snapshot.get(record_id)
+    if record is None and not _cache.is_fresh(snapshot):
+        _cache.invalidate(sheet)
+        snapshot = load_snapshot(sheet)
+        record = snapshot.get(record_id)
+    return snapshot, record
+
+
+def load_sheet_df(sheet: str) -> pd.DataFrame:
+    return load_snapshot(sheet).frame()
+
+
+def invalidate_cache(sheet: Optional[str] = None):
+    _cache.invalidate(sheet)
+
+
+def get_sheet_version(sheet: str) -> int:
+    return _cache.version(sheet)
+
+
+def get_sheet_token(sheet: str) -> str:
+    """
+    Opaque version token of a sheet's current snapshot, for ETags and
+    `since=` cursors.
+    """
+    return _cache.token(load_snapshot(sheet).version)
+
+
+def get_changes_since(sheet: str, token: str) -> Optional[Set[str]]:
+    """
+    Record_IDs added or changed after the version in `token`, or None if
+    the token is not usable here (another worker, a restart, or a sheet
+    that had rows removed since).
+    """
+    version = _cache.parse_token(token)
+    if version is None:
+        return None
+    return load_snapshot(sheet).changes_since(version)
+
+
+def get_cache_stats() -> dict:
+    return _cache.stats()
+
+
+def get_writer_stats() -> dict:
+    return _writer.stats()
+
+
+def get_id_allocator_stats() -> dict:
+    return _id_allocator.stats()
+
+
+def get_night_totals_stats() -> dict:
+    return _night_totals.stats()
+
+
+def get_quota_stats() -> dict:
+    return _quota.stats()
+
+
+def flush_pending_writes() -> bool:
+    return _writer.flush()
+
+
+def confirm_write(sheet: str, record_id: str, timeout: float) -> Optional[bool]:
+    """
+    Whether our latest write to a record reached Google Sheets: True,
+    False (dropped), or None (still queued after `timeout` seconds).
+    """
+    return _writer.confirm(sheet, record_id, timeout)
+
+
+def _apply_local_write(
+    sheet: str,
+    record_id: Optional[str] = None,
+    values: Optional[dict] = None,
+    new_record: Optional[dict] = None,
+):
+    """
+    Mirror one of our own writes into the cached snapshot (if loaded)
+    and bump the sheet version, so reads do not need to refetch.
+    """
+    snapshot = _cache.peek(sheet)
+    if snapshot is not None:
+        if new_record is not None:
+            snapshot.append(new_record)
+            record_id = new_record.get("Record_ID")
+        elif record_id is not None and values:
+            snapshot.update(record_id, values)
+        _night_totals.apply(sheet, snapshot, record_id)
+    _cache.bump(sheet, record_id)
 
 
 def process_dataframe(df: pd.DataFrame, delete_after_minutes: int = 5):
@@ -140,10 +447,7 @@ def process_dataframe(df: pd.DataFrame, delete_after_minutes: int = 5):
         return df, df
 
     if "Timestamp" in df.columns:
-        df["Timestamp"] = pd.to_datetime(df["Timestamp"], errors="coerce")
-        df["Timestamp"] = df["Timestamp"].apply(
-            lambda x: x.tz_localize(None) if hasattr(x, "tzinfo") and x.tzinfo else x
-        )
+        # Timestamp is already datetime64 (see _records_to_df)
         now = datetime.now(tz).replace(tzinfo=None)
         cutoff = now - timedelta(minutes=delete_after_minutes)
         df = df[
@@ -159,32 +463,52 @@ def process_dataframe(df: pd.DataFrame, delete_after_minutes: int = 5):
 
 
 def get_pending_transactions(sheet: str) -> pd.DataFrame:
-    if sheet == "spectrum":
-        ws = get_spectrum_ws()
-    elif sheet == "insurance":
-        ws = get_insurance_ws()
-    else:
-        raise ValueError("sheet must be 'spectrum' or 'insurance'")
-
-    df = load_data(ws)
+    df = load_snapshot(sheet).view()
     pending, _ = process_dataframe(df)
     return pending
 
 def get_all_transactions(sheet: str) -> pd.DataFrame:
     """
-    Return all transactions for the given sheet as a DataFrame.
+    Return all transactions for the given sheet as a DataFrame: archived
+    rows (oldest first) followed by the hot sheet.
     sheet must be 'spectrum' or 'insurance'.
     """
-    if sheet == "spectrum":
-        ws = get_spectrum_ws()
-    elif sheet == "insurance":
-        ws = get_insurance_ws()
-    else:
-        raise ValueError("sheet must be 'spectrum' or 'insurance'")
-
-    df = load_data(ws)
+    snapshot = load_snapshot(sheet)
+    archived = load_archive_df(sheet)
+    if archived.empty:
+        return snapshot.frame()
+    if "Record_ID" in archived.columns:
+        # A pass that stopped between archiving and deleting leaves rows in
+        # both places; the hot copy wins
+        ids = archived["Record_ID"].astype(str).str.strip()
+        archived = archived[~ids.isin(list(snapshot.index)).to_numpy()]
+    df = pd.concat([archived, snapshot.view()], ignore_index=True)
+    if "Status" in df.columns:
+        df["Status"] = df["Status"].astype(str).astype("category")
     return df
 
+
+def export_records(sheet: str) -> List[dict]:
+    """
+    Every row of a sheet as records, archived ones first, including writes
+    still queued in this process (for importing into another backend).
+    """
+    archived = _archive.records(sheet) if _archive is not None else []
+    snapshot = load_snapshot(sheet)
+    with snapshot.lock:
+        hot = [dict(record) for record in snapshot.records]
+    return archived + hot
+
+
+def load_archive_df(sheet: str) -> pd.DataFrame:
+    """
+    Archived rows of a sheet as a typed DataFrame (empty when archiving is
+    off). Shared; do not mutate.
+    """
+    if _archive is None:
+        return pd.DataFrame()
+    return _archive.frame(sheet, _records_to_df)
+
 def get_recent_transactions(
     sheet: str,
     minutes: int = 20,
@@ -194,89 +518,90 @@ def get_recent_transactions(
     Return transactions from the given sheet within the last `minutes`.
     Optionally filter by Agent Name.
     """
-    if sheet == "spectrum":
-        ws = get_spectrum_ws()
-    elif sheet == "insurance":
-        ws = get_insurance_ws()
-    else:
-        raise ValueError("sheet must be 'spectrum' or 'insurance'")
-
-    df = load_data(ws)
-    if df.empty or "Timestamp" not in df.columns:
+    snapshot = load_snapshot(sheet)
+    if "Timestamp" not in snapshot.headers:
         return pd.DataFrame()
 
-    # Parse Timestamp and drop invalid
-    df["Timestamp"] = pd.to_datetime(df["Timestamp"], errors="coerce")
-    df = df.dropna(subset=["Timestamp"])
-
-    # Make timestamps naive and compare with current time in TIMEZONE
-    df["Timestamp"] = df["Timestamp"].astype("datetime64[ns]")
+    # Naive Asia/Karachi, like the parsed Timestamps; binary search on the
+    # snapshot's time index instead of a full-column mask
     now = datetime.now(tz).replace(tzinfo=None)
-    cutoff = now - timedelta(minutes=minutes)
+    agent = agent_name if agent_name and "Agent Name" in snapshot.headers else None
+    return snapshot.rows(snapshot.since(now - timedelta(minutes=minutes), agent))
 
-    df = df[df["Timestamp"] >= cutoff]
-
-    # Optional agent filter
-    if agent_name:
-        if "Agent Name" in df.columns:
-            df = df[df["Agent Name"].astype(str).str.strip() == str(agent_name).strip()]
+def _restore_archived(sheet: str, record_id: str, values: dict) -> Optional[dict]:
+    """
+    Put an archived row back on the hot sheet with `values` applied, e.g. a
+    Charged row marked "Charge Back" after it was archived. Returns the
+    restored record, or None if the Record_ID is not archived either.
+
+    The archive keeps its old copy; reads prefer the hot one, and a later
+    pass archives the row again with the new values (last copy wins). The
+    values are also queued as cell writes, so they land even if another
+    worker restored the row first (the append is then skipped).
+    """
+    if _archive is None:
+        return None
+    archived = _archive.find(sheet, record_id)
+    if archived is None:
+        return None
+    headers = _headers(sheet, get_transactions_ws(sheet))
+    record = {h: archived.get(h, "") for h in headers}
+    record.update((h, v) for h, v in values.items() if h in record)
+    _writer.append_row(sheet, record_id, [record[h] for h in headers], check_present=True)
+    for column, value in values.items():
+        _writer.update_cell(sheet, record_id, column, value)
+    _apply_local_write(sheet, new_record=record)
+    return record
 
-    return df
 
 def update_status_by_record_id(sheet: str, record_id: str, new_status: str):
-    if sheet == "spectrum":
-        ws = get_spectrum_ws()
-    elif sheet == "insurance":
-        ws = get_insurance_ws()
-    else:
-        raise ValueError("sheet must be 'spectrum' or 'insurance'")
-
-    all_records = ws.get_all_records()
-    df = pd.DataFrame(all_records)
-    if df.empty or "Record_ID" not in df.columns or "Status" not in df.columns:
+    snapshot, record = locate_record(sheet, record_id)
+    if "Status" not in snapshot.headers or "Record_ID" not in snapshot.headers:
         raise ValueError("Sheet missing required columns")
-
-    df["Record_ID"] = df["Record_ID"].astype(str).str.strip()
-    record_id = str(record_id).strip()
-
-    matched = df[df["Record_ID"] == record_id]
-    if matched.empty:
-        raise ValueError("Record not found")
-
-    idx = matched.index[0]
-    row_num = idx + 2
-    col_num = df.columns.get_loc("Status") + 1
-
-    ws.update_cell(row_num, col_num, new_status)
-    return True
+    if record is None:
+        # Settled rows move to the archive, but can still be charged back
+        record = _restore_archived(sheet, record_id, {"Status": new_status})
+        if record is None:
+            raise ValueError("Record not found")
+        return record
+
+    _writer.update_cell(sheet, record_id, "Status", new_status)
+    _apply_local_write(sheet, record_id, {"Status": new_status})
+    record["Status"] = new_status
+    return record
 
 
 def get_record_by_id(sheet: str, record_id: str) -> dict:
-    if sheet == "spectrum":
-        ws = get_spectrum_ws()
-    elif sheet == "insurance":
-        ws = get_insurance_ws()
-    else:
-        raise ValueError("sheet must be 'spectrum' or 'insurance'")
+    _, record = locate_record(sheet, record_id)
+    if record is None:
+        record = _archive.find(sheet, record_id) if _archive is not None else None
+        if record is None:
+            return {}
 
-    all_records = ws.get_all_records()
-    df = pd.DataFrame(all_records)
-    if df.empty or "Record_ID" not in df.columns:
-        return {}
-
-    df["Record_ID"] = df["Record_ID"].astype(str).str.strip()
-    record_id = str(record_id).strip()
+    record["Record_ID"] = str(record.get("Record_ID", "")).strip()
+    return record
 
-    matched = df[df["Record_ID"] == record_id]
-    if matched.empty:
-        return {}
 
-    record = matched.iloc[0].to_dict()
-    return record
-from datetime import datetime, timedelta
-import pytz
+def _max_record_id(sheet: str) -> int:
+    """
+    Highest numeric Record_ID in the sheet and its archive (0 if none).
+    Only used to seed the ID allocator.
+    """
+    highest = 0
+    for df in (load_snapshot(sheet).view(), load_archive_df(sheet)):
+        if df.empty or "Record_ID" not in df.columns:
+            continue
+        existing_ids = (
+            df["Record_ID"]
+            .astype(str)
+            .str.extract(r"(\d+)", expand=False)
+            .dropna()
+            .astype(int)
+        )
+        if not existing_ids.empty:
+            highest = max(highest, int(existing_ids.max()))
+    return highest
 
-# ... existing code ...
 
 def create_transaction(sheet: str, data: dict) -> dict:
     if sheet == "spectrum":
@@ -286,28 +611,17 @@ def create_transaction(sheet: str, data: dict) -> dict:
     else:
         raise ValueError("sheet must be 'spectrum' or 'insurance'")
 
-    records = ws.get_all_records()
-    df = pd.DataFrame(records)
-    if df.empty:
-        next_id = "1"
-    else:
-        try:
-            existing_ids = (
-                df["Record_ID"]
-                .astype(str)
-                .str.extract(r"(\d+)", expand=False)
-                .dropna()
-                .astype(int)
-            )
-            next_id = str(existing_ids.max() + 1) if not existing_ids.empty else "1"
-        except Exception:
-            next_id = str(len(df) + 1)
+    next_id = _id_allocator.next_id(sheet, lambda: _max_record_id(sheet))
+    row = build_transaction_row(sheet, data, next_id, datetime.now(tz))
+    return _append_transaction(sheet, ws, row)
 
-    now = datetime.now(tz)
-    date_of_charge = now.strftime("%Y-%m-%d")
-    ts = now.strftime("%Y-%m-%d %I:%M:%S %p")
 
-    record_id = next_id
+def build_transaction_row(sheet: str, data: dict, record_id, now: datetime) -> list:
+    """
+    Cell values for a new transaction, in the sheet's column order.
+    """
+    date_of_charge = now.strftime("%Y-%m-%d")
+    ts = now.strftime(TIMESTAMP_FORMAT)
 
     # Normalize card number and expiry date before saving
     raw_card_number = data.get("card_number", "")
@@ -335,10 +649,7 @@ def create_transaction(sheet: str, data: dict) -> dict:
             "Pending",
             ts,
         ]
-        ws.append_row(row)
-        headers = ws.row_values(1)
-        record_dict = dict(zip(headers, row))
-        return record_dict
+        return row
 
     # insurance sheet (no Provider column)
     row = [
@@ -358,106 +669,67 @@ def create_transaction(sheet: str, data: dict) -> dict:
         "Pending",
         ts,
     ]
-    ws.append_row(row)
-    headers = ws.row_values(1)
+    return row
+
+
+def _append_transaction(sheet: str, ws, row: list) -> dict:
+    headers = _headers(sheet, ws)
     record_dict = dict(zip(headers, row))
+    _writer.append_row(sheet, record_dict.get("Record_ID", row[0]), row)
+    _apply_local_write(sheet, new_record=record_dict)
     return record_dict
 
 
+# Map payload keys to sheet column names
+EDITABLE_FIELDS = {
+    "name": "Name",
+    "ph_number": "Ph Number",
+    "address": "Address",
+    "email": "Email",
+    "charge": "Charge",
+    "llc": "LLC",
+    "provider": "Provider",
+}
+
+
 def update_transaction_fields(sheet: str, record_id: str, updates: dict) -> dict:
     """
     Update basic transaction fields (name, phone, address, email, charge, llc, provider).
-    Returns the updated record as a dict.
+    Returns the updated record as a dict (from local state; the cell writes
+    are flushed to Google Sheets in the background).
     """
-    if sheet == "spectrum":
-        ws = get_spectrum_ws()
-    elif sheet == "insurance":
-        ws = get_insurance_ws()
-    else:
-        raise ValueError("sheet must be 'spectrum' or 'insurance'")
-
-    all_records = ws.get_all_records()
-    df = pd.DataFrame(all_records)
-    if df.empty or "Record_ID" not in df.columns:
+    snapshot, record = locate_record(sheet, record_id)
+    if "Record_ID" not in snapshot.headers:
         raise ValueError("Sheet missing required columns")
-
-    df["Record_ID"] = df["Record_ID"].astype(str).str.strip()
-    record_id = str(record_id).strip()
-
-    matched = df[df["Record_ID"] == record_id]
-    if matched.empty:
+    if record is None:
         raise ValueError("Record not found")
 
-    idx = matched.index[0]
-    row_num = idx + 2  # header row is 1
-
-    # Map payload keys to sheet column names
-    field_map = {
-        "name": "Name",
-        "ph_number": "Ph Number",
-        "address": "Address",
-        "email": "Email",
-        "charge": "Charge",
-        "llc": "LLC",
-        "provider": "Provider",
-    }
-
+    changed = {}
     for key, value in updates.items():
-        if key not in field_map:
+        if key not in EDITABLE_FIELDS:
             continue
-        col_name = field_map[key]
-        if col_name not in df.columns:
+        col_name = EDITABLE_FIELDS[key]
+        if col_name not in snapshot.headers:
             # e.g. Provider does not exist on insurance sheet
             continue
-        col_idx = df.columns.get_loc(col_name) + 1
-        ws.update_cell(row_num, col_idx, value if value is not None else "")
-
-    # Reload the updated record
-    updated_records = ws.get_all_records()
-    updated_df = pd.DataFrame(updated_records)
-    if updated_df.empty or "Record_ID" not in updated_df.columns:
-        raise ValueError("Unable to reload updated record")
-
-    updated_df["Record_ID"] = updated_df["Record_ID"].astype(str).str.strip()
-    updated_match = updated_df[updated_df["Record_ID"] == record_id]
-    if updated_match.empty:
+        cell_value = value if value is not None else ""
+        _writer.update_cell(sheet, record_id, col_name, cell_value)
+        changed[col_name] = cell_value
+
+    # Return the record from the snapshot instead of re-reading the sheet
+    _apply_local_write(sheet, record_id, changed)
+    _, updated_record = locate_record(sheet, record_id)
+    if updated_record is None:
         raise ValueError("Updated record not found")
+    updated_record["Record_ID"] = str(updated_record.get("Record_ID", "")).strip()
+    return updated_record
 
-    return updated_match.iloc[0].to_dict()
-
-def get_recent_transactions(sheet: str, minutes: int, agent_name: str | None = None) -> pd.DataFrame:
-    """
-    Return transactions from the last `minutes` minutes for a sheet,
-    optionally filtered by agent_name.
-    """
+def _night_sheets(sheet: Optional[str]) -> list:
     if sheet == "spectrum":
-        ws = get_spectrum_ws()
-    elif sheet == "insurance":
-        ws = get_insurance_ws()
-    else:
-        raise ValueError("sheet must be 'spectrum' or 'insurance'")
-
-    records = ws.get_all_records()
-    df = pd.DataFrame(records)
-    if df.empty:
-        return pd.DataFrame()
-
-    if "Timestamp" not in df.columns:
-        return pd.DataFrame()
-
-    # Convert to datetime
-    df["Timestamp"] = pd.to_datetime(df["Timestamp"], errors="coerce")
-    df = df.dropna(subset=["Timestamp"])
-
-    now = datetime.now(tz).replace(tzinfo=None)
-    cutoff = now - timedelta(minutes=minutes)
-
-    df = df[df["Timestamp"] >= cutoff]
-
-    if agent_name and "Agent Name" in df.columns:
-        df = df[df["Agent Name"] == agent_name]
-
-    return df
+        return ["spectrum"]
+    if sheet == "insurance":
+        return ["insurance"]
+    return ["spectrum", "insurance"]
 
 
 def get_night_charged_total(sheet: Optional[str] = None) -> float:
@@ -467,62 +739,119 @@ def get_night_charged_total(sheet: Optional[str] = None) -> float:
     If sheet == "spectrum": only Sheet1 is used.
     If sheet == "insurance": only Sheet2 is used.
     Otherwise: both sheets are included (spectrum + insurance).
-    """
-    if sheet == "spectrum":
-        sheets = ["spectrum"]
-    elif sheet == "insurance":
-        sheets = ["insurance"]
-    else:
-        sheets = ["spectrum", "insurance"]
-
-    total = 0.0
 
+    Served from a running per-sheet aggregate; see
+    recompute_night_charged_total for the full scan.
+    """
     # Work in Asia/Karachi, naive for comparisons
     now = datetime.now(tz).replace(tzinfo=None)
-    now_time = now.time()
-
-    # Night window logic (same as your Streamlit logic)
-    if time(7, 0) <= now_time < time(19, 0):
-        # Daytime: window was yesterday 19:00 → today 06:00
-        window_start = datetime.combine(now.date() - timedelta(days=1), time(19, 0))
-        window_end = datetime.combine(now.date(), time(6, 0))
-    elif now_time >= time(19, 0):
-        # Evening: window is today 19:00 → tomorrow 06:00
-        window_start = datetime.combine(now.date(), time(19, 0))
-        window_end = datetime.combine(now.date() + timedelta(days=1), time(6, 0))
-    else:
-        # Early morning (00:00–06:00): window is yesterday 19:00 → today 06:00
-        window_start = datetime.combine(now.date() - timedelta(days=1), time(19, 0))
-        window_end = datetime.combine(now.date(), time(6, 0))
 
-    for s in sheets:
-        if s == "spectrum":
-            ws = get_spectrum_ws()
-        else:
-            ws = get_insurance_ws()
+    total = 0.0
+    for s in _night_sheets(sheet):
+        total += _night_totals.total(s, load_snapshot(s), now)
+    return float(total)
 
-        records = ws.get_all_records()
-        df = pd.DataFrame(records)
-        if df.empty:
-            continue
 
-        if "Timestamp" not in df.columns or "Status" not in df.columns or "Charge" not in df.columns:
-            continue
+def recompute_night_charged_total(sheet: Optional[str] = None) -> float:
+    """
+    Same as get_night_charged_total, but rescans every row of the cached
+    snapshot. Used as a consistency check for the running aggregate.
+    """
+    window = night_window(datetime.now(tz).replace(tzinfo=None))
 
-        df["Timestamp"] = pd.to_datetime(df["Timestamp"], errors="coerce")
-        df = df.dropna(subset=["Timestamp"])
+    total = 0.0
+    for s in _night_sheets(sheet):
+        total += charged_total(load_snapshot(s).view(), window)
+    return float(total)
 
-        # Normalize Charge to float
-        charge_str = df["Charge"].astype(str).str.replace(r"[\$,]", "", regex=True)
-        df["ChargeFloat"] = pd.to_numeric(charge_str, errors="coerce").fillna(0.0)
 
-        mask = (
-            (df["Status"] == "Charged")
-            & (df["Timestamp"] >= window_start)
-            & (df["Timestamp"] <= window_end)
-        )
-        total += df.loc[mask, "ChargeFloat"].sum()
+def _runs(rows: list) -> list:
+    """
+    Collapse sorted row numbers into (first, last) runs of consecutive rows.
+    """
+    runs = []
+    for row in rows:
+        if runs and runs[-1][1] == row - 1:
+            runs[-1][1] = row
+        else:
+            runs.append([row, row])
+    return runs
 
-    return float(total)
+
+def archive_settled_rows(sheet: str, cutoff: datetime) -> int:
+    """
+    Move settled rows (Charged, Declined, Charge Back) with a Timestamp
+    before `cutoff` into the per-month archive, then delete them from the
+    hot sheet. Returns the number of rows deleted.
+
+    Runs under the exclusive RowsLock, so no worker on this host resolves
+    or writes a row number meanwhile. Rows with writes still queued here are
+    left for the next pass. Just before deleting, the sheet is read again
+    and only rows that still hold exactly what was archived are deleted; a
+    row edited in Google Sheets in the meantime stays (and its newer copy is
+    archived by a later pass). Rows are archived before they are deleted,
+    so an interrupted pass can only leave a row in both places (reads keep
+    the hot copy).
+    """
+    if _archive is None:
+        return 0
+    ws = get_transactions_ws(sheet)
+    # Queued edits go in first, so the archived copies include them. Not
+    # under _rows_lock: the flush takes it itself
+    if not _writer.flush():
+        raise RuntimeError("Pending sheet writes could not be flushed")
+    with _rows_lock.exclusive():
+        values = ws.get_all_values()
+        if len(values) < 2:
+            return 0
+        headers = values[0]
+        queued = _writer.queued_ids(sheet)
+        by_month = {}
+        picked = []
+        for row_num, cells in enumerate(values[1:], start=2):
+            record = dict(zip(headers, cells))
+            if record.get("Status") not in SETTLED_STATUSES:
+                continue
+            if str(record.get("Record_ID", "")).strip() in queued:
+                continue
+            ts = parse_timestamp(record.get("Timestamp", ""))
+            if pd.isna(ts) or ts >= cutoff:
+                continue
+            by_month.setdefault(ts.strftime("%Y-%m"), []).append(record)
+            picked.append(row_num)
+        if not picked:
+            return 0
+
+        for month, month_records in sorted(by_month.items()):
+            _archive.append(sheet, month, headers, month_records)
+
+        current = ws.get_all_values()
+        rows = [
+            row_num
+            for row_num in picked
+            if row_num <= len(current) and current[row_num - 1] == values[row_num - 1]
+        ]
+        if rows:
+            # One request, bottom-up, so each range still points at the right rows
+            requests = [
+                {
+                    "deleteDimension": {
+                        "range": {
+                            "sheetId": ws.id,
+                            "dimension": "ROWS",
+                            "startIndex": first - 1,
+                            "endIndex": last,
+                        }
+                    }
+                }
+                for first, last in reversed(_runs(rows))
+            ]
+            _quota.call(
+                "write", get_spreadsheet().batch_update, {"requests": requests}, idempotent=False
+            )
+    _cache.invalidate(sheet)
+    return len(rows)
 
 
+def get_archive_stats() -> Optional[dict]:
+    return _archive.stats() if _archive is not None else None
@@ -0,0 +1,89 @@
+# app/services/id_allocator.py
+import sqlite3
+import threading
+from typing import Callable, Dict, List
+
+
+class RecordIdAllocator:
+    """
+    Hands out Record_IDs without reading the sheet.
+
+    Each worker process reserves a block of `block_size` IDs at a time from a
+    small SQLite counter shared by all workers on the host, then serves IDs
+    from that block in memory under a lock. The counter is seeded once from
+    the highest ID in the sheet, so it never goes backwards.
+
+    IDs are unique across workers but, with several workers, not strictly in
+    submit order, and unused IDs in a block are skipped after a restart.
+    """
+
+    def __init__(self, db_path: str, block_size: int):
+        self.db_path = db_path
+        self.block_size = max(1, block_size)
+        self._lock = threading.Lock()
+        self._blocks: Dict[str, List[int]] = {}  # sheet -> [next, end)
+        self._seeded: Dict[str, int] = {}
+        self._stats = {"allocated": 0, "blocks_reserved": 0}
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS record_id_blocks ("
+            "sheet TEXT PRIMARY KEY, next_id INTEGER NOT NULL)"
+        )
+        return conn
+
+    def _reserve_block(self, sheet: str, floor: int) -> List[int]:
+        conn = self._connect()
+        try:
+            # BEGIN IMMEDIATE takes the write lock, so two workers can never
+            # read the same next_id
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT next_id FROM record_id_blocks WHERE sheet = ?", (sheet,)
+            ).fetchone()
+            start = max(row[0] if row else 1, floor)
+            end = start + self.block_size
+            conn.execute(
+                "INSERT INTO record_id_blocks (sheet, next_id) VALUES (?, ?) "
+                "ON CONFLICT(sheet) DO UPDATE SET next_id = excluded.next_id",
+                (sheet, end),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+        self._stats["blocks_reserved"] += 1
+        return [start, end]
+
+    def next_id(self, sheet: str, max_existing: Callable[[], int]) -> str:
+        """
+        Return the next Record_ID for a sheet. `max_existing` is called once
+        per process to seed the counter from the sheet contents.
+        """
+        with self._lock:
+            if sheet not in self._seeded:
+                self._seeded[sheet] = max_existing() + 1
+
+            block = self._blocks.get(sheet)
+            if block is None or block[0] >= block[1]:
+                block = self._reserve_block(sheet, self._seeded[sheet])
+                self._blocks[sheet] = block
+
+            record_id = block[0]
+            block[0] += 1
+            self._stats["allocated"] += 1
+            return str(record_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self._stats,
+                "block_size": self.block_size,
+                "remaining": {
+                    sheet: block[1] - block[0] for sheet, block in self._blocks.items()
+                },
+            }
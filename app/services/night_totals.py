@@ -0,0 +1,162 @@
+# app/services/night_totals.py
+import threading
+from datetime import datetime, timedelta, time
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.services.frames import CHARGE_COLUMN, parse_charge, parse_timestamp
+from app.services.sheet_cache import SheetSnapshot
+
+
+def night_window(now: datetime) -> Tuple[datetime, datetime]:
+    """
+    Night shift window (7 PM → 6 AM) that `now` belongs to, as naive
+    Asia/Karachi datetimes.
+    """
+    now_time = now.time()
+
+    # Night window logic (same as your Streamlit logic)
+    if time(7, 0) <= now_time < time(19, 0):
+        # Daytime: window was yesterday 19:00 → today 06:00
+        window_start = datetime.combine(now.date() - timedelta(days=1), time(19, 0))
+        window_end = datetime.combine(now.date(), time(6, 0))
+    elif now_time >= time(19, 0):
+        # Evening: window is today 19:00 → tomorrow 06:00
+        window_start = datetime.combine(now.date(), time(19, 0))
+        window_end = datetime.combine(now.date() + timedelta(days=1), time(6, 0))
+    else:
+        # Early morning (00:00–06:00): window is yesterday 19:00 → today 06:00
+        window_start = datetime.combine(now.date() - timedelta(days=1), time(19, 0))
+        window_end = datetime.combine(now.date(), time(6, 0))
+
+    return window_start, window_end
+
+
+def _charged_mask(df: pd.DataFrame, window: Tuple[datetime, datetime]) -> Optional[pd.Series]:
+    if df.empty:
+        return None
+    if "Timestamp" not in df.columns or "Status" not in df.columns or CHARGE_COLUMN not in df.columns:
+        return None
+
+    window_start, window_end = window
+    return (
+        (df["Status"] == "Charged")
+        & (df["Timestamp"] >= window_start)
+        & (df["Timestamp"] <= window_end)
+    )
+
+
+def charged_total(df: pd.DataFrame, window: Tuple[datetime, datetime]) -> float:
+    """
+    Full recompute over a typed sheet DataFrame (see frames.type_columns):
+    sum of Charge for Status == 'Charged' with a Timestamp inside the window.
+    """
+    mask = _charged_mask(df, window)
+    if mask is None:
+        return 0.0
+    return float(df.loc[mask, CHARGE_COLUMN].sum())
+
+
+def _contribution(record: dict, window: Tuple[datetime, datetime]) -> float:
+    """
+    Amount a single row adds to the night total (0 unless Charged in-window).
+    """
+    if record.get("Status") != "Charged":
+        return 0.0
+    ts = parse_timestamp(record.get("Timestamp", ""))
+    if pd.isna(ts) or not (window[0] <= ts <= window[1]):
+        return 0.0
+    return parse_charge(record.get("Charge", ""))
+
+
+class _SheetTotal:
+    def __init__(self, snapshot: SheetSnapshot, window: Tuple[datetime, datetime]):
+        self.snapshot = snapshot
+        self.window = window
+        # Snapshot row position -> amount counted for that row; seeded from
+        # the typed frame (frame positions are snapshot positions)
+        self.contributions: Dict[int, float] = {}
+        with snapshot.lock:
+            df = snapshot.view()
+            mask = _charged_mask(df, window)
+            if mask is None:
+                positions, amounts = np.empty(0, dtype=int), np.empty(0)
+            else:
+                positions = np.flatnonzero(mask.to_numpy(dtype=bool))
+                amounts = df[CHARGE_COLUMN].to_numpy()[positions]
+        for pos, amount in zip(positions.tolist(), amounts.tolist()):
+            if amount:
+                self.contributions[pos] = amount
+        self.total = float(amounts.sum())
+
+
+class NightTotals:
+    """
+    Running night-window Charged total per sheet.
+
+    The total is rebuilt from the snapshot's typed frame (one vectorized
+    pass, outside the lock) when the snapshot is reloaded or the night
+    window rolls over; between those, status and charge edits adjust it one
+    row at a time, so reads are O(1). A rebuild that overlapped a write to
+    the same sheet is discarded and redone.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sheets: Dict[str, _SheetTotal] = {}
+        # Per sheet: writes seen by apply(), to detect a rebuild that raced one
+        self._writes: Dict[str, int] = {}
+        self._stats = {"reads": 0, "rebuilds": 0, "row_updates": 0}
+
+    def total(self, sheet: str, snapshot: SheetSnapshot, now: datetime) -> float:
+        window = night_window(now)
+        with self._lock:
+            self._stats["reads"] += 1
+        while True:
+            with self._lock:
+                state = self._sheets.get(sheet)
+                if state is not None and state.snapshot is snapshot and state.window == window:
+                    return state.total
+                writes = self._writes.get(sheet, 0)
+            state = _SheetTotal(snapshot, window)
+            with self._lock:
+                self._stats["rebuilds"] += 1
+                if self._writes.get(sheet, 0) == writes:
+                    self._sheets[sheet] = state
+                    return state.total
+
+    def apply(self, sheet: str, snapshot: SheetSnapshot, record_id: Optional[str]):
+        """
+        Re-count one row after a local write to it.
+        """
+        with self._lock:
+            self._writes[sheet] = self._writes.get(sheet, 0) + 1
+            state = self._sheets.get(sheet)
+            if state is None or state.snapshot is not snapshot:
+                # Rebuilt lazily on the next read
+                return
+            with snapshot.lock:
+                pos = snapshot.position(record_id)
+                if pos is None:
+                    return
+                amount = _contribution(snapshot.records[pos], state.window)
+            state.total += amount - state.contributions.pop(pos, 0.0)
+            if amount:
+                state.contributions[pos] = amount
+            self._stats["row_updates"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self._stats,
+                "sheets": {
+                    sheet: {
+                        "total": state.total,
+                        "window_start": state.window[0].isoformat(),
+                        "charged_rows": len(state.contributions),
+                    }
+                    for sheet, state in self._sheets.items()
+                },
+            }
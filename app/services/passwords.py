@@ -0,0 +1,188 @@
+# app/services/passwords.py
+import base64
+import hashlib
+import hmac
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional
+
+from app.config import (
+    PASSWORD_HASHER,
+    PASSWORD_HASH_WORKERS,
+    SCRYPT_N,
+    SCRYPT_R,
+    SCRYPT_P,
+)
+
+
+def _b64(raw: bytes) -> str:
+    return base64.b64encode(raw).decode("ascii")
+
+
+class Sha256Hasher:
+    """
+    Legacy format: unsalted hex SHA-256, as stored by the first version of
+    the app. Still verified so old rows keep working until they are
+    upgraded on login.
+    """
+
+    name = "sha256"
+
+    def hash(self, password: str) -> str:
+        return hashlib.sha256(password.encode()).hexdigest()
+
+    def verify(self, password: str, stored: str) -> bool:
+        return hmac.compare_digest(self.hash(password), stored)
+
+    def identifies(self, stored: str) -> bool:
+        return len(stored) == 64 and all(c in "0123456789abcdef" for c in stored.lower())
+
+    def needs_update(self, stored: str) -> bool:
+        return False
+
+
+class ScryptHasher:
+    """
+    Salted scrypt (hashlib), stored as "scrypt$n$r$p$salt$hash" with base64
+    salt and hash. The parameters travel with each hash, so raising the
+    cost only affects new hashes; older ones are upgraded on login.
+    """
+
+    name = "scrypt"
+
+    def __init__(self, n: int = 2 ** 14, r: int = 8, p: int = 1, dklen: int = 32):
+        self.n = n
+        self.r = r
+        self.p = p
+        self.dklen = dklen
+
+    @staticmethod
+    def _derive(password: str, salt: bytes, n: int, r: int, p: int, dklen: int) -> bytes:
+        # maxmem must cover 128 * n * r bytes plus some slack
+        return hashlib.scrypt(
+            password.encode(), salt=salt, n=n, r=r, p=p, dklen=dklen,
+            maxmem=256 * n * r + 1024 * 1024,
+        )
+
+    def hash(self, password: str) -> str:
+        salt = os.urandom(16)
+        derived = self._derive(password, salt, self.n, self.r, self.p, self.dklen)
+        return f"scrypt${self.n}${self.r}${self.p}${_b64(salt)}${_b64(derived)}"
+
+    def verify(self, password: str, stored: str) -> bool:
+        try:
+            _, n, r, p, salt, expected = stored.split("$")
+            expected = base64.b64decode(expected)
+            derived = self._derive(
+                password, base64.b64decode(salt), int(n), int(r), int(p), len(expected)
+            )
+        except ValueError:
+            return False
+        return hmac.compare_digest(derived, expected)
+
+    def identifies(self, stored: str) -> bool:
+        return stored.startswith("scrypt$")
+
+    def needs_update(self, stored: str) -> bool:
+        return not stored.startswith(f"scrypt${self.n}${self.r}${self.p}$")
+
+
+HASHERS = {
+    "sha256": Sha256Hasher(),
+    "scrypt": ScryptHasher(SCRYPT_N, SCRYPT_R, SCRYPT_P),
+}
+
+
+def identify(stored: str):
+    """
+    The hasher that produced `stored`, or None for an unknown format.
+    """
+    for hasher in HASHERS.values():
+        if hasher.identifies(stored):
+            return hasher
+    return None
+
+
+# Worker-process entry points (module level so they can be pickled)
+def _hash(hasher_name: str, password: str) -> str:
+    return HASHERS[hasher_name].hash(password)
+
+
+def _verify(hasher_name: str, password: str, stored: str) -> bool:
+    return HASHERS[hasher_name].verify(password, stored)
+
+
+class PasswordHasher:
+    """
+    Hashes with the configured hasher and verifies any known format.
+
+    The KDF work runs on a process pool of `workers` processes, so a burst
+    of logins neither holds the GIL nor stalls the request threads behind
+    each other beyond the pool size. workers=0 hashes in the calling
+    thread. Workers are spawned, not forked: the pool starts lazily inside
+    a process that already runs threads (sheet writer, executor pools),
+    and a fork could copy one of their locks while held.
+    """
+
+    def __init__(self, current: str = PASSWORD_HASHER, workers: int = PASSWORD_HASH_WORKERS):
+        if current not in HASHERS:
+            raise ValueError(f"Unknown PASSWORD_HASHER {current!r}")
+        self.current = HASHERS[current]
+        self.workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+        self._dummy: Optional[str] = None
+        self._stats = {"hashes": 0, "verifies": 0, "rehashes_needed": 0}
+
+    def _run(self, fn, *args):
+        if self.workers <= 0:
+            return fn(*args)
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            pool = self._pool
+        return pool.submit(fn, *args).result()
+
+    def hash(self, password: str) -> str:
+        self._stats["hashes"] += 1
+        return self._run(_hash, self.current.name, password)
+
+    def verify(self, password: str, stored: Optional[str]) -> bool:
+        """
+        Check a password against a stored hash. A missing or unreadable
+        hash is checked against a dummy one, so unknown IDs take as long
+        as wrong passwords.
+        """
+        self._stats["verifies"] += 1
+        hasher = identify(stored) if stored else None
+        if hasher is None:
+            if self._dummy is None:
+                self._dummy = self.current.hash("")
+            self._run(_verify, self.current.name, password, self._dummy)
+            return False
+        return self._run(_verify, hasher.name, password, stored)
+
+    def needs_update(self, stored: str) -> bool:
+        hasher = identify(stored)
+        needed = hasher is not self.current or self.current.needs_update(stored)
+        if needed:
+            self._stats["rehashes_needed"] += 1
+        return needed
+
+    def shutdown(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            **self._stats,
+            "hasher": self.current.name,
+            "workers": self.workers,
+        }
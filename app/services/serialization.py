@@ -0,0 +1,112 @@
+# app/services/serialization.py
+import json
+from datetime import date, datetime
+from typing import Any, Iterator, List
+
+import numpy as np
+import pandas as pd
+from fastapi import Response
+from pandas.api.types import is_datetime64_any_dtype
+
+from app.services.frames import TIMESTAMP_RAW_COLUMN
+
+try:
+    import orjson
+except ImportError:  # optional: falls back to the stdlib encoder
+    orjson = None
+
+ISO_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+
+def _default(value: Any):
+    """
+    Encoder hook for values the fast paths do not know (numpy scalars,
+    Timestamps left in object columns).
+    """
+    if isinstance(value, np.generic):
+        value = value.item()
+        if isinstance(value, float) and value != value:
+            return None
+        return value
+    if value is pd.NaT:
+        return None
+    if isinstance(value, (datetime, date)):
+        return value.strftime(ISO_FORMAT) if isinstance(value, datetime) else value.isoformat()
+    return str(value)
+
+
+def dumps(obj: Any) -> bytes:
+    """
+    Compact UTF-8 JSON, the same bytes FastAPI/pydantic would produce.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default)
+    return json.dumps(
+        obj, default=_default, ensure_ascii=False, separators=(",", ":"), allow_nan=False
+    ).encode("utf-8")
+
+
+def _column_values(col: pd.Series) -> list:
+    if is_datetime64_any_dtype(col):
+        # numpy's formatter is much faster than Series.dt.strftime
+        values = np.datetime_as_string(col.to_numpy(dtype="datetime64[s]")).tolist()
+    else:
+        values = col.tolist()
+    missing = col.isna()
+    if missing.any():
+        values = [None if m else v for v, m in zip(values, missing.tolist())]
+    return values
+
+
+def frame_to_records(df: pd.DataFrame) -> List[dict]:
+    """
+    Convert a DataFrame to a list of row dicts column by column (no
+    iterrows). datetime64 becomes "YYYY-MM-DDTHH:MM:SS"; NaN/NaT become None,
+    except a Timestamp that did not parse, which is served as its original
+    text. Internal columns (names starting with "_") are left out.
+    """
+    if df.empty:
+        return []
+    positions = [i for i, c in enumerate(df.columns) if not str(c).startswith("_")]
+    names = [str(df.columns[i]) for i in positions]
+    columns = [_column_values(df.iloc[:, i]) for i in positions]
+    if "Timestamp" in names and TIMESTAMP_RAW_COLUMN in df.columns:
+        i = names.index("Timestamp")
+        raw = df[TIMESTAMP_RAW_COLUMN].tolist()
+        columns[i] = [r if v is None else v for v, r in zip(columns[i], raw)]
+    return [dict(zip(names, row)) for row in zip(*columns)]
+
+
+def records_response(df: pd.DataFrame, headers: dict = None) -> Response:
+    """
+    JSON response in the list endpoints' [{"data": {...}}, ...] shape.
+    """
+    body = [{"data": row} for row in frame_to_records(df)]
+    return Response(content=dumps(body), media_type="application/json", headers=headers)
+
+
+def delta_response(
+    df: pd.DataFrame, removed: List[str], version: str, full: bool, headers: dict = None
+) -> Response:
+    """
+    Response for `since=` requests: {"version", "full", "upserts", "removed"}.
+    `upserts` are rows added or changed since the client's version (every
+    row when `full` is true); `removed` are Record_IDs that changed and no
+    longer belong in the list.
+    """
+    body = {
+        "version": version,
+        "full": full,
+        "upserts": [{"data": row} for row in frame_to_records(df)],
+        "removed": removed,
+    }
+    return Response(content=dumps(body), media_type="application/json", headers=headers)
+
+
+def ndjson_lines(df: pd.DataFrame, chunk_rows: int = 500) -> Iterator[bytes]:
+    """
+    Yield {"data": {...}} lines, converting `chunk_rows` rows at a time.
+    """
+    for start in range(0, len(df), chunk_rows):
+        rows = frame_to_records(df.iloc[start:start + chunk_rows])
+        yield b"".join(dumps({"data": row}) + b"\n" for row in rows)
@@ -0,0 +1,411 @@
+# app/services/sheet_cache.py
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.services.time_index import TimeIndex
+
+
+class SheetSnapshot:
+    """
+    In-memory copy of one worksheet (the output of ws.get_all_records()).
+
+    The DataFrame is built lazily from the records and kept in step with
+    our own writes: an update re-types just the changed row and an append
+    adds one typed row, so a write never re-parses the sheet. `index` maps
+    Record_ID to the position in `records`. Positions are not sheet row numbers: other
+    writers may add or remove rows at any time, so writes resolve the row by
+    Record_ID when they are flushed (see SheetWriteQueue).
+
+    `row_versions[pos]` is the sheet version at which that row was added or
+    last changed. A reload compares each row's hash with the row of the same
+    Record_ID in the previous snapshot, so unchanged rows keep their old
+    version; `changes_since()` relies on this. The rows that differ are kept
+    in `added` (positions) and `modified` ((position, previous record));
+    `removed` tells whether Record_IDs disappeared.
+
+    Time-window queries go through a TimeIndex (rows sorted by Timestamp,
+    overall and per agent), built on first use and extended by appends.
+    """
+
+    def __init__(
+        self,
+        records: List[dict],
+        version: int,
+        build_frame: Callable[[List[dict]], pd.DataFrame],
+        previous: Optional["SheetSnapshot"] = None,
+    ):
+        self.records = records
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self._build_frame = build_frame
+        self._df: Optional[pd.DataFrame] = None
+        self.lock = threading.RLock()
+        self.headers: List[str] = list(records[0].keys()) if records else []
+        self.index: Dict[str, int] = {}
+        for pos, record in enumerate(records):
+            # First occurrence wins, like the old boolean-mask lookups
+            self.index.setdefault(self._key(record.get("Record_ID", "")), pos)
+        self.hashes: List[int] = [self._hash(record) for record in records]
+        self.row_versions: List[int] = [version] * len(records)
+        self.added: List[int] = []
+        self.removed = False
+        self._time_index: Optional[TimeIndex] = None
+        self.modified: List[Tuple[int, dict]] = []
+        # Oldest version a delta can be computed from; rows removed from the
+        # sheet cannot be expressed as a delta, so that resets it
+        self.base_version = version
+        self.changed = True
+        if previous is not None:
+            self._carry_versions(previous)
+
+    def _carry_versions(self, previous: "SheetSnapshot"):
+        with previous.lock:
+            for pos, record in enumerate(self.records):
+                old = previous.index.get(self._key(record.get("Record_ID", "")))
+                if old is None:
+                    self.added.append(pos)
+                elif previous.hashes[old] == self.hashes[pos]:
+                    self.row_versions[pos] = previous.row_versions[old]
+                else:
+                    self.modified.append((pos, dict(previous.records[old])))
+            removed = any(key not in self.index for key in previous.index)
+            self.removed = removed
+            if not removed:
+                self.base_version = previous.base_version
+            self.changed = bool(removed or self.added or self.modified) or (
+                len(self.records) != len(previous.records)
+            )
+
+    @staticmethod
+    def _key(record_id) -> str:
+        return str(record_id).strip()
+
+    @staticmethod
+    def _hash(record: dict) -> int:
+        return hash(tuple(record.items()))
+
+    def age(self) -> float:
+        return time.monotonic() - self.loaded_at
+
+    def _patch_frame(self, pos: int):
+        """
+        Bring row `pos` of the built frame in line with its record, typed by
+        the same build_frame as the rest. A position past the end appends the
+        row. Anything that does not fit the frame (new column, a value the
+        column's dtype cannot hold) drops it, to be rebuilt on next use.
+        """
+        df = self._df
+        if df is None:
+            return
+        row = self._build_frame([self.records[pos]])
+        if list(row.columns) != list(df.columns):
+            self._df = None
+            return
+        try:
+            if pos == len(df):
+                frame = pd.concat([df, row], ignore_index=True)
+                for column in df.columns:
+                    # concat of two categoricals with different categories
+                    # falls back to object; keep the column categorical
+                    if isinstance(df[column].dtype, pd.CategoricalDtype) and not isinstance(
+                        frame[column].dtype, pd.CategoricalDtype
+                    ):
+                        frame[column] = frame[column].astype(str).astype("category")
+                self._df = frame
+                return
+            for column in row.columns:
+                value = row[column].iloc[0]
+                if isinstance(df[column].dtype, pd.CategoricalDtype) and (
+                    value not in df[column].cat.categories
+                ):
+                    df[column] = df[column].cat.add_categories([value])
+                df.iat[pos, df.columns.get_loc(column)] = value
+        except (TypeError, ValueError):
+            self._df = None
+
+    def view(self) -> pd.DataFrame:
+        """
+        Return the shared DataFrame itself, for read-only queries (masks,
+        sums) whose results are new frames anyway. Do not mutate it.
+        """
+        with self.lock:
+            # Built once per snapshot version and shared by every reader
+            if self._df is None:
+                self._df = self._build_frame(self.records)
+            return self._df
+
+    def frame(self) -> pd.DataFrame:
+        """
+        Return a copy of the snapshot as a DataFrame (callers may mutate it).
+        """
+        return self.view().copy()
+
+    def since(self, cutoff: datetime, agent: Optional[str] = None) -> np.ndarray:
+        """
+        Positions of rows with Timestamp >= cutoff (and Agent Name == agent,
+        ignoring surrounding spaces, if given), in sheet order.
+        """
+        with self.lock:
+            if self._time_index is None:
+                parsed = None
+                if self._df is not None and "Timestamp" in self._df.columns:
+                    parsed = self._df["Timestamp"]
+                self._time_index = TimeIndex.from_records(self.records, parsed)
+            return self._time_index.since(cutoff, agent)
+
+    def rows(self, positions) -> pd.DataFrame:
+        """
+        DataFrame of the given rows: a slice of the frame when it is built,
+        otherwise built from just those records.
+        """
+        with self.lock:
+            if self._df is not None:
+                return self._df.iloc[positions]
+            return self._build_frame([self.records[pos] for pos in positions])
+
+    def position(self, record_id: str) -> Optional[int]:
+        with self.lock:
+            return self.index.get(self._key(record_id))
+
+    def get(self, record_id: str) -> Optional[dict]:
+        """
+        Return a copy of the row with this Record_ID, or None.
+        """
+        with self.lock:
+            pos = self.index.get(self._key(record_id))
+            if pos is None:
+                return None
+            return dict(self.records[pos])
+
+    def append(self, record: dict) -> int:
+        """
+        Add a new row and return its position. A Record_ID that is already
+        present (e.g. picked up by a refresh) is not added twice.
+        """
+        with self.lock:
+            existing = self.index.get(self._key(record.get("Record_ID", "")))
+            if existing is not None:
+                return existing
+            if not self.headers:
+                self.headers = list(record.keys())
+            self.records.append(dict(record))
+            self.hashes.append(self._hash(record))
+            self.row_versions.append(self.version)
+            pos = len(self.records) - 1
+            self.index.setdefault(self._key(record.get("Record_ID", "")), pos)
+            if self._time_index is not None:
+                self._time_index.append(
+                    pos, record.get("Timestamp", ""), record.get("Agent Name", "")
+                )
+            self._patch_frame(pos)
+            return pos
+
+    def mark(self, record_id: str, version: int):
+        """
+        Record that a row changed at `version`.
+        """
+        with self.lock:
+            pos = self.index.get(self._key(record_id))
+            if pos is not None:
+                self.row_versions[pos] = version
+
+    def changes_since(self, version: int) -> Optional[Set[str]]:
+        """
+        Record_IDs added or changed after `version`, or None when no delta
+        can be computed from it (too old, or from the future).
+        """
+        with self.lock:
+            if version < self.base_version or version > self.version:
+                return None
+            return {
+                self._key(record.get("Record_ID", ""))
+                for record, row_version in zip(self.records, self.row_versions)
+                if row_version > version
+            }
+
+    def update(self, record_id: str, values: dict) -> Optional[dict]:
+        """
+        Apply `values` to the record with the given Record_ID.
+        Returns the updated record, or None if it is not in the snapshot.
+        """
+        with self.lock:
+            pos = self.index.get(self._key(record_id))
+            if pos is None:
+                return None
+            record = self.records[pos]
+            record.update(values)
+            self.hashes[pos] = self._hash(record)
+            if "Timestamp" in values or "Agent Name" in values:
+                self._time_index = None
+            self._patch_frame(pos)
+            return dict(record)
+
+
+class SheetCache:
+    """
+    Per-worksheet snapshot cache with a TTL.
+
+    Every local write, and every load that finds different data, bumps the
+    worksheet's version counter, so callers can tell whether the data they
+    hold is still current. Versions are per process; `token()` prefixes
+    them with a random epoch so they can be handed to clients (ETags,
+    delta cursors) without colliding across workers or restarts.
+
+    Loads are single-flight: while one caller is fetching a worksheet, other
+    callers asking for it wait for that fetch instead of starting their own.
+
+    Functions in `listeners` are called as fn(key, snapshot) after a reload
+    finds data that differs from the previous snapshot, from the thread that
+    did the reload.
+    """
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self.epoch = uuid.uuid4().hex[:12]
+        self._snapshots: Dict[str, SheetSnapshot] = {}
+        # Invalidated snapshots, kept so the next load can carry row versions
+        self._retired: Dict[str, SheetSnapshot] = {}
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, Future] = {}
+        self.listeners: List[Callable[[str, SheetSnapshot], None]] = []
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "writes": 0,
+            "invalidations": 0,
+        }
+
+    def _next_version(self, key: str) -> int:
+        self._versions[key] = self._versions.get(key, 0) + 1
+        return self._versions[key]
+
+    def is_fresh(self, snapshot: Optional[SheetSnapshot]) -> bool:
+        return snapshot is not None and snapshot.age() < self.ttl_seconds
+
+    def get(
+        self,
+        key: str,
+        fetch: Callable[[], List[dict]],
+        build_frame: Callable[[List[dict]], pd.DataFrame],
+        force: bool = False,
+    ) -> SheetSnapshot:
+        """
+        Return the cached snapshot for `key`, calling `fetch` when it is
+        missing or older than the TTL (or always, with `force`). Concurrent
+        callers share one fetch.
+        """
+        leader = False
+        with self._lock:
+            snapshot = self._snapshots.get(key)
+            if not force and self.is_fresh(snapshot):
+                self._stats["hits"] += 1
+                return snapshot
+            inflight = self._inflight.get(key)
+            if inflight is not None:
+                self._stats["coalesced"] += 1
+            else:
+                self._stats["misses"] += 1
+                inflight = self._inflight[key] = Future()
+                leader = True
+
+        if not leader:
+            return inflight.result()
+
+        try:
+            records = fetch()
+            with self._lock:
+                previous = self._snapshots.get(key) or self._retired.pop(key, None)
+                current = self._versions.get(key, 0)
+                snapshot = SheetSnapshot(records, current + 1, build_frame, previous)
+                if snapshot.changed or previous.version != current:
+                    self._next_version(key)
+                else:
+                    # Same data as before: keep the version (and the ETags)
+                    snapshot.version = current
+                self._snapshots[key] = snapshot
+            inflight.set_result(snapshot)
+        except BaseException as e:
+            inflight.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+        if previous is not None and snapshot.changed:
+            for listener in list(self.listeners):
+                listener(key, snapshot)
+        return snapshot
+
+    def peek(self, key: str) -> Optional[SheetSnapshot]:
+        """
+        Return the snapshot for `key` without fetching, even if it is stale.
+        """
+        with self._lock:
+            return self._snapshots.get(key)
+
+    def bump(self, key: str, record_id: Optional[str] = None) -> int:
+        """
+        Record a local write to `key` (to the row `record_id`, if given) and
+        return the new version.
+        """
+        with self._lock:
+            self._stats["writes"] += 1
+            version = self._next_version(key)
+            snapshot = self._snapshots.get(key)
+            if snapshot is not None:
+                snapshot.version = version
+                if record_id is not None:
+                    snapshot.mark(record_id, version)
+            return version
+
+    def version(self, key: str) -> int:
+        with self._lock:
+            return self._versions.get(key, 0)
+
+    def token(self, version: int) -> str:
+        return f"{self.epoch}.{version}"
+
+    def parse_token(self, token: str) -> Optional[int]:
+        """
+        Version encoded in a token from this process, else None.
+        """
+        epoch, _, version = str(token).rpartition(".")
+        if epoch != self.epoch or not version.isdigit():
+            return None
+        return int(version)
+
+    def invalidate(self, key: Optional[str] = None):
+        with self._lock:
+            self._stats["invalidations"] += 1
+            keys = list(self._snapshots) if key is None else [key]
+            for k in keys:
+                snapshot = self._snapshots.pop(k, None)
+                if snapshot is not None:
+                    self._retired[k] = snapshot
+
+    def stats(self) -> dict:
+        with self._lock:
+            served = self._stats["hits"] + self._stats["coalesced"]
+            lookups = served + self._stats["misses"]
+            return {
+                **self._stats,
+                "hit_ratio": (served / lookups) if lookups else 0.0,
+                "ttl_seconds": self.ttl_seconds,
+                "sheets": {
+                    key: {
+                        "version": snapshot.version,
+                        "rows": len(snapshot.records),
+                        "age_seconds": round(snapshot.age(), 3),
+                    }
+                    for key, snapshot in self._snapshots.items()
+                },
+            }
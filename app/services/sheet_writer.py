@@ -0,0 +1,348 @@
+# app/services/sheet_writer.py
+import threading
+import time
+from collections import OrderedDict
+from contextlib import nullcontext
+from typing import Any, Callable, ContextManager, Dict, List, Optional, Set, Tuple
+
+from gspread.utils import rowcol_to_a1
+
+from app.services.sheets_quota import is_permanent
+
+# Records whose writes were dropped, remembered for confirm() callers
+LOST_RECORDS_KEPT = 10000
+
+
+class SheetWriteQueue:
+    """
+    Write-behind queue for worksheet mutations.
+
+    Cell updates are keyed by (Record_ID, column header) and merged so only
+    the latest value is sent; appends are grouped. A background thread
+    flushes everything as one append_rows + one batch_update per worksheet,
+    either every `flush_interval` seconds or as soon as `max_pending`
+    mutations are queued.
+
+    Row numbers are never queued. At flush time `resolve_rows(sheet)` reads
+    the sheet's current (headers, {Record_ID: row number}) and each update
+    goes to the row that holds its Record_ID then, so rows added or removed
+    in the meantime (another worker, an edit in Google Sheets, archiving)
+    cannot redirect an update to another customer's row. `row_guard()` is
+    held from that lookup until the batch_update returns. Updates whose
+    Record_ID is no longer on the sheet are handed to
+    `on_orphaned(sheet, {Record_ID: {column: value}})`, which returns the
+    Record_IDs it took care of (e.g. restored from the archive); the rest
+    are dropped and counted.
+
+    An append that failed may still have been applied by Google, so before
+    a requeued append is sent again the sheet is checked for its Record_IDs
+    and rows already there are skipped; `append_row(check_present=True)`
+    asks for the same check up front.
+
+    A sheet whose batch Google rejects outright (4xx other than 429) is
+    retried `max_attempts` times and then dropped; other failures are
+    retried with exponential backoff up to `max_backoff` seconds.
+
+    Every mutation gets a ticket (a sequence number); `confirmed_seq` is the
+    highest ticket whose flush has finished. Dropped writes (orphaned rows
+    nobody restored, rejected batches) are not confirmed: `confirm()` tells,
+    per record, whether its latest write is stored, still queued, or lost.
+    """
+
+    def __init__(
+        self,
+        get_ws: Callable[[str], Any],
+        resolve_rows: Callable[[str], Tuple[List[str], Dict[str, int]]],
+        flush_interval: float,
+        max_pending: int,
+        row_guard: Optional[Callable[[], ContextManager]] = None,
+        on_orphaned: Optional[Callable[[str, Dict[str, Dict[str, Any]]], Set[str]]] = None,
+        max_attempts: int = 3,
+        max_backoff: float = 60.0,
+    ):
+        self._get_ws = get_ws
+        self._resolve_rows = resolve_rows
+        self._row_guard = row_guard or nullcontext
+        self._on_orphaned = on_orphaned
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.max_backoff = max_backoff
+
+        # sheet -> {(Record_ID, column header): value}
+        self._cells: Dict[str, Dict[Tuple[str, str], Any]] = {}
+        # sheet -> [(Record_ID, row values)]
+        self._appends: Dict[str, List[Tuple[str, list]]] = {}
+        # Sheets whose queued appends include ones that failed before
+        self._unconfirmed: Set[str] = set()
+        self._pending = 0
+        self._seq = 0
+        self.confirmed_seq = 0
+        # (sheet, Record_ID) -> ticket of its latest queued write, until flushed
+        self._latest: Dict[Tuple[str, str], int] = {}
+        # (sheet, Record_ID) -> ticket at which its writes were dropped
+        self._lost: "OrderedDict[Tuple[str, str], int]" = OrderedDict()
+        # sheet -> consecutive rejected flushes
+        self._rejections: Dict[str, int] = {}
+        self._backoff = 0.0
+
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._stats = {
+            "flushes": 0,
+            "failed_flushes": 0,
+            "cells_written": 0,
+            "rows_appended": 0,
+            "merged": 0,
+            "orphaned_cells": 0,
+            "restored_cells": 0,
+            "duplicate_appends_skipped": 0,
+            "dropped_writes": 0,
+            "last_error": None,
+        }
+
+    def _start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(
+                target=self._run, name="sheet-writer", daemon=True
+            )
+            self._thread.start()
+
+    def _enqueued(self, sheet: str, record_id: str) -> int:
+        # Called with self._cond held
+        self._seq += 1
+        self._latest[(sheet, record_id)] = self._seq
+        if self._pending >= self.max_pending:
+            self._cond.notify_all()
+        self._start()
+        return self._seq
+
+    @staticmethod
+    def _key(record_id) -> str:
+        return str(record_id).strip()
+
+    def update_cell(self, sheet: str, record_id: str, column: str, value: Any) -> int:
+        key = (self._key(record_id), column)
+        with self._cond:
+            cells = self._cells.setdefault(sheet, {})
+            if key in cells:
+                self._stats["merged"] += 1
+            else:
+                self._pending += 1
+            cells[key] = value
+            return self._enqueued(sheet, key[0])
+
+    def append_row(self, sheet: str, record_id: str, values: list, check_present: bool = False) -> int:
+        """
+        Queue a new row. With `check_present`, the row is skipped at flush
+        time if its Record_ID is on the sheet by then.
+        """
+        record_id = self._key(record_id)
+        with self._cond:
+            self._appends.setdefault(sheet, []).append((record_id, list(values)))
+            self._pending += 1
+            if check_present:
+                self._unconfirmed.add(sheet)
+            return self._enqueued(sheet, record_id)
+
+    def _run(self):
+        while True:
+            if self._backoff:
+                # Failing: flush on the backoff schedule only
+                time.sleep(self._backoff)
+            else:
+                with self._cond:
+                    self._cond.wait_for(
+                        lambda: self._pending >= self.max_pending,
+                        timeout=self.flush_interval,
+                    )
+            if self.flush():
+                self._backoff = 0.0
+            else:
+                self._backoff = min(
+                    max(self._backoff * 2, self.flush_interval, 1.0), self.max_backoff
+                )
+
+    def flush(self) -> bool:
+        """
+        Send everything queued so far. Returns False if any worksheet call
+        failed; failed mutations are put back and retried on the next flush.
+        """
+        with self._flush_lock:
+            return self._flush()
+
+    def read_through(self, sheet: str, read: Callable[[], Any]):
+        """
+        Flush, then call `read()` while no other flush can run. Returns
+        (read() result, appends still queued for `sheet`, cell updates still
+        queued for it): whatever the flush could not send, or was queued
+        since, so the caller can lay it over the data it just read.
+        """
+        with self._flush_lock:
+            self._flush()
+            result = read()
+            with self._cond:
+                appends = list(self._appends.get(sheet, []))
+                cells = dict(self._cells.get(sheet, {}))
+        return result, appends, cells
+
+    def queued_ids(self, sheet: str) -> Set[str]:
+        """
+        Record_IDs with an append or cell update still queued for `sheet`.
+        """
+        with self._cond:
+            ids = {record_id for record_id, _ in self._appends.get(sheet, [])}
+            ids.update(record_id for record_id, _ in self._cells.get(sheet, {}))
+            return ids
+
+    def _flush(self) -> bool:
+        # Called with self._flush_lock held
+        with self._cond:
+            if not self._pending:
+                return True
+            cells, self._cells = self._cells, {}
+            appends, self._appends = self._appends, {}
+            unconfirmed, self._unconfirmed = self._unconfirmed, set()
+            self._pending = 0
+            batch_seq = self._seq
+
+        ok = True
+        for sheet in set(cells) | set(appends):
+            rows = appends.get(sheet, [])
+            sheet_cells = cells.get(sheet, {})
+            try:
+                ws = self._get_ws(sheet)
+                # Appends first: queued cell updates may target new rows
+                if rows and sheet in unconfirmed:
+                    rows = self._skip_present(sheet, rows)
+                if rows:
+                    ws.append_rows([values for _, values in rows])
+                    self._stats["rows_appended"] += len(rows)
+                    rows = []
+                if sheet_cells:
+                    self._write_cells(sheet, ws, sheet_cells, batch_seq)
+            except Exception as e:
+                self._stats["last_error"] = f"{sheet}: {e}"
+                rejections = self._rejections.get(sheet, 0) + 1 if is_permanent(e) else 0
+                if rejections >= self.max_attempts:
+                    # Google keeps refusing this batch; resending it cannot help
+                    self._rejections.pop(sheet, None)
+                    self._stats["dropped_writes"] += len(rows) + len(sheet_cells)
+                    lost = {record_id for record_id, _ in rows}
+                    lost.update(record_id for record_id, _ in sheet_cells)
+                    self._mark_lost(sheet, lost, batch_seq)
+                    continue
+                ok = False
+                self._rejections[sheet] = rejections
+                self._requeue(sheet, rows, sheet_cells)
+            else:
+                self._rejections.pop(sheet, None)
+
+        with self._cond:
+            if ok:
+                self._stats["flushes"] += 1
+                self.confirmed_seq = max(self.confirmed_seq, batch_seq)
+                for key in [k for k, seq in self._latest.items() if seq <= batch_seq]:
+                    seq = self._latest.pop(key)
+                    if self._lost.get(key, seq) < seq:
+                        # A later write of a record that lost an earlier one
+                        del self._lost[key]
+                self._cond.notify_all()
+            else:
+                self._stats["failed_flushes"] += 1
+        return ok
+
+    def _mark_lost(self, sheet: str, record_ids: Set[str], batch_seq: int):
+        with self._cond:
+            for record_id in record_ids:
+                self._lost[(sheet, record_id)] = batch_seq
+                self._lost.move_to_end((sheet, record_id))
+            while len(self._lost) > LOST_RECORDS_KEPT:
+                self._lost.popitem(last=False)
+
+    def _skip_present(self, sheet: str, rows: List[Tuple[str, list]]) -> List[Tuple[str, list]]:
+        _, row_of = self._resolve_rows(sheet)
+        missing = [(record_id, values) for record_id, values in rows if record_id not in row_of]
+        self._stats["duplicate_appends_skipped"] += len(rows) - len(missing)
+        return missing
+
+    def _write_cells(self, sheet: str, ws, cells: Dict[Tuple[str, str], Any], batch_seq: int):
+        with self._row_guard():
+            headers, row_of = self._resolve_rows(sheet)
+            updates = []
+            missing: Dict[str, Dict[str, Any]] = {}
+            for (record_id, column), value in cells.items():
+                row = row_of.get(record_id)
+                if row is None:
+                    missing.setdefault(record_id, {})[column] = value
+                    continue
+                if column not in headers:
+                    continue
+                updates.append(
+                    {"range": rowcol_to_a1(row, headers.index(column) + 1), "values": [[value]]}
+                )
+            if updates:
+                ws.batch_update(updates, raw=False)
+        self._stats["cells_written"] += len(updates)
+        orphaned = len(cells) - len(updates)
+        restored: Set[str] = set()
+        if missing and self._on_orphaned is not None:
+            # Outside row_guard: restoring a row queues new writes
+            restored = self._on_orphaned(sheet, missing)
+            count = sum(len(values) for record_id, values in missing.items() if record_id in restored)
+            self._stats["restored_cells"] += count
+            orphaned -= count
+        if orphaned:
+            # The row was removed (archived, or deleted in Google Sheets)
+            self._stats["orphaned_cells"] += orphaned
+            self._stats["last_error"] = f"{sheet}: {orphaned} update(s) for rows no longer on the sheet"
+            self._mark_lost(sheet, set(missing) - set(restored), batch_seq)
+
+    def _requeue(self, sheet: str, rows: List[Tuple[str, list]], cells: Dict[Tuple[str, str], Any]):
+        with self._cond:
+            if rows:
+                self._appends[sheet] = rows + self._appends.get(sheet, [])
+                self._pending += len(rows)
+                self._unconfirmed.add(sheet)
+            pending_cells = self._cells.setdefault(sheet, {})
+            for key, value in cells.items():
+                # Newer values queued meanwhile win
+                if key not in pending_cells:
+                    pending_cells[key] = value
+                    self._pending += 1
+
+    def confirm(self, sheet: str, record_id: str, timeout: float = 0.0) -> Optional[bool]:
+        """
+        Wait up to `timeout` seconds for the latest write queued for a
+        record to be flushed. Returns True once it is stored in Google
+        Sheets (or nothing is queued for it), False if it was dropped, and
+        None if it is still queued.
+        """
+        key = (sheet, self._key(record_id))
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                ticket = self._latest.get(key)
+                lost = self._lost.get(key)
+                if lost is not None and (ticket is None or lost >= ticket):
+                    return False
+                if ticket is None or ticket <= self.confirmed_seq:
+                    return True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                **self._stats,
+                "pending": self._pending,
+                "last_ticket": self._seq,
+                "confirmed_ticket": self.confirmed_seq,
+                "lost_records": len(self._lost),
+                "backoff_seconds": self._backoff,
+                "flush_interval": self.flush_interval,
+                "max_pending": self.max_pending,
+            }
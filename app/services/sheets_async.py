@@ -0,0 +1,169 @@
+# app/services/sheets_async.py
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Optional, Set
+
+from app.config import (
+    SHEETS_MAX_WORKERS,
+    SHEETS_CALL_TIMEOUT_SECONDS,
+    SHEET_CONFIRM_TIMEOUT_SECONDS,
+)
+from app.services.storage import storage
+
+
+class SheetsTimeoutError(Exception):
+    pass
+
+
+class SheetsExecutor:
+    """
+    Runs blocking gspread calls on a dedicated, size-limited thread pool so
+    async endpoints never block the event loop.
+
+    Calls that take longer than `timeout` raise SheetsTimeoutError to the
+    caller, whose outcome is then unknown: the worker thread cannot be
+    interrupted and may still apply the change. When it does, `on_late` is
+    called with the result on the event loop (e.g. to broadcast it).
+
+    Stats: `completed` and `failed` count calls that returned or raised in
+    the worker (late ones included); `timeouts` counts callers that gave up
+    waiting, and `late_completions` those calls that later succeeded.
+    `late_callback_failures` counts `on_late` callbacks that raised.
+    """
+
+    def __init__(self, max_workers: int, timeout: float):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="sheets-io"
+        )
+        self._lock = threading.Lock()
+        self._stats = {
+            "submitted": 0,
+            "started": 0,
+            "completed": 0,
+            "failed": 0,
+            "timeouts": 0,
+            "late_completions": 0,
+            "late_callback_failures": 0,
+            "max_queue_depth": 0,
+        }
+        # Running on_late callbacks; the loop only keeps weak references
+        self._late_tasks: Set[asyncio.Task] = set()
+        self._total_wait = 0.0
+        self._total_run = 0.0
+
+    def _count(self, key: str, n: int = 1):
+        with self._lock:
+            self._stats[key] += n
+
+    async def run(
+        self,
+        fn: Callable[..., Any],
+        *args,
+        timeout: Optional[float] = None,
+        on_late: Optional[Callable[[Any], Awaitable[Any]]] = None,
+    ) -> Any:
+        submitted_at = time.monotonic()
+
+        def call():
+            started_at = time.monotonic()
+            with self._lock:
+                self._stats["started"] += 1
+                self._total_wait += started_at - submitted_at
+            outcome = "failed"
+            try:
+                result = fn(*args)
+                outcome = "completed"
+                return result
+            finally:
+                with self._lock:
+                    self._stats[outcome] += 1
+                    self._total_run += time.monotonic() - started_at
+
+        with self._lock:
+            self._stats["submitted"] += 1
+            depth = self._stats["submitted"] - self._stats["started"]
+            self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], depth)
+
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._pool, call)
+        try:
+            # Shielded, so the call's result is still delivered after a timeout
+            return await asyncio.wait_for(asyncio.shield(future), timeout or self.timeout)
+        except asyncio.TimeoutError as e:
+            self._count("timeouts")
+            future.add_done_callback(lambda f: self._late(f, on_late))
+            raise SheetsTimeoutError(
+                "Google Sheets did not respond in time; the change may still be applied"
+            ) from e
+
+    def _late(self, future: asyncio.Future, on_late):
+        if future.cancelled() or future.exception() is not None:
+            return
+        self._count("late_completions")
+        if on_late is not None:
+            task = asyncio.ensure_future(on_late(future.result()))
+            self._late_tasks.add(task)
+            task.add_done_callback(self._late_done)
+
+    def _late_done(self, task: asyncio.Task):
+        self._late_tasks.discard(task)
+        # Retrieving the exception also stops "never retrieved" warnings
+        if not task.cancelled() and task.exception() is not None:
+            self._count("late_callback_failures")
+
+    def stats(self) -> dict:
+        with self._lock:
+            started = self._stats["started"]
+            finished = self._stats["completed"] + self._stats["failed"]
+            return {
+                **self._stats,
+                "queue_depth": self._stats["submitted"] - started,
+                "active": started - finished,
+                "max_workers": self.max_workers,
+                "timeout_seconds": self.timeout,
+                "avg_wait_ms": round(1000 * self._total_wait / started, 2) if started else 0.0,
+                "avg_run_ms": round(1000 * self._total_run / finished, 2) if finished else 0.0,
+            }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False)
+
+
+_executor = SheetsExecutor(SHEETS_MAX_WORKERS, SHEETS_CALL_TIMEOUT_SECONDS)
+
+
+def get_executor_stats() -> dict:
+    return _executor.stats()
+
+
+def shutdown():
+    _executor.shutdown()
+
+
+async def create_transaction(sheet: str, data: dict, on_late=None) -> dict:
+    return await _executor.run(storage.create_transaction, sheet, data, on_late=on_late)
+
+
+async def update_status_by_record_id(
+    sheet: str, record_id: str, new_status: str, on_late=None
+):
+    return await _executor.run(
+        storage.update_status_by_record_id, sheet, record_id, new_status, on_late=on_late
+    )
+
+
+async def update_transaction_fields(sheet: str, record_id: str, updates: dict) -> dict:
+    return await _executor.run(
+        storage.update_transaction_fields, sheet, record_id, updates
+    )
+
+
+async def confirm_write(sheet: str, record_id: str) -> Optional[bool]:
+    # Waits on the writer, not on Google: kept off the Sheets pool
+    return await asyncio.to_thread(
+        storage.confirm_write, sheet, str(record_id), SHEET_CONFIRM_TIMEOUT_SECONDS
+    )
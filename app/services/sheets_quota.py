@@ -0,0 +1,248 @@
+# app/services/sheets_quota.py
+import contextvars
+import heapq
+import itertools
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Optional
+
+import requests
+from gspread.exceptions import APIError
+
+# Priorities within a bucket (lower is served first)
+INTERACTIVE = 0
+BACKGROUND = 1
+
+_priority: contextvars.ContextVar = contextvars.ContextVar("sheets_priority", default=INTERACTIVE)
+
+READ_METHODS = {
+    "get_all_records", "get_all_values", "row_values", "col_values", "find",
+    "findall", "acell", "cell", "get", "batch_get",
+}
+WRITE_METHODS = {
+    "append_row", "append_rows", "update", "update_cell", "update_acell",
+    "batch_update", "delete_rows", "insert_row", "insert_rows", "add_worksheet",
+}
+# Writes that must not be sent twice: if Google applied an attempt that then
+# failed with a 5xx or a dropped connection, a retry would add the rows again
+NON_IDEMPOTENT_METHODS = {
+    "append_row", "append_rows", "insert_row", "insert_rows", "delete_rows", "add_worksheet",
+}
+
+
+@contextmanager
+def background():
+    """
+    Run the enclosed Sheets reads at BACKGROUND priority (per thread/task).
+    """
+    token = _priority.set(BACKGROUND)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class TokenBucket:
+    """
+    Token bucket refilled at `per_minute` / 60 tokens a second, holding at
+    most `burst` tokens. Waiting callers are served by (priority, arrival);
+    BACKGROUND callers also leave `reserve` tokens in the bucket, so a
+    refresh never takes the last token an interactive request needs.
+    """
+
+    def __init__(self, name: str, per_minute: float, burst: float, reserve: float = 1.0):
+        if per_minute <= 0:
+            raise ValueError(f"Sheets {name} quota must be more than 0 calls per minute")
+        self.name = name
+        self.per_minute = per_minute
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, burst)
+        self.reserve = min(reserve, self.capacity - 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._waiting: list = []
+        self._arrivals = itertools.count()
+        self._cond = threading.Condition()
+        # Grant times in the last minute, for utilization
+        self._recent: deque = deque()
+        self._stats = {"granted": 0, "waited": 0, "wait_seconds": 0.0, "throttled": 0}
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, priority: int = INTERACTIVE) -> float:
+        """
+        Block until a token is available for this caller; returns the time
+        spent waiting.
+        """
+        started = time.monotonic()
+        with self._cond:
+            ticket = (priority, next(self._arrivals))
+            heapq.heappush(self._waiting, ticket)
+            needed = 1.0 + (self.reserve if priority == BACKGROUND else 0.0)
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if self._waiting[0] == ticket and self._tokens >= needed:
+                    heapq.heappop(self._waiting)
+                    self._tokens -= 1.0
+                    self._recent.append(now)
+                    self._stats["granted"] += 1
+                    waited = now - started
+                    if waited > 0.001:
+                        self._stats["waited"] += 1
+                        self._stats["wait_seconds"] += waited
+                    self._cond.notify_all()
+                    return waited
+                if self._waiting[0] == ticket:
+                    timeout = (needed - self._tokens) / self.rate
+                else:
+                    timeout = None
+                self._cond.wait(timeout)
+
+    def throttle(self):
+        """
+        Google said 429: empty the bucket so every caller slows down.
+        """
+        with self._cond:
+            self._refill(time.monotonic())
+            self._tokens = 0.0
+            self._stats["throttled"] += 1
+
+    def stats(self) -> dict:
+        with self._cond:
+            now = time.monotonic()
+            self._refill(now)
+            while self._recent and self._recent[0] < now - 60:
+                self._recent.popleft()
+            return {
+                **self._stats,
+                "wait_seconds": round(self._stats["wait_seconds"], 3),
+                "per_minute": self.per_minute,
+                "used_last_minute": len(self._recent),
+                "utilization": round(len(self._recent) / self.per_minute, 3) if self.per_minute else 0.0,
+                "tokens": round(self._tokens, 2),
+                "waiting": len(self._waiting),
+            }
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    if isinstance(error, APIError):
+        response = getattr(error, "response", None)
+        code = getattr(response, "status_code", None) or getattr(error, "code", None)
+        return int(code) if code else None
+    if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        # Treated like a 503
+        return 503
+    return None
+
+
+def is_permanent(error: Exception) -> bool:
+    """
+    True for a 4xx other than 429: sending the same request again cannot
+    succeed.
+    """
+    status = _status_code(error)
+    return status is not None and 400 <= status < 500 and status != 429
+
+
+class QuotaScheduler:
+    """
+    Paces Google Sheets API calls through separate read and write token
+    buckets (Google's per-minute read and write quotas are separate, so
+    writes never queue behind reads). Reads made inside `background()` (change
+    polling, the mirror's layout reads) yield to interactive reads.
+
+    429 and 5xx responses are retried up to `max_retries` times with
+    jittered exponential backoff; a 429 also empties the bucket. Calls made
+    with idempotent=False (appends, deletes) are only retried on 429, which
+    Google returns before doing anything.
+    """
+
+    def __init__(
+        self,
+        reads_per_minute: float,
+        writes_per_minute: float,
+        burst: float,
+        max_retries: int,
+        base_delay: float,
+        max_delay: float,
+    ):
+        if max_retries < 0 or base_delay < 0 or max_delay < 0:
+            raise ValueError("Sheets retry settings must not be negative")
+        self.buckets = {
+            "read": TokenBucket("read", reads_per_minute, burst),
+            "write": TokenBucket("write", writes_per_minute, burst),
+        }
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "retries": 0, "failures": 0, "last_error": None}
+
+    def _backoff(self, attempt: int) -> float:
+        cap = min(self.max_delay, self.base_delay * (2 ** attempt))
+        # "Equal jitter": at least half the step, so retries always spread out
+        return cap / 2 + random.uniform(0, cap / 2)
+
+    def call(self, kind: str, fn: Callable, *args, idempotent: bool = True, **kwargs) -> Any:
+        bucket = self.buckets[kind]
+        priority = INTERACTIVE if kind == "write" else _priority.get()
+        with self._lock:
+            self._stats["calls"] += 1
+        for attempt in range(self.max_retries + 1):
+            bucket.acquire(priority)
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                status = _status_code(e)
+                if idempotent:
+                    retryable = status is not None and (status == 429 or status >= 500)
+                else:
+                    retryable = status == 429
+                if not retryable or attempt == self.max_retries:
+                    with self._lock:
+                        self._stats["failures"] += 1
+                        self._stats["last_error"] = f"{kind}: {e}"
+                    raise
+                if status == 429:
+                    bucket.throttle()
+                with self._lock:
+                    self._stats["retries"] += 1
+                time.sleep(self._backoff(attempt))
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        return {**stats, **{kind: b.stats() for kind, b in self.buckets.items()}}
+
+
+class QuotaWorksheet:
+    """
+    gspread Worksheet wrapper whose API methods go through the scheduler.
+    Everything else (title, id, ...) is passed straight through.
+    """
+
+    def __init__(self, ws, scheduler: QuotaScheduler):
+        self._ws = ws
+        self._scheduler = scheduler
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._ws, name)
+        if name in READ_METHODS:
+            kind = "read"
+        elif name in WRITE_METHODS:
+            kind = "write"
+        else:
+            return attr
+
+        idempotent = name not in NON_IDEMPOTENT_METHODS
+
+        def scheduled(*args, **kwargs):
+            return self._scheduler.call(kind, attr, *args, idempotent=idempotent, **kwargs)
+
+        return scheduled
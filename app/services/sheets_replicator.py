@@ -0,0 +1,485 @@
+# app/services/sheets_replicator.py
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from gspread.utils import rowcol_to_a1
+
+from app.config import (
+    SHEETS_MIRROR_ENABLED,
+    SHEETS_MIRROR_INTERVAL_SECONDS,
+    SHEETS_MIRROR_BATCH_SIZE,
+)
+from app.services.sheets_quota import background
+
+STATE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS replication_state (
+    name TEXT PRIMARY KEY,
+    high_water INTEGER NOT NULL DEFAULT 0,
+    owner TEXT,
+    lease_until REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS replication_parked (
+    seq INTEGER PRIMARY KEY,
+    sheet TEXT NOT NULL,
+    record_id TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    parked_at REAL NOT NULL,
+    op TEXT NOT NULL DEFAULT 'update'
+);
+"""
+
+# Columns that tell whether a row on the sheet is the journal's record or a
+# different record that happens to carry the same Record_ID
+IDENTITY_COLUMNS = ("Agent Name", "Name", "Timestamp")
+
+
+class SheetsReplicator:
+    """
+    Mirrors the local journal (see SQLiteStorage) to Google Sheets.
+
+    A background thread reads journal entries after the high-water mark in
+    seq order and applies them in runs: consecutive appends go out as one
+    append_rows per worksheet, consecutive updates as one batch_update per
+    worksheet (latest value per cell wins). The high-water mark is stored
+    in SQLite after every run, so a restart resumes where it stopped.
+    Appends skip Record_IDs already on the sheet when that row holds the
+    same record (IDENTITY_COLUMNS), so replaying a run that was sent but
+    not recorded does not duplicate rows. Journal entries at or below the
+    mark are deleted after each batch.
+
+    A Record_ID already on the sheet with different content is a conflict:
+    before anything has been mirrored it means the sheet had rows the
+    database does not know about (e.g. a database started empty), and the
+    replicator refuses to run; later, the append is parked as a conflict,
+    with every later update of the record, and never expires.
+
+    Updates whose row (or column) is not on the sheet are parked in
+    `replication_parked`, together with every later update of the same
+    record, and retried in order against a fresh layout every
+    `parked_retry` seconds; they are dropped after `parked_ttl` seconds.
+
+    Failures are retried with exponential backoff. With several workers on
+    the host only the holder of a short lease replicates.
+    """
+
+    name = "sheets"
+
+    def __init__(
+        self,
+        db_path: str,
+        get_ws: Callable[[str], Any],
+        interval: float,
+        batch_size: int,
+        max_backoff: float = 60.0,
+        lease_seconds: float = 30.0,
+        parked_retry: float = 300.0,
+        parked_ttl: float = 86400.0,
+    ):
+        self.db_path = db_path
+        self._get_ws = get_ws
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_backoff = max_backoff
+        self.lease_seconds = lease_seconds
+        self.parked_retry = parked_retry
+        self.parked_ttl = parked_ttl
+        self._parked_checked = 0.0
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+        self._conn: Optional[sqlite3.Connection] = None
+        # The connection is shared with stats() callers on request threads
+        self._db_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        # Per worksheet: header row, and Record_ID -> sheet row number
+        self._headers: Dict[str, List[str]] = {}
+        self._rows: Dict[str, Dict[str, int]] = {}
+        self._backoff = 0.0
+        self._stats = {
+            "batches": 0,
+            "rows_appended": 0,
+            "rows_skipped": 0,
+            "cells_written": 0,
+            "missing_rows": 0,
+            "parked_applied": 0,
+            "parked_expired": 0,
+            "conflicts": 0,
+            "failures": 0,
+            "last_error": None,
+            "last_applied_at": None,
+        }
+
+    # Lifecycle
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._conn = sqlite3.connect(
+            self.db_path, timeout=10, isolation_level=None, check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(STATE_SCHEMA)
+        columns = [r[1] for r in self._conn.execute("PRAGMA table_info(replication_parked)")]
+        if "op" not in columns:
+            self._conn.execute(
+                "ALTER TABLE replication_parked ADD COLUMN op TEXT NOT NULL DEFAULT 'update'"
+            )
+        self._conn.execute(
+            "INSERT OR IGNORE INTO replication_state (name) VALUES (?)", (self.name,)
+        )
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sheets-replicator", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        """
+        Stop the thread after one last drain attempt.
+        """
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._wake.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        while True:
+            stopping = self._stop.is_set()
+            try:
+                if self._acquire_lease():
+                    # Layout re-reads yield to interactive reads
+                    with background():
+                        while self._apply_batch() and not self._stop.is_set():
+                            pass
+                        if time.time() - self._parked_checked >= self.parked_retry:
+                            self._retry_parked()
+                self._backoff = 0.0
+            except Exception as e:
+                self._stats["failures"] += 1
+                self._stats["last_error"] = str(e)
+                # Sheet layout may have changed under us; re-read it next time
+                self._headers.clear()
+                self._rows.clear()
+                self._backoff = min(max(self._backoff * 2, self.interval, 1.0), self.max_backoff)
+            if stopping:
+                return
+            self._wake.wait(self._backoff or self.interval)
+            self._wake.clear()
+
+    # State
+
+    def _acquire_lease(self) -> bool:
+        now = time.time()
+        with self._db_lock:
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                owner, lease_until = conn.execute(
+                    "SELECT owner, lease_until FROM replication_state WHERE name = ?",
+                    (self.name,),
+                ).fetchone()
+                mine = owner == self.owner or lease_until < now
+                if mine:
+                    conn.execute(
+                        "UPDATE replication_state SET owner = ?, lease_until = ? WHERE name = ?",
+                        (self.owner, now + self.lease_seconds, self.name),
+                    )
+            finally:
+                conn.execute("COMMIT")
+        return mine
+
+    def _advance(self, seq: int, parked: List[tuple] = ()):
+        """
+        Move the high-water mark to `seq`, parking the (seq, sheet,
+        record_id, payload, op) entries that could not be applied in the
+        same transaction.
+        """
+        now = time.time()
+        with self._db_lock:
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO replication_parked "
+                    "(seq, sheet, record_id, payload, op, parked_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    [(*entry, now) for entry in parked],
+                )
+                conn.execute(
+                    "UPDATE replication_state SET high_water = MAX(high_water, ?) "
+                    "WHERE name = ? AND owner = ?",
+                    (seq, self.name, self.owner),
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        self._stats["last_applied_at"] = now
+
+    def _prune(self):
+        with self._db_lock:
+            self._conn.execute(
+                "DELETE FROM journal WHERE seq <= "
+                "(SELECT high_water FROM replication_state WHERE name = ?)",
+                (self.name,),
+            )
+
+    def _parked_records(self) -> Set[Tuple[str, str]]:
+        with self._db_lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT sheet, record_id FROM replication_parked"
+            ).fetchall()
+        return set(rows)
+
+    # Applying
+
+    def _apply_batch(self) -> bool:
+        """
+        Apply up to `batch_size` entries. Returns True if a full batch was
+        applied (more may be waiting).
+        """
+        with self._db_lock:
+            high_water = self._conn.execute(
+                "SELECT high_water FROM replication_state WHERE name = ?", (self.name,)
+            ).fetchone()[0]
+            entries = self._conn.execute(
+                "SELECT seq, sheet, op, record_id, payload FROM journal "
+                "WHERE seq > ? ORDER BY seq LIMIT ?",
+                (high_water, self.batch_size),
+            ).fetchall()
+        if not entries:
+            return False
+
+        for run in self._runs(entries):
+            parked = []
+            if run[0][2] == "append":
+                parked = self._apply_appends(run, first=high_water == 0)
+            else:
+                parked = self._apply_updates(run)
+            self._advance(run[-1][0], parked)
+        self._prune()
+        self._stats["batches"] += 1
+        return len(entries) == self.batch_size
+
+    @staticmethod
+    def _runs(entries: List[tuple]) -> List[List[tuple]]:
+        runs: List[List[tuple]] = []
+        for entry in entries:
+            if runs and runs[-1][0][2] == entry[2]:
+                runs[-1].append(entry)
+            else:
+                runs.append([entry])
+        return runs
+
+    def _layout(self, sheet: str) -> Tuple[Any, List[str], Dict[str, int]]:
+        ws = self._get_ws(sheet)
+        if sheet not in self._headers:
+            self._headers[sheet] = ws.row_values(1)
+        if sheet not in self._rows:
+            ids = ws.col_values(self._headers[sheet].index("Record_ID") + 1)
+            self._rows[sheet] = {
+                str(v).strip(): pos + 1 for pos, v in enumerate(ids) if pos > 0
+            }
+        return ws, self._headers[sheet], self._rows[sheet]
+
+    @staticmethod
+    def _same_record(ws, headers: List[str], row: int, record: dict) -> bool:
+        values = ws.row_values(row)
+        for header in IDENTITY_COLUMNS:
+            if header not in headers:
+                continue
+            pos = headers.index(header)
+            on_sheet = values[pos] if pos < len(values) else ""
+            if str(on_sheet).strip() != str(record.get(header, "")).strip():
+                return False
+        return True
+
+    def _apply_appends(self, run: List[tuple], first: bool = False) -> List[tuple]:
+        """
+        Append a run of new rows; returns the (seq, sheet, record_id,
+        payload, op) conflicts to park. With `first` (nothing mirrored yet)
+        a conflict raises instead: the sheet holds rows from before the
+        database, and mirroring would interleave two histories.
+        """
+        by_sheet: Dict[str, List[tuple]] = {}
+        for seq, sheet, _, _, payload in run:
+            by_sheet.setdefault(sheet, []).append((seq, payload, json.loads(payload)))
+
+        parked: List[tuple] = []
+        for sheet, entries in by_sheet.items():
+            ws, headers, rows = self._layout(sheet)
+            values = []
+            for seq, payload, record in entries:
+                record_id = str(record.get("Record_ID", "")).strip()
+                row = rows.get(record_id)
+                if row is None:
+                    values.append([record.get(h, "") for h in headers])
+                elif self._same_record(ws, headers, row, record):
+                    # Sent before a crash, but the mark was not recorded
+                    self._stats["rows_skipped"] += 1
+                elif first:
+                    raise RuntimeError(
+                        f"{sheet} Record_ID {record_id} is already on the sheet with "
+                        "different content; refusing to mirror a database that was "
+                        "not bootstrapped from the sheet"
+                    )
+                else:
+                    self._stats["conflicts"] += 1
+                    self._stats["last_error"] = f"{sheet} Record_ID {record_id} conflicts with the sheet"
+                    parked.append((seq, sheet, record_id, payload, "append"))
+            if values:
+                ws.append_rows(values)
+                self._stats["rows_appended"] += len(values)
+                # Row numbers of the new rows are re-read when next needed
+                self._rows.pop(sheet, None)
+        return parked
+
+    def _apply_updates(self, run: List[tuple]) -> List[tuple]:
+        """
+        Apply a run of updates; returns the (seq, sheet, record_id, payload,
+        op) entries to park instead.
+        """
+        parked_ids = self._parked_records()
+        parked: List[tuple] = []
+        by_sheet: Dict[str, Dict[Tuple[str, str], Any]] = {}
+        # (sheet, record_id) -> seq of its last entry in the run
+        last_seq: Dict[Tuple[str, str], int] = {}
+        for seq, sheet, _, record_id, payload in run:
+            record_id = str(record_id)
+            if (sheet, record_id) in parked_ids:
+                # Keep the record's updates in order behind the parked ones
+                parked.append((seq, sheet, record_id, payload, "update"))
+                continue
+            last_seq[(sheet, record_id)] = seq
+            cells = by_sheet.setdefault(sheet, {})
+            for header, value in json.loads(payload).items():
+                cells[(record_id, header)] = value
+
+        for sheet, cells in by_sheet.items():
+            ws, headers, rows = self._layout(sheet)
+            updates = []
+            missing: Dict[str, Dict[str, Any]] = {}
+            for (record_id, header), value in cells.items():
+                row = rows.get(record_id)
+                if row is None or header not in headers:
+                    missing.setdefault(record_id, {})[header] = value
+                    continue
+                updates.append(
+                    {"range": rowcol_to_a1(row, headers.index(header) + 1), "values": [[value]]}
+                )
+            if updates:
+                ws.batch_update(updates, raw=False)
+                self._stats["cells_written"] += len(updates)
+            for record_id, values in missing.items():
+                self._stats["missing_rows"] += len(values)
+                parked.append(
+                    (last_seq[(sheet, record_id)], sheet, record_id, json.dumps(values), "update")
+                )
+        return parked
+
+    def _retry_parked(self):
+        """
+        Apply parked updates whose row and columns are now on the sheet,
+        oldest first, and drop the ones older than `parked_ttl`. Conflicting
+        appends, and the updates behind them, stay parked until resolved by
+        hand.
+        """
+        self._parked_checked = time.time()
+        with self._db_lock:
+            entries = self._conn.execute(
+                "SELECT seq, sheet, record_id, payload, parked_at, op "
+                "FROM replication_parked ORDER BY seq"
+            ).fetchall()
+        if not entries:
+            return
+        # Rows may have been added or moved since the layout was read
+        self._headers.clear()
+        self._rows.clear()
+
+        by_sheet: Dict[str, List[tuple]] = {}
+        for entry in entries:
+            by_sheet.setdefault(entry[1], []).append(entry)
+
+        for sheet, sheet_entries in by_sheet.items():
+            ws, headers, rows = self._layout(sheet)
+            updates, applied, expired = [], [], []
+            blocked: Set[str] = set()
+            conflicts: Set[str] = set()
+            for seq, _, record_id, payload, parked_at, op in sheet_entries:
+                if op == "append" or record_id in conflicts:
+                    conflicts.add(record_id)
+                    continue
+                values = json.loads(payload)
+                row = rows.get(record_id)
+                if record_id in blocked or row is None or any(h not in headers for h in values):
+                    if self._parked_checked - parked_at > self.parked_ttl:
+                        expired.append(seq)
+                    else:
+                        blocked.add(record_id)
+                    continue
+                applied.append(seq)
+                updates.extend(
+                    {"range": rowcol_to_a1(row, headers.index(h) + 1), "values": [[v]]}
+                    for h, v in values.items()
+                )
+            if updates:
+                ws.batch_update(updates, raw=False)
+                self._stats["cells_written"] += len(updates)
+            if applied or expired:
+                with self._db_lock:
+                    self._conn.executemany(
+                        "DELETE FROM replication_parked WHERE seq = ?",
+                        [(seq,) for seq in applied + expired],
+                    )
+            self._stats["parked_applied"] += len(applied)
+            self._stats["parked_expired"] += len(expired)
+            if expired:
+                self._stats["last_error"] = f"dropped {len(expired)} parked {sheet} update(s)"
+
+    def stats(self) -> dict:
+        if self._conn is None:
+            return {**self._stats, "running": False}
+        with self._db_lock:
+            # Applied entries are pruned, so the head comes from the counter
+            head = self._conn.execute(
+                "SELECT COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'journal'), 0)"
+            ).fetchone()[0]
+            parked, conflicted = self._conn.execute(
+                "SELECT COUNT(*), COUNT(*) FILTER (WHERE op = 'append') FROM replication_parked"
+            ).fetchone()
+            high_water, owner = self._conn.execute(
+                "SELECT high_water, owner FROM replication_state WHERE name = ?", (self.name,)
+            ).fetchone()
+        return {
+            **self._stats,
+            "running": self._thread is not None and self._thread.is_alive(),
+            "leader": owner == self.owner,
+            "high_water": high_water,
+            "journal_head": head,
+            "lag": head - high_water,
+            "parked": parked,
+            "parked_conflicts": conflicted,
+            "backoff_seconds": self._backoff,
+        }
+
+
+def create_replicator(storage) -> Optional[SheetsReplicator]:
+    """
+    Sheets mirror for the sqlite storage backend (None for other backends
+    or when SHEETS_MIRROR_ENABLED is off).
+    """
+    if storage.name != "sqlite" or not SHEETS_MIRROR_ENABLED:
+        return None
+    from app.services.google_sheets import get_transactions_ws
+
+    return SheetsReplicator(
+        storage.path,
+        get_transactions_ws,
+        SHEETS_MIRROR_INTERVAL_SECONDS,
+        SHEETS_MIRROR_BATCH_SIZE,
+    )
@@ -0,0 +1,476 @@
+# app/services/sqlite_storage.py
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterator, List, Optional, Set
+
+import pandas as pd
+
+from app.services.frames import parse_charge, parse_timestamp, type_columns
+from app.services.google_sheets import (
+    EDITABLE_FIELDS,
+    build_transaction_row,
+    tz,
+)
+from app.services.night_totals import charged_total, night_window
+from app.services.storage import Storage
+
+# Column layout of Sheet1 / Sheet2, in sheet order
+TRANSACTION_HEADERS = {
+    "spectrum": [
+        "Record_ID", "Agent Name", "Name", "Ph Number", "Address", "Email",
+        "Card Holder Name", "Card Number", "Expiry Date", "CVC", "Charge", "LLC",
+        "Provider", "Date of Charge", "Status", "Timestamp",
+    ],
+    "insurance": [
+        "Record_ID", "Agent Name", "Name", "Ph Number", "Address", "Email",
+        "Card Holder Name", "Card Number", "Expiry Date", "CVC", "Charge", "LLC",
+        "Date of Charge", "Status", "Timestamp",
+    ],
+}
+
+# Sheet header -> SQL column
+COLUMNS = {
+    "Record_ID": "record_id",
+    "Agent Name": "agent_name",
+    "Name": "name",
+    "Ph Number": "ph_number",
+    "Address": "address",
+    "Email": "email",
+    "Card Holder Name": "card_holder_name",
+    "Card Number": "card_number",
+    "Expiry Date": "expiry_date",
+    "CVC": "cvc",
+    "Charge": "charge",
+    "LLC": "llc",
+    "Provider": "provider",
+    "Date of Charge": "date_of_charge",
+    "Status": "status",
+    "Timestamp": "timestamp",
+}
+
+# Sortable form of Timestamp, used by the indexes and range queries
+SORT_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transactions (
+    sheet TEXT NOT NULL,
+    record_id INTEGER NOT NULL,
+    agent_name TEXT NOT NULL DEFAULT '',
+    name TEXT NOT NULL DEFAULT '',
+    ph_number TEXT NOT NULL DEFAULT '',
+    address TEXT NOT NULL DEFAULT '',
+    email TEXT NOT NULL DEFAULT '',
+    card_holder_name TEXT NOT NULL DEFAULT '',
+    card_number TEXT NOT NULL DEFAULT '',
+    expiry_date TEXT NOT NULL DEFAULT '',
+    cvc INTEGER NOT NULL DEFAULT 0,
+    charge TEXT NOT NULL DEFAULT '',
+    llc TEXT NOT NULL DEFAULT '',
+    provider TEXT,
+    date_of_charge TEXT NOT NULL DEFAULT '',
+    status TEXT NOT NULL DEFAULT 'Pending',
+    timestamp TEXT NOT NULL DEFAULT '',
+    ts TEXT,
+    charge_amount REAL NOT NULL DEFAULT 0,
+    row_version INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (sheet, record_id)
+);
+CREATE INDEX IF NOT EXISTS ix_transactions_status ON transactions (sheet, status);
+CREATE INDEX IF NOT EXISTS ix_transactions_ts ON transactions (sheet, ts);
+DROP INDEX IF EXISTS ix_transactions_agent_ts;
+CREATE INDEX IF NOT EXISTS ix_transactions_agent_trim_ts ON transactions (sheet, TRIM(agent_name), ts);
+CREATE INDEX IF NOT EXISTS ix_transactions_version ON transactions (sheet, row_version);
+CREATE TABLE IF NOT EXISTS sheet_versions (
+    sheet TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS journal (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    sheet TEXT NOT NULL,
+    op TEXT NOT NULL,
+    record_id INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS users (
+    user_id TEXT PRIMARY KEY,
+    password TEXT NOT NULL
+);
+"""
+
+
+def _sort_ts(timestamp: str) -> Optional[str]:
+    parsed = parse_timestamp(timestamp)
+    if pd.isna(parsed):
+        return None
+    return parsed.strftime(SORT_TIMESTAMP_FORMAT)
+
+
+def _record_key(record_id) -> Optional[int]:
+    try:
+        return int(str(record_id).strip())
+    except ValueError:
+        return None
+
+
+class SQLiteStorage(Storage):
+    """
+    Local system of record in one SQLite file (WAL mode), shared by every
+    worker on the host.
+
+    Rows keep the sheet layout (see TRANSACTION_HEADERS) and return the same
+    dicts/DataFrames as the Sheets backend. Extra columns support the hot
+    queries: `ts` (sortable Timestamp) for recent and night-total ranges,
+    `charge_amount` for sums, and `row_version` for `since=` deltas. Each
+    write bumps its sheet's version in the same transaction.
+
+    Every create and update is also appended to `journal` in that same
+    transaction ("append" with the full record, "update" with the changed
+    {header: value}); the Sheets replicator mirrors it to Sheet1/Sheet2.
+
+    A new database is filled from the existing sheets once (see
+    bootstrap()); new Record_IDs continue after the highest ID seen there.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+        # Fixed for the life of the database file, so version tokens are
+        # valid across workers and restarts
+        conn.execute(
+            "INSERT OR IGNORE INTO meta (key, value) VALUES ('epoch', ?)",
+            (uuid.uuid4().hex[:12],),
+        )
+        self.epoch = conn.execute("SELECT value FROM meta WHERE key = 'epoch'").fetchone()[0]
+
+    def _meta(self, key: str, conn: Optional[sqlite3.Connection] = None) -> Optional[str]:
+        row = (conn or self._conn()).execute(
+            "SELECT value FROM meta WHERE key = ?", (key,)
+        ).fetchone()
+        return row[0] if row else None
+
+    @staticmethod
+    def _set_meta(conn: sqlite3.Connection, key: str, value):
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    @property
+    def bootstrapped(self) -> bool:
+        return self._meta("bootstrapped") is not None
+
+    def bootstrap(
+        self,
+        load_records: Callable[[str], List[dict]],
+        load_users: Callable[[], List[dict]],
+    ) -> bool:
+        """
+        One-time import of the Sheets data: every transaction row (archived
+        ones too) and every user. Imported rows are not journaled, since
+        they are already on the sheets. The highest Record_ID per sheet is
+        kept as the floor for new IDs, and marks the rows the replicator
+        must never treat as its own appends.
+
+        Returns True if this call imported. Raises RuntimeError when the
+        database already has rows of its own that were never reconciled
+        with the sheets.
+        """
+        if self.bootstrapped:
+            return False
+        # Read before taking the write lock; another worker may win the race
+        sources = {sheet: load_records(sheet) for sheet in TRANSACTION_HEADERS}
+        users = load_users()
+        with self._transaction() as conn:
+            if self._meta("bootstrapped", conn) is not None:
+                return False
+            if conn.execute("SELECT 1 FROM transactions LIMIT 1").fetchone():
+                raise RuntimeError(
+                    f"{self.path} has transactions that were never imported from "
+                    "Google Sheets; their Record_IDs may clash with the sheet's"
+                )
+            skipped = 0
+            for sheet, records in sources.items():
+                version = self._bump(conn, sheet)
+                floor = 0
+                for record in records:
+                    key = _record_key(record.get("Record_ID", ""))
+                    if key is None:
+                        skipped += 1
+                        continue
+                    floor = max(floor, key)
+                    row = {h: record.get(h, "") for h in TRANSACTION_HEADERS[sheet]}
+                    row["Record_ID"] = key
+                    # Archived copies come first, so the hot row wins
+                    self._insert(conn, sheet, row, version, journal=False)
+                self._set_meta(conn, f"id_floor:{sheet}", floor)
+            conn.executemany(
+                "INSERT OR IGNORE INTO users (user_id, password) VALUES (?, ?)",
+                [(str(u.get("ID", "")), str(u.get("Password", ""))) for u in users if u.get("ID")],
+            )
+            self._set_meta(conn, "bootstrap_skipped", skipped)
+            self._set_meta(conn, "bootstrapped", time.time())
+        return True
+
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per thread (request threads, the Sheets executor)
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    @staticmethod
+    def _check_sheet(sheet: str):
+        if sheet not in TRANSACTION_HEADERS:
+            raise ValueError("sheet must be 'spectrum' or 'insurance'")
+
+    @staticmethod
+    def _bump(conn: sqlite3.Connection, sheet: str) -> int:
+        conn.execute(
+            "INSERT INTO sheet_versions (sheet, version) VALUES (?, 1) "
+            "ON CONFLICT(sheet) DO UPDATE SET version = version + 1",
+            (sheet,),
+        )
+        return conn.execute(
+            "SELECT version FROM sheet_versions WHERE sheet = ?", (sheet,)
+        ).fetchone()[0]
+
+    def _select(self, sheet: str, where: str = "", params: tuple = ()) -> List[tuple]:
+        columns = ", ".join(COLUMNS[h] for h in TRANSACTION_HEADERS[sheet])
+        sql = f"SELECT {columns} FROM transactions WHERE sheet = ?"
+        if where:
+            sql += f" AND {where}"
+        return self._conn().execute(sql + " ORDER BY rowid", (sheet, *params)).fetchall()
+
+    def _frame(self, sheet: str, where: str = "", params: tuple = ()) -> pd.DataFrame:
+        self._check_sheet(sheet)
+        rows = self._select(sheet, where, params)
+        if not rows:
+            return pd.DataFrame()
+        return type_columns(pd.DataFrame.from_records(rows, columns=TRANSACTION_HEADERS[sheet]))
+
+    def _record(self, sheet: str, record_id) -> Optional[dict]:
+        key = _record_key(record_id)
+        if key is None:
+            return None
+        rows = self._select(sheet, "record_id = ?", (key,))
+        if not rows:
+            return None
+        return dict(zip(TRANSACTION_HEADERS[sheet], rows[0]))
+
+    # Transactions
+
+    def create_transaction(self, sheet: str, data: dict) -> dict:
+        self._check_sheet(sheet)
+        now = datetime.now(tz)
+        with self._transaction() as conn:
+            # Never below the highest ID the sheet had when it was imported
+            record_id = conn.execute(
+                "SELECT MAX(COALESCE(MAX(record_id), 0), "
+                "COALESCE((SELECT CAST(value AS INTEGER) FROM meta WHERE key = ?), 0)) + 1 "
+                "FROM transactions WHERE sheet = ?",
+                (f"id_floor:{sheet}", sheet),
+            ).fetchone()[0]
+            row = build_transaction_row(sheet, data, record_id, now)
+            record = dict(zip(TRANSACTION_HEADERS[sheet], row))
+            self._insert(conn, sheet, record, self._bump(conn, sheet))
+        return record
+
+    def _insert(
+        self, conn: sqlite3.Connection, sheet: str, record: dict, version: int, journal: bool = True
+    ):
+        values = {COLUMNS[h]: v for h, v in record.items() if h in COLUMNS}
+        values.update(
+            sheet=sheet,
+            ts=_sort_ts(record.get("Timestamp", "")),
+            charge_amount=parse_charge(record.get("Charge", "")),
+            row_version=version,
+        )
+        names = ", ".join(values)
+        marks = ", ".join("?" for _ in values)
+        verb = "INSERT" if journal else "INSERT OR REPLACE"
+        conn.execute(
+            f"{verb} INTO transactions ({names}) VALUES ({marks})", tuple(values.values())
+        )
+        if journal:
+            self._journal(conn, sheet, "append", record["Record_ID"], record)
+
+    @staticmethod
+    def _journal(conn: sqlite3.Connection, sheet: str, op: str, record_id, payload: dict):
+        conn.execute(
+            "INSERT INTO journal (sheet, op, record_id, payload, created) VALUES (?, ?, ?, ?, ?)",
+            (sheet, op, record_id, json.dumps(payload), time.time()),
+        )
+
+    def _update(self, sheet: str, record_id, changed: dict) -> dict:
+        """
+        Apply {sheet header: value} to one row and return the updated record.
+        """
+        key = _record_key(record_id)
+        values = {COLUMNS[h]: v for h, v in changed.items()}
+        if "Charge" in changed:
+            values["charge_amount"] = parse_charge(changed["Charge"])
+        with self._transaction() as conn:
+            exists = key is not None and conn.execute(
+                "SELECT 1 FROM transactions WHERE sheet = ? AND record_id = ?", (sheet, key)
+            ).fetchone()
+            if not exists:
+                raise ValueError("Record not found")
+            values["row_version"] = self._bump(conn, sheet)
+            assignments = ", ".join(f"{name} = ?" for name in values)
+            conn.execute(
+                f"UPDATE transactions SET {assignments} WHERE sheet = ? AND record_id = ?",
+                (*values.values(), sheet, key),
+            )
+            self._journal(conn, sheet, "update", key, changed)
+        return self._record(sheet, key)
+
+    def update_status_by_record_id(self, sheet: str, record_id: str, new_status: str) -> dict:
+        self._check_sheet(sheet)
+        return self._update(sheet, record_id, {"Status": new_status})
+
+    def update_transaction_fields(self, sheet: str, record_id: str, updates: dict) -> dict:
+        self._check_sheet(sheet)
+        changed = {}
+        for key, value in updates.items():
+            col_name = EDITABLE_FIELDS.get(key)
+            if col_name is None or col_name not in TRANSACTION_HEADERS[sheet]:
+                # e.g. Provider does not exist on insurance sheet
+                continue
+            changed[col_name] = value if value is not None else ""
+        if changed:
+            record = self._update(sheet, record_id, changed)
+        else:
+            record = self._record(sheet, record_id)
+            if record is None:
+                raise ValueError("Record not found")
+        record["Record_ID"] = str(record["Record_ID"])
+        return record
+
+    def get_record_by_id(self, sheet: str, record_id: str) -> dict:
+        self._check_sheet(sheet)
+        record = self._record(sheet, record_id)
+        if record is None:
+            return {}
+        record["Record_ID"] = str(record["Record_ID"])
+        return record
+
+    def get_pending_transactions(self, sheet: str) -> pd.DataFrame:
+        return self._frame(sheet, "status = 'Pending'")
+
+    def get_recent_transactions(
+        self, sheet: str, minutes: int, agent_name: Optional[str] = None
+    ) -> pd.DataFrame:
+        now = datetime.now(tz).replace(tzinfo=None)
+        cutoff = (now - timedelta(minutes=minutes)).strftime(SORT_TIMESTAMP_FORMAT)
+        if agent_name and agent_name.strip():
+            # Surrounding spaces are ignored, like the Sheets backend
+            return self._frame(
+                sheet, "TRIM(agent_name) = ? AND ts >= ?", (agent_name.strip(), cutoff)
+            )
+        return self._frame(sheet, "ts >= ?", (cutoff,))
+
+    def get_all_transactions(self, sheet: str) -> pd.DataFrame:
+        return self._frame(sheet)
+
+    def load_sheet_df(self, sheet: str) -> pd.DataFrame:
+        return self._frame(sheet)
+
+    def get_night_charged_total(self, sheet: Optional[str] = None) -> float:
+        sheets = [sheet] if sheet in TRANSACTION_HEADERS else list(TRANSACTION_HEADERS)
+        window = night_window(datetime.now(tz).replace(tzinfo=None))
+        marks = ", ".join("?" for _ in sheets)
+        row = self._conn().execute(
+            "SELECT COALESCE(SUM(charge_amount), 0) FROM transactions "
+            f"WHERE sheet IN ({marks}) AND status = 'Charged' AND ts BETWEEN ? AND ?",
+            (*sheets, *(w.strftime(SORT_TIMESTAMP_FORMAT) for w in window)),
+        ).fetchone()
+        return float(row[0])
+
+    def recompute_night_charged_total(self, sheet: Optional[str] = None) -> float:
+        sheets = [sheet] if sheet in TRANSACTION_HEADERS else list(TRANSACTION_HEADERS)
+        window = night_window(datetime.now(tz).replace(tzinfo=None))
+        return float(sum(charged_total(self._frame(s), window) for s in sheets))
+
+    # Versions (ETag / since=)
+
+    def _version(self, sheet: str) -> int:
+        row = self._conn().execute(
+            "SELECT version FROM sheet_versions WHERE sheet = ?", (sheet,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def get_sheet_token(self, sheet: str) -> str:
+        self._check_sheet(sheet)
+        return f"{self.epoch}.{self._version(sheet)}"
+
+    def get_changes_since(self, sheet: str, token: str) -> Optional[Set[str]]:
+        epoch, _, version = str(token).rpartition(".")
+        if epoch != self.epoch or not version.isdigit() or int(version) > self._version(sheet):
+            return None
+        rows = self._conn().execute(
+            "SELECT record_id FROM transactions WHERE sheet = ? AND row_version > ?",
+            (sheet, int(version)),
+        ).fetchall()
+        return {str(r[0]) for r in rows}
+
+    # Users
+
+    def load_users(self) -> List[dict]:
+        rows = self._conn().execute("SELECT user_id, password FROM users ORDER BY rowid")
+        return [{"ID": user_id, "Password": password} for user_id, password in rows]
+
+    def add_user(self, user_id: str, hashed_pw: str):
+        try:
+            with self._transaction() as conn:
+                conn.execute(
+                    "INSERT INTO users (user_id, password) VALUES (?, ?)", (user_id, hashed_pw)
+                )
+        except sqlite3.IntegrityError:
+            raise ValueError("User ID already exists")
+
+    def update_user_hash(self, user_id: str, hashed_pw: str):
+        with self._transaction() as conn:
+            updated = conn.execute(
+                "UPDATE users SET password = ? WHERE user_id = ?", (hashed_pw, user_id)
+            ).rowcount
+        if not updated:
+            raise ValueError("User not found")
+
+    def stats(self) -> Dict[str, object]:
+        rows = self._conn().execute(
+            "SELECT sheet, COUNT(*) FROM transactions GROUP BY sheet"
+        ).fetchall()
+        return {
+            "backend": self.name,
+            "path": self.path,
+            "rows": dict(rows),
+            "versions": {s: self._version(s) for s in TRANSACTION_HEADERS},
+            "bootstrapped": self.bootstrapped,
+            "bootstrap_skipped": int(self._meta("bootstrap_skipped") or 0),
+            "id_floors": {s: int(self._meta(f"id_floor:{s}") or 0) for s in TRANSACTION_HEADERS},
+        }
@@ -0,0 +1,179 @@
+# app/services/storage.py
+from abc import ABC, abstractmethod
+from typing import List, Optional, Set
+
+import pandas as pd
+from gspread.utils import rowcol_to_a1
+
+from app.config import STORAGE_BACKEND, STORAGE_SQLITE_BOOTSTRAP, STORAGE_SQLITE_PATH
+from app.services import google_sheets
+
+
+class Storage(ABC):
+    """
+    System of record for transactions and users.
+
+    Routers, auth, analytics and the async facade only talk to this
+    interface; STORAGE_BACKEND picks the engine. Records are dicts keyed
+    by the sheet headers ("Record_ID", "Agent Name", ...) and lists are
+    DataFrames with those columns, whatever the engine. Bad input raises
+    ValueError with the messages the routers map to 4xx responses.
+    """
+
+    name = "base"
+
+    # Transactions
+    @abstractmethod
+    def create_transaction(self, sheet: str, data: dict) -> dict:
+        raise NotImplementedError
+
+    @abstractmethod
+    def update_transaction_fields(self, sheet: str, record_id: str, updates: dict) -> dict:
+        raise NotImplementedError
+
+    @abstractmethod
+    def update_status_by_record_id(self, sheet: str, record_id: str, new_status: str) -> dict:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_record_by_id(self, sheet: str, record_id: str) -> dict:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_pending_transactions(self, sheet: str) -> pd.DataFrame:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_recent_transactions(
+        self, sheet: str, minutes: int, agent_name: Optional[str] = None
+    ) -> pd.DataFrame:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_all_transactions(self, sheet: str) -> pd.DataFrame:
+        raise NotImplementedError
+
+    @abstractmethod
+    def load_sheet_df(self, sheet: str) -> pd.DataFrame:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_night_charged_total(self, sheet: Optional[str] = None) -> float:
+        raise NotImplementedError
+
+    @abstractmethod
+    def recompute_night_charged_total(self, sheet: Optional[str] = None) -> float:
+        raise NotImplementedError
+
+    # Versions: opaque tokens for ETags and since= deltas
+    @abstractmethod
+    def get_sheet_token(self, sheet: str) -> str:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_changes_since(self, sheet: str, token: str) -> Optional[Set[str]]:
+        raise NotImplementedError
+
+    # Users ({"ID", "Password"} rows)
+    @abstractmethod
+    def load_users(self) -> List[dict]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def add_user(self, user_id: str, hashed_pw: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    def update_user_hash(self, user_id: str, hashed_pw: str):
+        raise NotImplementedError
+
+    def confirm_write(self, sheet: str, record_id: str, timeout: float) -> Optional[bool]:
+        """
+        Whether this process's latest write to a record is stored: True,
+        False (it was dropped), or None (still pending after `timeout`
+        seconds). Engines that store synchronously are always True.
+        """
+        return True
+
+    def stats(self) -> dict:
+        return {"backend": self.name}
+
+
+class SheetsStorage(Storage):
+    """
+    Google Sheets as the system of record (Sheet1/Sheet2/Sheet3), through
+    the cached, write-behind functions in app.services.google_sheets.
+    """
+
+    name = "sheets"
+
+    def create_transaction(self, sheet, data):
+        return google_sheets.create_transaction(sheet, data)
+
+    def update_transaction_fields(self, sheet, record_id, updates):
+        return google_sheets.update_transaction_fields(sheet, record_id, updates)
+
+    def update_status_by_record_id(self, sheet, record_id, new_status):
+        return google_sheets.update_status_by_record_id(sheet, record_id, new_status)
+
+    def get_record_by_id(self, sheet, record_id):
+        return google_sheets.get_record_by_id(sheet, record_id)
+
+    def confirm_write(self, sheet, record_id, timeout):
+        return google_sheets.confirm_write(sheet, record_id, timeout)
+
+    def get_pending_transactions(self, sheet):
+        return google_sheets.get_pending_transactions(sheet)
+
+    def get_recent_transactions(self, sheet, minutes, agent_name=None):
+        return google_sheets.get_recent_transactions(sheet, minutes, agent_name)
+
+    def get_all_transactions(self, sheet):
+        return google_sheets.get_all_transactions(sheet)
+
+    def load_sheet_df(self, sheet):
+        return google_sheets.load_sheet_df(sheet)
+
+    def get_night_charged_total(self, sheet=None):
+        return google_sheets.get_night_charged_total(sheet)
+
+    def recompute_night_charged_total(self, sheet=None):
+        return google_sheets.recompute_night_charged_total(sheet)
+
+    def get_sheet_token(self, sheet):
+        return google_sheets.get_sheet_token(sheet)
+
+    def get_changes_since(self, sheet, token):
+        return google_sheets.get_changes_since(sheet, token)
+
+    def load_users(self):
+        return google_sheets.get_users_ws().get_all_records()
+
+    def add_user(self, user_id, hashed_pw):
+        google_sheets.get_users_ws().append_row([user_id, hashed_pw])
+
+    def update_user_hash(self, user_id, hashed_pw):
+        ws = google_sheets.get_users_ws()
+        cell = ws.find(user_id, in_column=1)
+        if cell is None:
+            raise ValueError("User not found")
+        headers = ws.row_values(1)
+        col = headers.index("Password") + 1 if "Password" in headers else 2
+        # RAW, so a hash is never reinterpreted as a number/formula
+        ws.update([[hashed_pw]], rowcol_to_a1(cell.row, col))
+
+
+def create_storage() -> Storage:
+    if STORAGE_BACKEND == "sqlite":
+        from app.services.sqlite_storage import SQLiteStorage
+
+        sqlite_storage = SQLiteStorage(STORAGE_SQLITE_PATH)
+        if STORAGE_SQLITE_BOOTSTRAP:
+            # Refuses to start (raises) rather than run without the history
+            sheets = SheetsStorage()
+            sqlite_storage.bootstrap(google_sheets.export_records, sheets.load_users)
+        return sqlite_storage
+    return SheetsStorage()
+
+
+storage = create_storage()
@@ -0,0 +1,104 @@
+# app/services/time_index.py
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.services.frames import parse_timestamp, parse_timestamps
+
+_EMPTY = (np.empty(0, dtype="int64"), np.empty(0, dtype="int64"))
+
+
+def _agent(name) -> str:
+    return str(name).strip()
+
+
+class TimeIndex:
+    """
+    Snapshot row positions sorted by Timestamp, for the whole sheet and per
+    Agent Name (surrounding spaces ignored), so "rows since `cutoff`" is a
+    binary search plus a slice.
+
+    Rows added later (appends) go to a small unsorted tail that queries scan
+    linearly; once it reaches `tail_limit` rows it is merged into the sorted
+    arrays. Unparseable Timestamps sort first (NaT is the smallest int64) and
+    never match a cutoff.
+    """
+
+    def __init__(
+        self,
+        timestamps: np.ndarray,
+        agents: np.ndarray,
+        tail_limit: int = 1024,
+    ):
+        self.tail_limit = tail_limit
+        self._build(timestamps.astype("int64"), agents.astype(object))
+
+    @classmethod
+    def from_records(cls, records: List[dict], timestamps: Optional[pd.Series] = None) -> "TimeIndex":
+        """
+        Build from snapshot records; `timestamps` may pass an already parsed
+        datetime64 Timestamp column (e.g. from the typed frame).
+        """
+        if timestamps is None:
+            timestamps = parse_timestamps(
+                pd.Series([r.get("Timestamp", "") for r in records], dtype=object)
+            )
+        agents = np.array([_agent(r.get("Agent Name", "")) for r in records], dtype=object)
+        return cls(timestamps.to_numpy(dtype="datetime64[ns]").view("int64"), agents)
+
+    def _build(self, ts: np.ndarray, agents: np.ndarray):
+        self._all_ts = ts
+        self._all_agents = agents
+        order = np.argsort(ts, kind="stable")
+        self._ts = ts[order]
+        self._pos = order.astype("int64")
+        # Per agent: positions sorted by (agent, timestamp), split per agent
+        self._agents: Dict[object, Tuple[np.ndarray, np.ndarray]] = {}
+        if len(ts):
+            codes, uniques = pd.factorize(agents, use_na_sentinel=False)
+            by_agent = np.lexsort((ts, codes))
+            bounds = np.flatnonzero(np.diff(codes[by_agent])) + 1
+            for chunk in np.split(by_agent, bounds):
+                agent = uniques[codes[chunk[0]]]
+                self._agents[agent] = (ts[chunk], chunk.astype("int64"))
+        self._tail: List[Tuple[int, int, object]] = []
+
+    def append(self, pos: int, timestamp, agent):
+        ts = parse_timestamp(timestamp)
+        value = np.iinfo("int64").min if pd.isna(ts) else ts.value
+        self._tail.append((value, pos, _agent(agent)))
+        if len(self._tail) >= self.tail_limit:
+            self._merge()
+
+    def _merge(self):
+        size = max(len(self._all_ts), max(pos for _, pos, _ in self._tail) + 1)
+        ts = np.full(size, np.iinfo("int64").min, dtype="int64")
+        agents = np.empty(size, dtype=object)
+        ts[: len(self._all_ts)] = self._all_ts
+        agents[: len(self._all_agents)] = self._all_agents
+        for value, pos, agent in self._tail:
+            ts[pos] = value
+            agents[pos] = agent
+        self._build(ts, agents)
+
+    def since(self, cutoff: datetime, agent: Optional[str] = None) -> np.ndarray:
+        """
+        Positions of rows with Timestamp >= cutoff (for one agent, if given),
+        in sheet order.
+        """
+        limit = pd.Timestamp(cutoff).value
+        agent = None if agent is None else _agent(agent)
+        ts, pos = (self._ts, self._pos) if agent is None else self._agents.get(agent, _EMPTY)
+        hits = pos[np.searchsorted(ts, limit, side="left"):]
+        extra = [
+            p for value, p, a in self._tail
+            if value >= limit and (agent is None or a == agent)
+        ]
+        if extra:
+            hits = np.concatenate([hits, np.array(extra, dtype="int64")])
+        return np.sort(hits)
+
+    def __len__(self) -> int:
+        return len(self._all_ts) + len(self._tail)
@@ -0,0 +1,239 @@
+# app/ws_backends.py
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Optional
+
+from app.config import (
+    BROADCAST_BACKEND,
+    BROADCAST_SQLITE_PATH,
+    BROADCAST_POLL_INTERVAL_SECONDS,
+    REDIS_URL,
+)
+
+# (encoded message, event topics) -> sockets queued for
+Deliver = Callable[[str, Dict[str, str]], int]
+
+
+class LocalBackend:
+    """
+    Single-process bus: messages go straight to this worker's sockets.
+
+    Backends carry the message exactly as encoded by the publisher, with
+    its topics alongside, so it is never decoded or re-encoded on the way.
+    """
+
+    name = "local"
+
+    def __init__(self):
+        self._deliver: Optional[Deliver] = None
+
+    async def start(self, deliver: Deliver):
+        self._deliver = deliver
+
+    async def publish(self, message: str, topics: Dict[str, str]):
+        if self._deliver is not None:
+            self._deliver(message, topics)
+
+    async def stop(self):
+        pass
+
+    def stats(self) -> dict:
+        return {}
+
+
+class SQLiteBackend(LocalBackend):
+    """
+    Cross-worker bus for several uvicorn workers on one host.
+
+    publish() delivers to this worker's sockets at once and appends the
+    message to a shared SQLite table (WAL mode). Every other worker polls
+    the table for rows it has not seen and delivers them to its own
+    sockets. Rows older than `retention` seconds are pruned by whichever
+    worker first claims the prune slot (at most once per `retention / 2`).
+    A failed insert is counted; the message still reached this worker's
+    own sockets.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str, poll_interval: float, retention: float = 60.0):
+        super().__init__()
+        self.path = path
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.origin = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._last_id = 0
+        self._task = None
+        self._conn = None
+        # One connection shared by the to_thread calls; sqlite3 needs them serialized
+        self._conn_lock = threading.Lock()
+        self._prune_interval = retention / 2
+        self._next_prune = 0.0
+        self._stats = {"publish_failures": 0, "prunes": 0, "last_error": None}
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path, timeout=5, isolation_level=None, check_same_thread=False
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS ws_events ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, origin TEXT NOT NULL, "
+            "payload TEXT NOT NULL, created REAL NOT NULL, "
+            "topics TEXT NOT NULL DEFAULT '{}')"
+        )
+        try:
+            # Tables created before topics were carried with the message
+            conn.execute("ALTER TABLE ws_events ADD COLUMN topics TEXT NOT NULL DEFAULT '{}'")
+        except sqlite3.OperationalError:
+            pass
+        # Shared prune slot: one row holding when ws_events was last pruned
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS ws_meta (key TEXT PRIMARY KEY, value REAL NOT NULL)"
+        )
+        conn.execute("INSERT OR IGNORE INTO ws_meta (key, value) VALUES ('pruned', 0)")
+        return conn
+
+    async def start(self, deliver: Deliver):
+        await super().start(deliver)
+        self._conn = await asyncio.to_thread(self._connect)
+        # Only messages published after this worker started are delivered
+        row = self._conn.execute("SELECT COALESCE(MAX(id), 0) FROM ws_events").fetchone()
+        self._last_id = row[0]
+        self._task = asyncio.create_task(self._poll())
+
+    def _insert(self, message: str, topics: Dict[str, str]):
+        with self._conn_lock:
+            self._conn.execute(
+                "INSERT INTO ws_events (origin, payload, topics, created) VALUES (?, ?, ?, ?)",
+                (self.origin, message, json.dumps(topics), time.time()),
+            )
+
+    def _fetch(self):
+        with self._conn_lock:
+            rows = self._conn.execute(
+                "SELECT id, origin, payload, topics FROM ws_events WHERE id > ? ORDER BY id",
+                (self._last_id,),
+            ).fetchall()
+        return rows
+
+    def _prune(self):
+        now = time.time()
+        with self._conn_lock:
+            # Claiming the slot is a single UPDATE, so only one worker per
+            # interval runs the DELETE
+            claimed = self._conn.execute(
+                "UPDATE ws_meta SET value = ? WHERE key = 'pruned' AND value <= ?",
+                (now, now - self._prune_interval),
+            ).rowcount
+            if claimed:
+                self._conn.execute(
+                    "DELETE FROM ws_events WHERE created < ?", (now - self.retention,)
+                )
+        return claimed
+
+    async def publish(self, message: str, topics: Dict[str, str]):
+        await super().publish(message, topics)
+        try:
+            await asyncio.to_thread(self._insert, message, topics)
+        except sqlite3.Error as e:
+            # Other workers' sockets miss this message; counted so it shows
+            # in /api/metrics
+            self._stats["publish_failures"] += 1
+            self._stats["last_error"] = str(e)
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                rows = await asyncio.to_thread(self._fetch)
+            except sqlite3.Error:
+                continue
+            for row_id, origin, payload, topics in rows:
+                self._last_id = row_id
+                if origin != self.origin:
+                    self._deliver(payload, json.loads(topics))
+            if time.monotonic() >= self._next_prune:
+                self._next_prune = time.monotonic() + self._prune_interval
+                try:
+                    if await asyncio.to_thread(self._prune):
+                        self._stats["prunes"] += 1
+                except sqlite3.Error as e:
+                    self._stats["last_error"] = str(e)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+        if self._conn is not None:
+            self._conn.close()
+
+    def stats(self) -> dict:
+        return dict(self._stats)
+
+
+class RedisBackend(LocalBackend):
+    """
+    Cross-host bus over Redis (or any Redis-compatible server) pub/sub.
+    Requires the optional `redis` package.
+
+    Each item is "<origin>\n<topics JSON>\n<message>"; the encoded message
+    has no raw newlines, so it is passed on as sent.
+    """
+
+    name = "redis"
+
+    def __init__(self, url: str, channel: str = "twh:ws_events"):
+        super().__init__()
+        self.url = url
+        self.channel = channel
+        self.origin = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._task = None
+
+    async def start(self, deliver: Deliver):
+        try:
+            import redis.asyncio as aioredis
+        except ImportError as e:
+            raise RuntimeError(
+                "BROADCAST_BACKEND=redis requires the 'redis' package"
+            ) from e
+
+        await super().start(deliver)
+        self._redis = aioredis.from_url(self.url)
+        self._pubsub = self._redis.pubsub()
+        await self._pubsub.subscribe(self.channel)
+        self._task = asyncio.create_task(self._listen())
+
+    async def publish(self, message: str, topics: Dict[str, str]):
+        await super().publish(message, topics)
+        envelope = f"{self.origin}\n{json.dumps(topics)}\n{message}"
+        await self._redis.publish(self.channel, envelope)
+
+    async def _listen(self):
+        async for item in self._pubsub.listen():
+            if item.get("type") != "message":
+                continue
+            data = item["data"]
+            if isinstance(data, bytes):
+                data = data.decode()
+            origin, topics, message = data.split("\n", 2)
+            if origin != self.origin:
+                self._deliver(message, json.loads(topics))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await self._pubsub.unsubscribe(self.channel)
+            await self._redis.close()
+
+
+def create_backend():
+    if BROADCAST_BACKEND == "sqlite":
+        return SQLiteBackend(BROADCAST_SQLITE_PATH, BROADCAST_POLL_INTERVAL_SECONDS)
+    if BROADCAST_BACKEND == "redis":
+        return RedisBackend(REDIS_URL)
+    return LocalBackend()
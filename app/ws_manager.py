@@ -1,30 +1,376 @@
 # app/ws_manager.py
-from typing import List
+import asyncio
+import json
+import time
+import uuid
+from collections import deque
+from typing import Dict, List, Optional, Set, Tuple
+
 from fastapi import WebSocket
 
+from app.config import (
+    WS_REPLAY_BUFFER_SIZE,
+    WS_SEND_QUEUE_SIZE,
+    WS_SEND_TIMEOUT_SECONDS,
+    WS_SLOW_CONSUMER_POLICY,
+)
+from app.ws_backends import LocalBackend, create_backend
+
+
+# Event attributes a client can subscribe on, and where they are read from
+TOPIC_FIELDS = {
+    "type": ("type",),
+    "sheet": ("sheet",),
+    "agent": ("agent_name",),
+}
+
+
+def parse_topics(query_params) -> Dict[str, Set[str]]:
+    """
+    Subscription filters from the WebSocket query string, e.g.
+    ?sheet=spectrum&agent=Ali&type=new_pending,status_update
+    A dimension that is not given matches every event.
+    """
+    topics = {}
+    for dim in TOPIC_FIELDS:
+        values = set()
+        for raw in query_params.getlist(dim):
+            values.update(v.strip() for v in raw.split(",") if v.strip())
+        if values:
+            topics[dim] = values
+    return topics
+
+
+def restrict_topics(topics: Dict[str, Set[str]], is_manager: bool) -> Dict[str, Set[str]]:
+    """
+    Topics a connection may actually receive. Managers keep their filters;
+    any other connection (the agent portal) only gets the events of the one
+    agent it names, and none at all if it names no agent or several, so
+    leaving the filter out never exposes other agents' records.
+    """
+    if is_manager:
+        return topics
+    agents = topics.get("agent", set())
+    # An empty set matches nothing (see TopicIndex)
+    return {**topics, "agent": set(agents) if len(agents) == 1 else set()}
+
+
+def parse_resume(query_params) -> Optional[Tuple[str, int]]:
+    """
+    (epoch, last_seq) from ?epoch=...&last_seq=... when a client is
+    resuming, else None.
+    """
+    epoch = query_params.get("epoch")
+    last_seq = query_params.get("last_seq")
+    if not epoch or last_seq is None:
+        return None
+    try:
+        return epoch, int(last_seq)
+    except ValueError:
+        return None
+
+
+def matches(subscribed: Dict[str, Set[str]], topics: Dict[str, str]) -> bool:
+    return all(topics.get(dim) in values for dim, values in subscribed.items())
+
+
+def event_topics(event: dict) -> Dict[str, str]:
+    topics = {}
+    for dim, fields in TOPIC_FIELDS.items():
+        for field in fields:
+            if event.get(field) is not None:
+                topics[dim] = str(event[field]).strip()
+                break
+    return topics
+
+
+def encode_event(event: dict) -> Tuple[str, Dict[str, str]]:
+    """
+    The event as sent to the sockets (JSON, encoded once) and its topics.
+    """
+    return json.dumps(event), event_topics(event)
+
+
+def with_seq(message: str, seq: int) -> str:
+    """
+    Prefix an encoded JSON object with its "seq" without re-encoding it;
+    other messages are returned unchanged.
+    """
+    if not message.startswith("{"):
+        return message
+    rest = message[1:].lstrip()
+    if rest.startswith("}"):
+        return f'{{"seq": {seq}{rest}'
+    return f'{{"seq": {seq}, {rest}'
+
+
+class _Client:
+    """
+    One connected socket with its own bounded outbound queue, drained by a
+    dedicated sender task.
+    """
+
+    def __init__(self, websocket: WebSocket, max_queue: int, topics: Dict[str, Set[str]]):
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.task = None
+        self.dropped = 0
+        self.topics = topics
+
+
+class TopicIndex:
+    """
+    Maps each topic value to the clients subscribed to it, per dimension.
+    Clients with no filter on a dimension sit in that dimension's wildcard
+    set, so routing an event is a few set intersections instead of a check
+    against every socket. A filter with no values matches no event.
+    """
 
-class ConnectionManager:
     def __init__(self):
-        self.active_connections: List[WebSocket] = []
+        self._by_value: Dict[str, Dict[str, Set[_Client]]] = {d: {} for d in TOPIC_FIELDS}
+        self._wildcard: Dict[str, Set[_Client]] = {d: set() for d in TOPIC_FIELDS}
 
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
+    def add(self, client: _Client):
+        for dim in TOPIC_FIELDS:
+            values = client.topics.get(dim)
+            if values is None:
+                self._wildcard[dim].add(client)
+                continue
+            for value in values:
+                self._by_value[dim].setdefault(value, set()).add(client)
+
+    def remove(self, client: _Client):
+        for dim in TOPIC_FIELDS:
+            self._wildcard[dim].discard(client)
+            for value in client.topics.get(dim, ()):
+                subscribers = self._by_value[dim].get(value)
+                if subscribers is not None:
+                    subscribers.discard(client)
+                    if not subscribers:
+                        del self._by_value[dim][value]
+
+    def match(self, topics: Dict[str, str]) -> Set[_Client]:
+        candidates = []
+        for dim in TOPIC_FIELDS:
+            matched = self._wildcard[dim]
+            value = topics.get(dim)
+            if value is not None and value in self._by_value[dim]:
+                matched = matched | self._by_value[dim][value]
+            candidates.append(matched)
+        candidates.sort(key=len)
+        return candidates[0].intersection(*candidates[1:])
+
+
+class ConnectionManager:
+    """
+    Broadcasts never wait on a socket: the message is put on every
+    connection's queue and each connection's sender task writes it out.
+
+    When a connection's queue is full (a slow or stuck browser), the
+    slow-consumer policy decides what happens:
+      - "drop_oldest": discard the oldest queued message for that socket
+      - "drop_newest": discard the message being broadcast for that socket
+      - "disconnect": close that socket
+
+    broadcast() encodes the event once and sends it through a pluggable
+    backend (see app/ws_backends.py) so it reaches the sockets of every
+    uvicorn worker, not just this one; the encoded text is what every
+    socket receives, with only "seq" spliced in front.
+
+    Clients may subscribe to topics (sheet, agent, event type) when they
+    connect; each event is only queued for the sockets whose filters match.
+
+    Every event gets a sequence number ("seq") and the last `replay_size`
+    events are kept in a ring buffer. A client that reconnects with the
+    epoch and last seq it saw gets only the events it missed; if those
+    have already left the buffer (or the worker restarted, which changes
+    the epoch) it is sent a "resync" message and reloads its tables.
+    """
+
+    def __init__(
+        self,
+        max_queue: int = WS_SEND_QUEUE_SIZE,
+        slow_policy: str = WS_SLOW_CONSUMER_POLICY,
+        send_timeout: float = WS_SEND_TIMEOUT_SECONDS,
+        backend=None,
+        replay_size: int = WS_REPLAY_BUFFER_SIZE,
+    ):
+        self.backend = backend or LocalBackend()
+        self.epoch = uuid.uuid4().hex[:12]
+        self._seq = 0
+        # (seq, encoded message, event topics), oldest first
+        self._replay: deque = deque(maxlen=replay_size)
+        self.max_queue = max_queue
+        self.slow_policy = slow_policy
+        self.send_timeout = send_timeout
+        self._clients: Dict[WebSocket, _Client] = {}
+        self._index = TopicIndex()
+        self._stats = {
+            "broadcasts": 0,
+            "sent": 0,
+            "dropped": 0,
+            "slow_disconnects": 0,
+            "send_errors": 0,
+            "filtered": 0,
+            "replayed": 0,
+            "resyncs": 0,
+        }
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+
+    async def start(self):
+        await self.backend.start(self.publish)
+
+    async def stop(self):
+        await self.backend.stop()
+
+    @property
+    def active_connections(self) -> List[WebSocket]:
+        return list(self._clients)
+
+    async def connect(
+        self,
+        websocket: WebSocket,
+        topics: Optional[Dict[str, Set[str]]] = None,
+        resume: Optional[Tuple[str, int]] = None,
+        subprotocol: Optional[str] = None,
+    ):
+        # A client that offered subprotocols must get one of them back
+        await websocket.accept(subprotocol=subprotocol)
+        client = _Client(websocket, self.max_queue, topics or {})
+        # No await from here on: the hello and any replay are queued before
+        # the client can receive a live event
+        self._enqueue(client, self._control("hello"))
+        if resume is not None:
+            for message in self._missed(client, *resume):
+                self._enqueue(client, message)
+        client.task = asyncio.create_task(self._sender(client))
+        self._clients[websocket] = client
+        self._index.add(client)
+
+    def _control(self, kind: str) -> str:
+        return json.dumps({"type": kind, "epoch": self.epoch, "seq": self._seq})
+
+    @staticmethod
+    def _enqueue(client: _Client, message: str):
+        client.queue.put_nowait((message, time.monotonic()))
+
+    def _missed(self, client: _Client, epoch: str, last_seq: int) -> List[str]:
+        """
+        Buffered events after `last_seq` that match the client's topics,
+        or a single "resync" message when they cannot all be replayed.
+        """
+        oldest = self._replay[0][0] if self._replay else self._seq + 1
+        gap_ok = epoch == self.epoch and oldest - 1 <= last_seq <= self._seq
+        missed = []
+        if gap_ok:
+            missed = [
+                message
+                for seq, message, topics in self._replay
+                if seq > last_seq and matches(client.topics, topics)
+            ]
+        # The hello already takes one queue slot
+        if not gap_ok or len(missed) >= self.max_queue:
+            self._stats["resyncs"] += 1
+            return [self._control("resync")]
+        self._stats["replayed"] += len(missed)
+        return missed
 
     def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
+        client = self._clients.pop(websocket, None)
+        if client is None:
+            return
+        self._index.remove(client)
+        if client.task is not None and client.task is not asyncio.current_task():
+            client.task.cancel()
+
+    async def _sender(self, client: _Client):
+        try:
+            # disconnect() unregisters before cancelling: on Python 3.11,
+            # wait_for can swallow a cancel that lands as the send finishes
+            while self._clients.get(client.websocket) is client:
+                message, enqueued_at = await client.queue.get()
+                await asyncio.wait_for(
+                    client.websocket.send_text(message), self.send_timeout
+                )
+                latency = time.monotonic() - enqueued_at
+                self._stats["sent"] += 1
+                self._latency_total += latency
+                self._latency_max = max(self._latency_max, latency)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Dead, stuck past send_timeout, or closed by the client; close
+            # it too, or the endpoint's receive loop keeps it open unserved
+            self._stats["send_errors"] += 1
+            self.disconnect(client.websocket)
+            # 1013: try again later, 1011: server error
+            code = 1013 if isinstance(e, asyncio.TimeoutError) else 1011
+            asyncio.create_task(self._close_quietly(client.websocket, code))
+
+    def _close_slow(self, client: _Client):
+        self._stats["slow_disconnects"] += 1
+        self.disconnect(client.websocket)
+        asyncio.create_task(self._close_quietly(client.websocket))
+
+    @staticmethod
+    async def _close_quietly(websocket: WebSocket, code: int = 1013):
+        try:
+            await websocket.close(code=code)
+        except Exception:
+            pass
+
+    def publish(self, message: str, topics: Optional[Dict[str, str]] = None) -> int:
+        """
+        Queue an already-encoded message with its event topics for every
+        matching connection of this worker without awaiting any socket.
+        Returns the number of connections it was queued for.
+        """
+        self._stats["broadcasts"] += 1
+        self._seq += 1
+        topics = topics or {}
+        message = with_seq(message, self._seq)
+        self._replay.append((self._seq, message, topics))
+        recipients = self._index.match(topics)
+        self._stats["filtered"] += len(self._clients) - len(recipients)
+
+        item = (message, time.monotonic())
+        queued = 0
+        for client in recipients:
+            if client.queue.full():
+                if self.slow_policy == "disconnect":
+                    self._close_slow(client)
+                    continue
+                client.dropped += 1
+                self._stats["dropped"] += 1
+                if self.slow_policy == "drop_newest":
+                    continue
+                client.queue.get_nowait()
+            client.queue.put_nowait(item)
+            queued += 1
+        return queued
 
-    async def broadcast(self, message: str):
-        disconnected = []
-        for connection in self.active_connections:
-            try:
-                await connection.send_text(message)
-            except Exception:
-                disconnected.append(connection)
+    async def broadcast(self, event: dict):
+        await self.backend.publish(*encode_event(event))
 
-        for ws in disconnected:
-            self.disconnect(ws)
+    def stats(self) -> dict:
+        depths = [c.queue.qsize() for c in self._clients.values()]
+        sent = self._stats["sent"]
+        return {
+            **self._stats,
+            "connections": len(self._clients),
+            "queued": sum(depths),
+            "max_queue_depth": max(depths, default=0),
+            "queue_size": self.max_queue,
+            "slow_policy": self.slow_policy,
+            "backend": self.backend.name,
+            "backend_stats": self.backend.stats(),
+            "epoch": self.epoch,
+            "seq": self._seq,
+            "replay_buffered": len(self._replay),
+            "avg_fanout_latency_ms": round(1000 * self._latency_total / sent, 2) if sent else 0.0,
+            "max_fanout_latency_ms": round(1000 * self._latency_max, 2),
+        }
 
 
-manager = ConnectionManager()
+manager = ConnectionManager(backend=create_backend())
@@ -0,0 +1,60 @@
+# benchmarks/bench_login.py
+"""
+Login throughput (password verifications per second) for the legacy
+SHA-256 hasher and scrypt at several cost settings, verified in-process
+and on the process pool used by app.services.auth.
+
+Run from the repo root:
+    python -m benchmarks.bench_login [logins] [workers]
+"""
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.services import passwords
+from app.services.passwords import PasswordHasher, ScryptHasher
+
+COSTS = [2 ** 12, 2 ** 14, 2 ** 15]
+
+
+def throughput(hasher: PasswordHasher, stored: str, logins: int, concurrency: int) -> float:
+    """
+    Verifications per second with `concurrency` request threads, like a
+    burst of logins hitting the sync /auth/login endpoint.
+    """
+    hasher.verify("correct horse", stored)  # warm up the pool
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as threads:
+        results = list(threads.map(lambda _: hasher.verify("correct horse", stored), range(logins)))
+    elapsed = time.perf_counter() - t0
+    assert all(results), "verification failed"
+    return logins / elapsed
+
+
+def main():
+    logins = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else (os.cpu_count() or 1)
+
+    print(f"logins={logins} pool_workers={workers}")
+    print(f"{'hasher':<22}{'inline/s':>12}{'pool/s':>12}{'pool/s/core':>14}")
+
+    cases = [("sha256", None)] + [("scrypt", n) for n in COSTS]
+    for name, n in cases:
+        if n is not None:
+            passwords.HASHERS["scrypt"] = ScryptHasher(n=n)
+        label = name if n is None else f"scrypt n=2^{n.bit_length() - 1}"
+        stored = passwords.HASHERS[name].hash("correct horse")
+
+        inline = PasswordHasher(name, workers=0)
+        pooled = PasswordHasher(name, workers=workers)
+        try:
+            one = throughput(inline, stored, logins, 1)
+            many = throughput(pooled, stored, logins, workers * 2)
+        finally:
+            pooled.shutdown()
+        print(f"{label:<22}{one:>12.1f}{many:>12.1f}{many / workers:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+# benchmarks/bench_recent.py
+"""
+/transactions/recent lookups: full-column mask over the typed snapshot
+frame (the previous get_recent_transactions) against the snapshot's
+TimeIndex (binary search on sorted timestamps, per-agent slices), on
+synthetic sheets of several sizes.
+
+Run from the repo root:
+    python -m benchmarks.bench_recent [rows ...]
+"""
+import sys
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from app.services import google_sheets
+from app.services.frames import TIMESTAMP_FORMAT
+from app.services.sheet_cache import SheetSnapshot
+
+from benchmarks.bench_snapshot import make_records
+
+AGENTS = ["Ali", "Sara", "Bilal", "Hina", "Omar"]
+
+
+def mask_recent(df: pd.DataFrame, cutoff: datetime, agent: str = None) -> pd.DataFrame:
+    mask = df["Timestamp"] >= cutoff
+    if agent:
+        mask &= df["Agent Name"] == agent
+    return df[mask]
+
+
+def timed(fn, repeat: int = 20) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def ids(df: pd.DataFrame) -> list:
+    return df["Record_ID"].tolist()
+
+
+def submit(snapshot: SheetSnapshot, now: datetime):
+    record = dict(snapshot.records[-1])
+    record.update(
+        {"Record_ID": len(snapshot.records) + 1, "Agent Name": "Ali",
+         "Status": "Pending", "Timestamp": now.strftime(TIMESTAMP_FORMAT)}
+    )
+    snapshot.append(record)
+
+
+def once(fn) -> float:
+    t0 = time.perf_counter()
+    fn()
+    return time.perf_counter() - t0
+
+
+def run(rows: int):
+    snapshot = SheetSnapshot(make_records(rows), 1, google_sheets._records_to_df)
+    frame = snapshot.view()
+    now = datetime.now(google_sheets.tz).replace(tzinfo=None)
+    cutoff = now - timedelta(minutes=20)
+
+    t0 = time.perf_counter()
+    snapshot.since(cutoff)
+    build = time.perf_counter() - t0
+
+    for agent in [None] + AGENTS:
+        for minutes in (20, 240, 1440):
+            c = now - timedelta(minutes=minutes)
+            assert ids(mask_recent(frame, c, agent)) == ids(snapshot.rows(snapshot.since(c, agent))), (agent, minutes)
+
+    results = [
+        ("all agents, 20 min",
+         timed(lambda: mask_recent(frame, cutoff)),
+         timed(lambda: snapshot.rows(snapshot.since(cutoff)))),
+        ("one agent, 20 min",
+         timed(lambda: mask_recent(frame, cutoff, "Ali")),
+         timed(lambda: snapshot.rows(snapshot.since(cutoff, "Ali")))),
+        ("one agent, 24 h",
+         timed(lambda: mask_recent(frame, now - timedelta(days=1), "Ali")),
+         timed(lambda: snapshot.rows(snapshot.since(now - timedelta(days=1), "Ali")))),
+    ]
+
+    # Right after a submit the cached frame is gone: the mask has to wait
+    # for a full rebuild, the index only gained a tail entry
+    submit(snapshot, now)
+    old = once(lambda: mask_recent(snapshot.view(), cutoff, "Ali"))
+    submit(snapshot, now)
+    new = once(lambda: snapshot.rows(snapshot.since(cutoff, "Ali")))
+    assert ids(mask_recent(snapshot.view(), cutoff, "Ali")) == ids(snapshot.rows(snapshot.since(cutoff, "Ali")))
+    results.append(("first read after submit", old, new))
+
+    print(f"rows={rows}  index build (once per load): {build * 1000:.1f} ms")
+    for name, old, new in results:
+        print(f"  {name:<26}mask {old * 1000:8.3f} ms   index {new * 1000:8.3f} ms   {old / new:7.1f}x")
+
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or [10_000, 100_000, 500_000]
+    for rows in sizes:
+        run(rows)
+
+
+if __name__ == "__main__":
+    main()
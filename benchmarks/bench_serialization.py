@@ -0,0 +1,75 @@
+# benchmarks/bench_serialization.py
+"""
+Compare the old per-row list endpoint serialization (iterrows ->
+TransactionRecord -> FastAPI/pydantic JSON) with the bulk serializer in
+app.services.serialization.
+
+Run from the repo root:
+    python -m benchmarks.bench_serialization [rows]
+"""
+import sys
+import time
+from typing import List
+
+import numpy as np
+import pandas as pd
+from pydantic import TypeAdapter
+
+from app.schemas import TransactionRecord
+from app.services.serialization import dumps, frame_to_records
+
+
+def make_frame(rows: int) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    start = pd.Timestamp("2025-01-01 19:00:00")
+    return pd.DataFrame(
+        {
+            "Record_ID": np.arange(1, rows + 1),
+            "Agent Name": rng.choice(["Ali", "Sara", "Bilal", "Hina"], rows),
+            "Name": [f"Customer {i}" for i in range(rows)],
+            "Ph Number": [f"555{i:07d}" for i in range(rows)],
+            "Card Number": ["4111111111111111"] * rows,
+            "Expiry Date": ["0934"] * rows,
+            "CVC": rng.integers(100, 999, rows),
+            "Charge": [f"${v}" for v in rng.integers(50, 500, rows)],
+            "LLC": rng.choice(["LLC A", "LLC B"], rows),
+            "Status": rng.choice(["Pending", "Charged", "Declined"], rows),
+            "Timestamp": start + pd.to_timedelta(rng.integers(0, 36000, rows), unit="s"),
+        }
+    )
+
+
+def old_path(df: pd.DataFrame) -> bytes:
+    adapter = TypeAdapter(List[TransactionRecord])
+    records = [TransactionRecord(data=row.to_dict()) for _, row in df.iterrows()]
+    return adapter.dump_json(records)
+
+
+def new_path(df: pd.DataFrame) -> bytes:
+    return dumps([{"data": row} for row in frame_to_records(df)])
+
+
+def timed(fn, df, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(df)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    df = make_frame(rows)
+
+    assert old_path(df) == new_path(df), "serializers disagree"
+
+    old = timed(old_path, df)
+    new = timed(new_path, df)
+    print(f"rows={rows}")
+    print(f"iterrows + pydantic : {old * 1000:8.1f} ms")
+    print(f"bulk + fast encoder : {new * 1000:8.1f} ms  ({old / new:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
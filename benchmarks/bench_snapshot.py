@@ -0,0 +1,136 @@
+# benchmarks/bench_snapshot.py
+"""
+Per-request cost of the snapshot queries with untyped columns (the old
+code: pd.to_datetime without a format, per-row tz lambda and a Charge
+regex on every call) against the typed snapshot frame, which is parsed
+once when the sheet is loaded.
+
+Run from the repo root:
+    python -m benchmarks.bench_snapshot [rows]
+"""
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from app.services import google_sheets
+from app.services.frames import TIMESTAMP_FORMAT
+from app.services.night_totals import charged_total, night_window
+from app.services.sheet_cache import SheetSnapshot
+
+
+def make_records(rows: int) -> list:
+    """
+    get_all_records() output: one dict per row, every cell as the sheet
+    stores it, spread over the last 30 days.
+    """
+    rng = np.random.default_rng(0)
+    now = datetime.now(google_sheets.tz).replace(tzinfo=None)
+    offsets = np.sort(rng.integers(0, 30 * 86400, rows))[::-1]
+    agents = rng.choice(["Ali", "Sara", "Bilal", "Hina", "Omar"], rows)
+    statuses = rng.choice(["Pending", "Charged", "Declined", "Charge Back"], rows, p=[0.05, 0.7, 0.2, 0.05])
+    charges = rng.integers(50, 5000, rows)
+    return [
+        {
+            "Record_ID": i + 1,
+            "Agent Name": agents[i],
+            "Name": f"Customer {i}",
+            "Charge": f"${charges[i]:,}.00",
+            "LLC": "LLC A",
+            "Provider": "P",
+            "Status": statuses[i],
+            "Timestamp": (now - timedelta(seconds=int(offsets[i]))).strftime(TIMESTAMP_FORMAT),
+        }
+        for i in range(rows)
+    ]
+
+
+# Old implementations, as they ran on every request
+
+
+def old_pending(frame: pd.DataFrame) -> pd.DataFrame:
+    df = frame.copy()
+    df["Timestamp"] = pd.to_datetime(df["Timestamp"], errors="coerce")
+    df["Timestamp"] = df["Timestamp"].apply(
+        lambda x: x.tz_localize(None) if hasattr(x, "tzinfo") and x.tzinfo else x
+    )
+    now = datetime.now(google_sheets.tz).replace(tzinfo=None)
+    cutoff = now - timedelta(minutes=5)
+    df = df[
+        (df["Status"] == "Pending")
+        | ((df["Status"].isin(["Charged", "Declined"])) & (df["Timestamp"] >= cutoff))
+    ]
+    return df[df["Status"] == "Pending"]
+
+
+def old_recent(frame: pd.DataFrame, agent_name: str) -> pd.DataFrame:
+    df = frame.copy()
+    df["Timestamp"] = pd.to_datetime(df["Timestamp"], errors="coerce")
+    df = df.dropna(subset=["Timestamp"])
+    now = datetime.now(google_sheets.tz).replace(tzinfo=None)
+    df = df[df["Timestamp"] >= now - timedelta(minutes=20)]
+    return df[df["Agent Name"] == agent_name]
+
+
+def old_night_total(frame: pd.DataFrame) -> float:
+    window_start, window_end = night_window(datetime.now(google_sheets.tz).replace(tzinfo=None))
+    df = frame.copy()
+    df["Timestamp"] = pd.to_datetime(df["Timestamp"], errors="coerce")
+    df = df.dropna(subset=["Timestamp"])
+    charge_str = df["Charge"].astype(str).str.replace(r"[\$,]", "", regex=True)
+    df["ChargeFloat"] = pd.to_numeric(charge_str, errors="coerce").fillna(0.0)
+    mask = (
+        (df["Status"] == "Charged")
+        & (df["Timestamp"] >= window_start)
+        & (df["Timestamp"] <= window_end)
+    )
+    return float(df.loc[mask, "ChargeFloat"].sum())
+
+
+def timed(fn, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    records = make_records(rows)
+    untyped = pd.DataFrame(records)
+
+    t0 = time.perf_counter()
+    snapshot = SheetSnapshot(records, 1, google_sheets._records_to_df)
+    snapshot.view()
+    build = time.perf_counter() - t0
+
+    # Serve the query functions from the synthetic snapshot
+    google_sheets.load_snapshot = lambda sheet: snapshot
+    window = night_window(datetime.now(google_sheets.tz).replace(tzinfo=None))
+
+    assert len(old_pending(untyped)) == len(google_sheets.get_pending_transactions("spectrum"))
+    assert len(old_recent(untyped, "Ali")) == len(google_sheets.get_recent_transactions("spectrum", 20, "Ali"))
+    assert abs(old_night_total(untyped) - charged_total(snapshot.view(), window)) < 0.01
+
+    cases = [
+        ("pending", lambda: old_pending(untyped),
+         lambda: google_sheets.get_pending_transactions("spectrum")),
+        ("recent (agent)", lambda: old_recent(untyped, "Ali"),
+         lambda: google_sheets.get_recent_transactions("spectrum", 20, "Ali")),
+        ("night total (full scan)", lambda: old_night_total(untyped),
+         lambda: charged_total(snapshot.view(), window)),
+    ]
+
+    print(f"rows={rows}  typed frame build (once per load): {build * 1000:.1f} ms")
+    print(f"{'query':<26}{'untyped ms':>12}{'typed ms':>12}{'speedup':>10}")
+    for name, old, new in cases:
+        old_s, new_s = timed(old), timed(new)
+        print(f"{name:<26}{old_s * 1000:>12.1f}{new_s * 1000:>12.1f}{old_s / new_s:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# tests/conftest.py
+"""
+In-memory stand-ins for the Google Sheets worksheets, shared by the tests
+that exercise the Sheets backend.
+"""
+import os
+import tempfile
+from types import SimpleNamespace
+
+os.environ.setdefault("RECORD_ID_DB", os.path.join(tempfile.mkdtemp(), "record_ids.sqlite3"))
+
+import pytest
+from gspread.utils import a1_to_rowcol
+
+from app.services import google_sheets
+from app.services.sqlite_storage import TRANSACTION_HEADERS
+from app.services.storage import SheetsStorage
+
+
+class FakeWorksheet:
+    """
+    The gspread Worksheet calls the Sheets backend makes, on a list of rows.
+    """
+
+    def __init__(self, headers):
+        self.values = [list(headers)]
+
+    def get_all_records(self):
+        headers = self.values[0]
+        return [dict(zip(headers, row + [""] * (len(headers) - len(row)))) for row in self.values[1:]]
+
+    def get_all_values(self):
+        return [list(row) for row in self.values]
+
+    def row_values(self, row):
+        return list(self.values[row - 1])
+
+    def col_values(self, col):
+        return [row[col - 1] if len(row) >= col else "" for row in self.values]
+
+    def append_row(self, values, **kwargs):
+        self.values.append(list(values))
+
+    def append_rows(self, rows, **kwargs):
+        self.values.extend(list(values) for values in rows)
+
+    def batch_update(self, data, **kwargs):
+        for update in data:
+            self.update(update["values"], update["range"])
+
+    def update(self, values, range_name, **kwargs):
+        row, col = a1_to_rowcol(range_name.split(":")[0])
+        cells = self.values[row - 1]
+        cells.extend([""] * (col - len(cells)))
+        cells[col - 1] = values[0][0]
+
+    def find(self, value, in_column=None):
+        for row, cells in enumerate(self.values, start=1):
+            if cells and str(cells[(in_column or 1) - 1]) == str(value):
+                return SimpleNamespace(row=row, col=in_column or 1)
+        return None
+
+
+@pytest.fixture
+def worksheets(monkeypatch):
+    """
+    Fresh, empty transaction and user worksheets, with the sheet cache
+    cleared around the test.
+    """
+    tabs = {
+        "spectrum": FakeWorksheet(TRANSACTION_HEADERS["spectrum"]),
+        "insurance": FakeWorksheet(TRANSACTION_HEADERS["insurance"]),
+    }
+    monkeypatch.setattr(google_sheets, "_spectrum_ws", tabs["spectrum"])
+    monkeypatch.setattr(google_sheets, "_insurance_ws", tabs["insurance"])
+    monkeypatch.setattr(google_sheets, "_users_ws", FakeWorksheet(["ID", "Password"]))
+    google_sheets._cache.invalidate()
+    yield tabs
+    google_sheets._writer.flush()
+    google_sheets._cache.invalidate()
+
+
+@pytest.fixture
+def sheets_storage(worksheets):
+    return SheetsStorage()
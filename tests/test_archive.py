@@ -0,0 +1,125 @@
+# tests/test_archive.py
+"""
+The archive pass: old settled rows move to the archive and leave the hot
+sheet, except rows with writes still queued and rows edited between the
+read and the delete. Reads keep returning archived rows.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.services import google_sheets
+from app.services.archive import ArchiveStore
+from app.services.frames import TIMESTAMP_FORMAT
+from app.services.sqlite_storage import TRANSACTION_HEADERS
+
+
+class MemoryArchive(ArchiveStore):
+    name = "memory"
+
+    def __init__(self):
+        super().__init__()
+        self.partitions = {}
+
+    def _load(self, sheet):
+        return [
+            record
+            for (tab, _), records in sorted(self.partitions.items())
+            if tab == sheet
+            for record in records
+        ]
+
+    def _append(self, sheet, month, headers, records):
+        self.partitions.setdefault((sheet, month), []).extend(dict(r) for r in records)
+
+
+class FakeSpreadsheet:
+    """
+    Applies the deleteDimension requests the archive pass sends.
+    """
+
+    def __init__(self, ws):
+        self.ws = ws
+
+    def batch_update(self, body):
+        for request in body["requests"]:
+            span = request["deleteDimension"]["range"]
+            del self.ws.values[span["startIndex"]:span["endIndex"]]
+
+
+@pytest.fixture
+def archive(worksheets, monkeypatch):
+    store = MemoryArchive()
+    ws = worksheets["spectrum"]
+    ws.id = 0
+    monkeypatch.setattr(google_sheets, "_archive", store)
+    monkeypatch.setattr(google_sheets, "get_spreadsheet", lambda: FakeSpreadsheet(ws))
+    return store
+
+
+NOW = datetime.now(google_sheets.tz).replace(tzinfo=None)
+OLD = (NOW - timedelta(days=5)).strftime(TIMESTAMP_FORMAT)
+NEW = NOW.strftime(TIMESTAMP_FORMAT)
+
+
+def _row(record_id, status, timestamp):
+    record = dict.fromkeys(TRANSACTION_HEADERS["spectrum"], "")
+    record.update(
+        {"Record_ID": str(record_id), "Agent Name": "Ali", "Status": status, "Timestamp": timestamp}
+    )
+    return list(record.values())
+
+
+def _ids(ws):
+    return [row[0] for row in ws.values[1:]]
+
+
+def test_old_settled_rows_move_to_the_archive(worksheets, archive):
+    ws = worksheets["spectrum"]
+    ws.values += [
+        _row(1, "Charged", OLD),
+        _row(2, "Pending", OLD),
+        _row(3, "Declined", OLD),
+        _row(4, "Charged", NEW),
+        _row(5, "Charge Back", OLD),
+    ]
+
+    assert google_sheets.archive_settled_rows("spectrum", NOW - timedelta(days=1)) == 3
+
+    assert _ids(ws) == ["2", "4"]
+    month = (NOW - timedelta(days=5)).strftime("%Y-%m")
+    assert [r["Record_ID"] for r in archive.partitions[("spectrum", month)]] == ["1", "3", "5"]
+    served = google_sheets.get_all_transactions("spectrum")["Record_ID"].astype(str).tolist()
+    assert sorted(served) == ["1", "2", "3", "4", "5"]
+
+
+def test_rows_with_queued_writes_or_late_edits_stay(worksheets, archive, monkeypatch):
+    ws = worksheets["spectrum"]
+    ws.values += [_row(1, "Charged", OLD), _row(2, "Charged", OLD), _row(3, "Charged", OLD)]
+    google_sheets.load_snapshot("spectrum")
+
+    reads = []
+    read = ws.get_all_values
+
+    def edited_in_between():
+        reads.append(1)
+        if len(reads) == 2:
+            # Someone edits row 3 in Google Sheets after it was archived
+            ws.values[3][2] = "edited"
+        return read()
+
+    with monkeypatch.context() as m:
+        # Row 1 gets an update that is still queued when the pass reads
+        m.setattr(google_sheets._writer, "flush", lambda: True)
+        google_sheets._writer.update_cell("spectrum", "1", "Name", "new name")
+        m.setattr(ws, "get_all_values", edited_in_between)
+        deleted = google_sheets.archive_settled_rows("spectrum", NOW - timedelta(days=1))
+
+    assert deleted == 1
+    assert _ids(ws) == ["1", "3"]
+    archived = [r["Record_ID"] for records in archive.partitions.values() for r in records]
+    assert archived == ["2", "3"]
+
+    # The queued update still lands on row 1, which was left in place
+    assert google_sheets._writer.flush()
+    assert ws.values[1][2] == "new name"
@@ -0,0 +1,66 @@
+# tests/test_auth.py
+"""
+TokenCache: a cached token is still rejected once its `exp` passes, and
+the cache never accepts a token jwt.decode would refuse.
+"""
+import time
+from datetime import timedelta
+
+import pytest
+from jose import jwt
+
+from app.config import JWT_ALGORITHM, JWT_SECRET_KEY
+from app.services import auth
+from app.services.auth import ROLE_AGENT, ROLE_MANAGER, TokenCache, create_access_token
+
+
+def test_cached_token_expires_with_its_exp(monkeypatch):
+    cache = TokenCache(max_size=10)
+    token = create_access_token("mgr", timedelta(seconds=60), role=ROLE_MANAGER)
+
+    assert cache.verify(token) == ("mgr", ROLE_MANAGER)
+    assert cache.verify(token) == ("mgr", ROLE_MANAGER)
+    assert cache.stats()["hits"] == 1
+
+    later = time.time() + 120
+    monkeypatch.setattr(auth.time, "time", lambda: later)
+    with pytest.raises(ValueError, match="expired"):
+        cache.verify(token)
+    stats = cache.stats()
+    assert (stats["expired"], stats["size"]) == (1, 0)
+
+
+def test_expired_and_forged_tokens_are_never_cached():
+    cache = TokenCache(max_size=10)
+    expired = create_access_token("mgr", timedelta(seconds=-10), role=ROLE_MANAGER)
+    forged = jwt.encode(
+        {"sub": "mgr", "role": ROLE_MANAGER, "exp": time.time() + 60}, "other-key", JWT_ALGORITHM
+    )
+
+    for token, message in ((expired, "expired"), (forged, "Invalid"), ("garbage", "Invalid")):
+        with pytest.raises(ValueError, match=message):
+            cache.verify(token)
+    assert cache.stats()["size"] == 0
+
+
+def test_token_without_a_role_claim_is_an_agent_token():
+    cache = TokenCache(max_size=10)
+    legacy = jwt.encode({"sub": "mgr", "exp": time.time() + 60}, JWT_SECRET_KEY, JWT_ALGORITHM)
+
+    assert cache.verify(legacy) == ("mgr", ROLE_AGENT)
+
+
+def test_least_recently_used_token_is_evicted():
+    cache = TokenCache(max_size=2)
+    tokens = [create_access_token(f"user{i}", role=ROLE_AGENT) for i in range(3)]
+    cache.verify(tokens[0])
+    cache.verify(tokens[1])
+    cache.verify(tokens[0])
+    cache.verify(tokens[2])
+
+    stats = cache.stats()
+    assert (stats["size"], stats["evictions"]) == (2, 1)
+    # tokens[1] was the least recently used: verifying it again is a miss
+    misses = stats["misses"]
+    cache.verify(tokens[1])
+    assert cache.stats()["misses"] == misses + 1
@@ -0,0 +1,137 @@
+# tests/test_sheet_cache.py
+"""
+SheetCache loads: one fetch per key however many callers wait on it, and
+row versions carried over reloads so unchanged data keeps its ETags.
+"""
+import threading
+import time
+
+import pandas as pd
+
+from app.services.sheet_cache import SheetCache
+
+
+def _rows(*statuses):
+    return [
+        {"Record_ID": i, "Agent Name": "Ali", "Status": status, "Timestamp": ""}
+        for i, status in enumerate(statuses, start=1)
+    ]
+
+
+def _frame(records):
+    return pd.DataFrame.from_records(records)
+
+
+def test_concurrent_loads_share_one_fetch():
+    cache = SheetCache(ttl_seconds=60)
+    calls = []
+    release = threading.Event()
+
+    def fetch():
+        calls.append(1)
+        release.wait(5)
+        return _rows("Pending")
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get("spectrum", fetch, _frame)))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert len(results) == 8
+    assert all(snapshot is results[0] for snapshot in results)
+    assert cache.stats()["coalesced"] == 7
+
+
+def test_fetch_error_reaches_every_waiter_and_is_not_cached():
+    cache = SheetCache(ttl_seconds=60)
+    release = threading.Event()
+
+    def failing():
+        release.wait(5)
+        raise RuntimeError("quota")
+
+    errors = []
+
+    def load():
+        try:
+            cache.get("spectrum", failing, _frame)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=load) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert errors == ["quota"] * 3
+    assert cache.get("spectrum", lambda: _rows("Pending"), _frame).records == _rows("Pending")
+
+
+def test_identical_reload_keeps_the_version():
+    cache = SheetCache(ttl_seconds=60)
+    first = cache.get("spectrum", lambda: _rows("Pending", "Pending"), _frame)
+    again = cache.get("spectrum", lambda: _rows("Pending", "Pending"), _frame, force=True)
+
+    assert again is not first
+    assert again.version == first.version
+    assert not again.changed
+
+
+def test_reload_carries_row_versions_and_reports_changes():
+    cache = SheetCache(ttl_seconds=60)
+    first = cache.get("spectrum", lambda: _rows("Pending", "Pending"), _frame)
+    seen = []
+    cache.listeners.append(lambda key, snapshot: seen.append(key))
+
+    second = cache.get("spectrum", lambda: _rows("Pending", "Charged", "Pending"), _frame, force=True)
+
+    assert second.version == first.version + 1
+    assert second.row_versions[0] == first.version
+    assert second.changes_since(first.version) == {"2", "3"}
+    assert second.added == [2]
+    assert [pos for pos, _ in second.modified] == [1]
+    assert seen == ["spectrum"]
+
+
+def test_removed_rows_reset_the_delta_base():
+    cache = SheetCache(ttl_seconds=60)
+    first = cache.get("spectrum", lambda: _rows("Pending", "Pending"), _frame)
+    second = cache.get("spectrum", lambda: _rows("Pending"), _frame, force=True)
+
+    assert second.removed
+    assert second.changes_since(first.version) is None
+
+
+def test_invalidated_snapshot_still_seeds_row_versions():
+    cache = SheetCache(ttl_seconds=60)
+    first = cache.get("spectrum", lambda: _rows("Pending"), _frame)
+    cache.invalidate("spectrum")
+    second = cache.get("spectrum", lambda: _rows("Pending"), _frame)
+
+    assert second.version == first.version
+    assert second.changes_since(first.version) == set()
+
+
+def test_local_write_bumps_version_and_marks_the_row():
+    cache = SheetCache(ttl_seconds=60)
+    snapshot = cache.get("spectrum", lambda: _rows("Pending", "Pending"), _frame)
+    before = snapshot.version
+    snapshot.update("2", {"Status": "Charged"})
+    version = cache.bump("spectrum", "2")
+
+    assert version == before + 1
+    assert snapshot.version == version
+    assert snapshot.changes_since(before) == {"2"}
+    assert cache.parse_token(cache.token(version)) == version
+    assert cache.parse_token("other." + str(version)) is None
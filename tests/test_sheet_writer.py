@@ -0,0 +1,154 @@
+# tests/test_sheet_writer.py
+"""
+SheetWriteQueue flushes: failed batches are requeued (without resending
+rows Google already stored), updates follow their Record_ID rather than a
+row number, and writes nobody could place are reported as lost.
+"""
+from types import SimpleNamespace
+
+import pytest
+from gspread.exceptions import APIError
+from gspread.utils import a1_to_rowcol
+
+from app.services.sheet_writer import SheetWriteQueue
+
+HEADERS = ["Record_ID", "Status"]
+
+
+class FakeWorksheet:
+    def __init__(self, *rows):
+        self.values = [list(HEADERS)] + [list(row) for row in rows]
+        self.fail_next = None
+        self.append_calls = 0
+
+    def _maybe_fail(self):
+        if self.fail_next is not None:
+            error, self.fail_next = self.fail_next, None
+            raise error
+
+    def append_rows(self, rows, **kwargs):
+        self.append_calls += 1
+        self.values.extend(list(values) for values in rows)
+        self._maybe_fail()
+
+    def batch_update(self, data, **kwargs):
+        self._maybe_fail()
+        for update in data:
+            row, col = a1_to_rowcol(update["range"])
+            self.values[row - 1][col - 1] = update["values"][0][0]
+
+    def status_of(self, record_id):
+        return {str(row[0]): row[1] for row in self.values[1:]}.get(str(record_id))
+
+
+def _rejected():
+    response = SimpleNamespace(
+        status_code=400,
+        json=lambda: {"error": {"code": 400, "message": "bad range", "status": "INVALID_ARGUMENT"}},
+        text="bad range",
+    )
+    return APIError(response)
+
+
+@pytest.fixture
+def ws():
+    return FakeWorksheet(["1", "Pending"], ["2", "Pending"])
+
+
+def _queue(ws, **kwargs):
+    def resolve_rows(sheet):
+        return ws.values[0], {str(row[0]): pos for pos, row in enumerate(ws.values[1:], start=2)}
+
+    # Long interval: the tests flush by hand
+    return SheetWriteQueue(
+        lambda sheet: ws, resolve_rows, flush_interval=3600, max_pending=1000, **kwargs
+    )
+
+
+def test_updates_are_merged_and_follow_the_record_id(ws):
+    queue = _queue(ws)
+    queue.update_cell("spectrum", "2", "Status", "Charged")
+    queue.update_cell("spectrum", "2", "Status", "Declined")
+    # A row inserted above it before the flush moves record 2 down
+    ws.values.insert(1, ["9", "Pending"])
+
+    assert queue.flush()
+    assert ws.status_of("2") == "Declined"
+    assert ws.status_of("9") == "Pending"
+    assert queue.stats()["merged"] == 1
+    assert queue.confirm("spectrum", "2") is True
+
+
+def test_failed_flush_requeues_and_newer_values_win(ws):
+    queue = _queue(ws)
+    queue.update_cell("spectrum", "1", "Status", "Charged")
+    ws.fail_next = RuntimeError("503")
+
+    assert not queue.flush()
+    assert queue.confirm("spectrum", "1") is None
+    queue.update_cell("spectrum", "1", "Status", "Declined")
+
+    assert queue.flush()
+    assert ws.status_of("1") == "Declined"
+    assert queue.confirm("spectrum", "1") is True
+
+
+def test_requeued_append_is_not_sent_twice(ws):
+    queue = _queue(ws)
+    queue.append_row("spectrum", "3", ["3", "Pending"])
+    # Google stored the row but the call still failed
+    ws.fail_next = RuntimeError("timeout")
+
+    assert not queue.flush()
+    assert queue.flush()
+    assert [row[0] for row in ws.values[1:]] == ["1", "2", "3"]
+    assert queue.stats()["duplicate_appends_skipped"] == 1
+
+
+def test_check_present_skips_a_row_already_on_the_sheet(ws):
+    queue = _queue(ws)
+    queue.append_row("spectrum", "2", ["2", "Charged"], check_present=True)
+
+    assert queue.flush()
+    assert ws.append_calls == 0
+    assert ws.status_of("2") == "Pending"
+
+
+def test_orphaned_update_is_handed_over_or_lost(ws):
+    handed = []
+
+    def on_orphaned(sheet, missing):
+        handed.append(missing)
+        return {"7"}
+
+    queue = _queue(ws, on_orphaned=on_orphaned)
+    queue.update_cell("spectrum", "7", "Status", "Charge Back")
+    queue.update_cell("spectrum", "8", "Status", "Charge Back")
+
+    assert queue.flush()
+    assert handed == [{"7": {"Status": "Charge Back"}, "8": {"Status": "Charge Back"}}]
+    assert queue.confirm("spectrum", "7") is True
+    assert queue.confirm("spectrum", "8") is False
+    stats = queue.stats()
+    assert (stats["restored_cells"], stats["orphaned_cells"]) == (1, 1)
+
+    # A later write that lands clears the lost flag
+    ws.values.append(["8", "Pending"])
+    queue.update_cell("spectrum", "8", "Status", "Charged")
+    assert queue.flush()
+    assert queue.confirm("spectrum", "8") is True
+
+
+def test_rejected_batch_is_dropped_after_max_attempts(ws):
+    queue = _queue(ws, max_attempts=2)
+    queue.update_cell("spectrum", "1", "Status", "Charged")
+
+    ws.fail_next = _rejected()
+    assert not queue.flush()
+    ws.fail_next = _rejected()
+    assert queue.flush()
+
+    assert ws.status_of("1") == "Pending"
+    assert queue.confirm("spectrum", "1") is False
+    assert queue.stats()["dropped_writes"] == 1
+    assert queue.stats()["pending"] == 0
@@ -0,0 +1,148 @@
+# tests/test_storage_contract.py
+"""
+Both storage backends must return the same shapes: record dicts with the
+same keys, DataFrames with the same columns and dtypes, the same filters.
+The Sheets backend runs against in-memory worksheets (see conftest.py).
+"""
+import pandas as pd
+import pytest
+
+from app.services import google_sheets
+from app.services.sqlite_storage import SQLiteStorage
+from app.services.storage import Storage
+
+SUBMISSION = {
+    "agent_name": "Ali",
+    "name": "Customer",
+    "ph_number": "5550100",
+    "address": "1 Main St",
+    "email": "c@example.com",
+    "card_holder_name": "Customer",
+    "card_number": "4111 1111 1111 1111",
+    "expiry_date": "9/34",
+    "cvc": 123,
+    "charge": "$100",
+    "llc": "LLC",
+    "provider": "Spectrum",
+}
+
+
+@pytest.fixture
+def sqlite_storage(tmp_path):
+    return SQLiteStorage(str(tmp_path / "storage.sqlite3"))
+
+
+@pytest.fixture
+def backends(sheets_storage, sqlite_storage):
+    return [sheets_storage, sqlite_storage]
+
+
+def _fill(storage: Storage):
+    storage.create_transaction("spectrum", SUBMISSION)
+    storage.create_transaction("spectrum", dict(SUBMISSION, agent_name=" Sara "))
+    storage.create_transaction("insurance", SUBMISSION)
+
+
+def _shape(df: pd.DataFrame) -> dict:
+    return {column: str(dtype) for column, dtype in df.dtypes.items()}
+
+
+def test_storage_is_abstract():
+    with pytest.raises(TypeError):
+        Storage()
+
+
+def test_created_records_have_the_same_keys(backends):
+    sheets, sqlite = backends
+    for sheet in ("spectrum", "insurance"):
+        a = sheets.create_transaction(sheet, SUBMISSION)
+        b = sqlite.create_transaction(sheet, SUBMISSION)
+        assert list(a) == list(b)
+        assert list(sheets.get_record_by_id(sheet, a["Record_ID"])) == list(
+            sqlite.get_record_by_id(sheet, b["Record_ID"])
+        )
+
+
+@pytest.mark.parametrize("sheet", ["spectrum", "insurance"])
+def test_frames_have_the_same_columns_and_dtypes(backends, sheet):
+    for storage in backends:
+        _fill(storage)
+    sheets, sqlite = backends
+    for query in (
+        lambda s: s.get_all_transactions(sheet),
+        lambda s: s.get_pending_transactions(sheet),
+        lambda s: s.get_recent_transactions(sheet, 20),
+        lambda s: s.load_sheet_df(sheet),
+    ):
+        a, b = query(sheets), query(sqlite)
+        assert len(a) == len(b)
+        assert _shape(a) == _shape(b)
+
+
+def test_recent_agent_filter_ignores_surrounding_spaces(backends):
+    for storage in backends:
+        _fill(storage)
+        assert len(storage.get_recent_transactions("spectrum", 20, "Sara")) == 1
+        assert len(storage.get_recent_transactions("spectrum", 20, " Ali ")) == 1
+        assert storage.get_recent_transactions("spectrum", 20, "Bob").empty
+
+
+def test_updates_return_the_same_keys(backends):
+    results = []
+    for storage in backends:
+        record = storage.create_transaction("spectrum", SUBMISSION)
+        status = storage.update_status_by_record_id("spectrum", record["Record_ID"], "Charged")
+        fields = storage.update_transaction_fields("spectrum", record["Record_ID"], {"charge": "$75"})
+        assert status["Status"] == "Charged"
+        assert fields["Charge"] == "$75"
+        results.append((list(status), list(fields)))
+        with pytest.raises(ValueError):
+            storage.update_status_by_record_id("spectrum", "999999", "Charged")
+    assert results[0] == results[1]
+
+
+def test_versions_and_totals(backends):
+    for storage in backends:
+        token = storage.get_sheet_token("spectrum")
+        record = storage.create_transaction("spectrum", SUBMISSION)
+        assert storage.get_sheet_token("spectrum") != token
+        assert storage.get_changes_since("spectrum", token) == {str(record["Record_ID"])}
+        assert storage.get_changes_since("spectrum", "unknown") is None
+        assert isinstance(storage.get_night_charged_total(), float)
+        assert isinstance(storage.recompute_night_charged_total("spectrum"), float)
+
+
+def test_users(backends):
+    for storage in backends:
+        storage.add_user("u1", "hash1")
+        storage.update_user_hash("u1", "hash2")
+        assert [{k: str(v) for k, v in u.items()} for u in storage.load_users()] == [
+            {"ID": "u1", "Password": "hash2"}
+        ]
+
+
+def test_sqlite_bootstrap_imports_sheets_and_continues_ids(sheets_storage, sqlite_storage):
+    _fill(sheets_storage)
+    sheets_storage.add_user("u1", "hash1")
+    google_sheets._writer.flush()
+
+    assert sqlite_storage.bootstrap(google_sheets.export_records, sheets_storage.load_users)
+    assert not sqlite_storage.bootstrap(google_sheets.export_records, sheets_storage.load_users)
+
+    for sheet in ("spectrum", "insurance"):
+        a, b = sheets_storage.get_all_transactions(sheet), sqlite_storage.get_all_transactions(sheet)
+        assert a["Record_ID"].tolist() == b["Record_ID"].tolist()
+        assert _shape(a) == _shape(b)
+    assert sqlite_storage.load_users() == [{"ID": "u1", "Password": "hash1"}]
+    # Imported rows are already on the sheets, so nothing is journaled
+    assert sqlite_storage._conn().execute("SELECT COUNT(*) FROM journal").fetchone()[0] == 0
+
+    highest = int(sheets_storage.get_all_transactions("spectrum")["Record_ID"].max())
+    record = sqlite_storage.create_transaction("spectrum", SUBMISSION)
+    assert int(record["Record_ID"]) == highest + 1
+
+
+def test_sqlite_bootstrap_refuses_a_database_with_its_own_rows(sheets_storage, sqlite_storage):
+    sqlite_storage.create_transaction("spectrum", SUBMISSION)
+    with pytest.raises(RuntimeError):
+        sqlite_storage.bootstrap(google_sheets.export_records, sheets_storage.load_users)
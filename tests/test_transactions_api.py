@@ -0,0 +1,128 @@
+# tests/test_transactions_api.py
+"""
+List endpoints against the Sheets backend: ETag revalidation (304 while
+the sheet version is unchanged), `since=` deltas, and what callers
+without a manager token get.
+"""
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.routers.transactions_router import CARD_FIELDS
+from app.services.auth import ROLE_AGENT, ROLE_MANAGER, create_access_token
+
+SUBMISSION = {
+    "sheet": "spectrum",
+    "agent_name": "Ali",
+    "name": "Customer",
+    "ph_number": "5550100",
+    "address": "1 Main St",
+    "email": "c@example.com",
+    "card_holder_name": "Customer",
+    "card_number": "4111 1111 1111 1111",
+    "expiry_date": "9/34",
+    "cvc": 123,
+    "charge": "$100",
+    "llc": "LLC",
+    "provider": "Spectrum",
+}
+
+
+@pytest.fixture
+def client(worksheets):
+    # No `with`: the background jobs started on startup are not needed
+    return TestClient(app)
+
+
+@pytest.fixture
+def manager_headers():
+    return {"Authorization": "Bearer " + create_access_token("mgr", role=ROLE_MANAGER)}
+
+
+def _submit(client, **overrides):
+    response = client.post("/transactions/agent/submit", json=dict(SUBMISSION, **overrides))
+    assert response.status_code == 200
+    return str(response.json()["data"]["Record_ID"])
+
+
+def _ids(rows):
+    return [str(row["data"]["Record_ID"]) for row in rows]
+
+
+def test_pending_revalidates_with_etag(client, manager_headers):
+    _submit(client)
+    first = client.get("/transactions/pending?sheet=spectrum", headers=manager_headers)
+    etag = first.headers["ETag"]
+
+    again = client.get(
+        "/transactions/pending?sheet=spectrum", headers={**manager_headers, "If-None-Match": etag}
+    )
+    assert again.status_code == 304
+    assert again.headers["ETag"] == etag
+
+    _submit(client, agent_name="Sara")
+    changed = client.get(
+        "/transactions/pending?sheet=spectrum", headers={**manager_headers, "If-None-Match": etag}
+    )
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert len(changed.json()) == 2
+
+
+def test_since_returns_only_changes(client, manager_headers):
+    settled = _submit(client)
+    kept = _submit(client, agent_name="Sara")
+    first = client.get("/transactions/pending?sheet=spectrum", headers=manager_headers)
+    token = first.headers["X-Sheet-Version"]
+
+    added = _submit(client, agent_name="Bob")
+    response = client.patch(
+        f"/transactions/spectrum/{settled}/status",
+        json={"new_status": "Charged"},
+        headers=manager_headers,
+    )
+    assert response.status_code == 200
+
+    delta = client.get(f"/transactions/pending?sheet=spectrum&since={token}", headers=manager_headers)
+    body = delta.json()
+    assert body["full"] is False
+    assert _ids(body["upserts"]) == [added]
+    assert body["removed"] == [settled]
+    assert kept not in body["removed"]
+    assert body["version"] == delta.headers["X-Sheet-Version"]
+
+
+def test_unusable_since_token_returns_the_full_list(client, manager_headers):
+    _submit(client)
+    _submit(client, agent_name="Sara")
+    body = client.get(
+        "/transactions/pending?sheet=spectrum&since=elsewhere.3", headers=manager_headers
+    ).json()
+
+    assert body["full"] is True
+    assert len(body["upserts"]) == 2
+    assert body["removed"] == []
+
+
+def test_recent_without_a_manager_token_leaves_card_fields_out(client, manager_headers):
+    _submit(client)
+    agent = {"Authorization": "Bearer " + create_access_token("ali", role=ROLE_AGENT)}
+
+    public = client.get("/transactions/recent?sheet=spectrum&agent_name=Ali")
+    as_agent = client.get("/transactions/recent?sheet=spectrum&agent_name=Ali", headers=agent)
+    full = client.get("/transactions/recent?sheet=spectrum&agent_name=Ali", headers=manager_headers)
+
+    for response in (public, as_agent):
+        assert response.headers["ETag"].endswith('.public"')
+        assert not set(CARD_FIELDS) & set(response.json()[0]["data"])
+    assert set(CARD_FIELDS) <= set(full.json()[0]["data"])
+    assert full.headers["ETag"] != public.headers["ETag"]
+
+
+def test_manager_endpoints_need_a_manager_token(client):
+    agent = {"Authorization": "Bearer " + create_access_token("ali", role=ROLE_AGENT)}
+
+    assert client.get("/transactions/pending?sheet=spectrum").status_code == 401
+    assert client.get("/transactions/pending?sheet=spectrum", headers=agent).status_code == 403
+    bad = {"Authorization": "Bearer not-a-token"}
+    assert client.get("/transactions/recent?sheet=spectrum", headers=bad).status_code == 401
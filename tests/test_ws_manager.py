@@ -0,0 +1,160 @@
+# tests/test_ws_manager.py
+"""
+ConnectionManager routing (topic filters, the agent portal restriction)
+and resuming after a drop (replay of missed events, or a resync).
+"""
+import asyncio
+import json
+
+from starlette.datastructures import QueryParams
+
+from app.ws_manager import (
+    ConnectionManager,
+    encode_event,
+    parse_resume,
+    parse_topics,
+    restrict_topics,
+)
+
+
+class FakeSocket:
+    def __init__(self):
+        self.sent = []
+        self.subprotocol = None
+        self.closed = None
+
+    async def accept(self, subprotocol=None):
+        self.subprotocol = subprotocol
+
+    async def send_text(self, message):
+        self.sent.append(json.loads(message))
+
+    async def close(self, code=1000):
+        self.closed = code
+
+
+def _event(agent, sheet="spectrum", kind="new_pending"):
+    return {"type": kind, "sheet": sheet, "agent_name": agent}
+
+
+def _agents(socket):
+    return [m.get("agent_name") for m in socket.sent if m["type"] not in ("hello", "resync")]
+
+
+async def _drain():
+    # Let the sender tasks write out what is queued (each send is a few
+    # loop iterations: wait_for runs it as a task)
+    for _ in range(50):
+        await asyncio.sleep(0)
+
+
+def _run(scenario, **options):
+    async def main():
+        manager = ConnectionManager(**options)
+        await manager.start()
+        try:
+            await scenario(manager)
+        finally:
+            for websocket in manager.active_connections:
+                manager.disconnect(websocket)
+            await manager.stop()
+
+    asyncio.run(main())
+
+
+def test_events_only_reach_matching_subscriptions():
+    async def scenario(manager):
+        everything, ali, insurance = FakeSocket(), FakeSocket(), FakeSocket()
+        await manager.connect(everything)
+        await manager.connect(ali, parse_topics(QueryParams("agent=Ali")))
+        await manager.connect(
+            insurance, parse_topics(QueryParams("sheet=insurance&type=status_update,new_pending"))
+        )
+
+        await manager.broadcast(_event("Ali"))
+        await manager.broadcast(_event("Bob", sheet="insurance"))
+        await manager.broadcast(_event(" Ali ", sheet="insurance", kind="deleted"))
+        await _drain()
+
+        assert _agents(everything) == ["Ali", "Bob", " Ali "]
+        assert _agents(ali) == ["Ali", " Ali "]
+        assert _agents(insurance) == ["Bob"]
+        assert [m["seq"] for m in everything.sent[1:]] == [1, 2, 3]
+        assert manager.stats()["filtered"] == 3
+
+    _run(scenario, replay_size=10)
+
+
+def test_non_manager_sockets_get_one_agent_or_nothing():
+    assert restrict_topics({}, is_manager=False) == {"agent": set()}
+    assert restrict_topics({"agent": {"Ali", "Bob"}}, is_manager=False) == {"agent": set()}
+    assert restrict_topics({"agent": {"Ali"}}, is_manager=False) == {"agent": {"Ali"}}
+    assert restrict_topics({}, is_manager=True) == {}
+
+    async def scenario(manager):
+        anonymous = FakeSocket()
+        await manager.connect(anonymous, restrict_topics({}, is_manager=False))
+        await manager.broadcast(_event("Ali"))
+        await _drain()
+        assert _agents(anonymous) == []
+
+    _run(scenario, replay_size=10)
+
+
+def test_reconnect_replays_only_missed_matching_events():
+    async def scenario(manager):
+        first = FakeSocket()
+        await manager.connect(first, {"agent": {"Ali"}})
+        await manager.broadcast(_event("Ali"))
+        await _drain()
+        hello = first.sent[0]
+        last_seq = first.sent[-1]["seq"]
+        manager.disconnect(first)
+
+        await manager.broadcast(_event("Bob"))
+        await manager.broadcast(_event("Ali", kind="status_update"))
+
+        resumed = FakeSocket()
+        resume = parse_resume(QueryParams(f"epoch={hello['epoch']}&last_seq={last_seq}"))
+        await manager.connect(resumed, {"agent": {"Ali"}}, resume, subprotocol="bearer")
+        await _drain()
+
+        assert resumed.subprotocol == "bearer"
+        assert [m["type"] for m in resumed.sent] == ["hello", "status_update"]
+        assert resumed.sent[1]["seq"] == 3
+        assert manager.stats()["replayed"] == 1
+
+    _run(scenario, replay_size=10)
+
+
+def test_resume_from_another_epoch_or_too_far_back_resyncs():
+    async def scenario(manager):
+        for _ in range(4):
+            await manager.broadcast(_event("Ali"))
+
+        stale, restarted = FakeSocket(), FakeSocket()
+        await manager.connect(stale, {}, (manager.epoch, 0))
+        await manager.connect(restarted, {}, ("old-epoch", 4))
+        await _drain()
+
+        for socket in (stale, restarted):
+            assert [m["type"] for m in socket.sent] == ["hello", "resync"]
+        assert manager.stats()["resyncs"] == 2
+
+    _run(scenario, replay_size=2)
+
+
+def test_slow_consumer_is_disconnected():
+    async def scenario(manager):
+        socket = FakeSocket()
+        await manager.connect(socket)
+        # No await in between: the sender task never gets to run
+        for _ in range(3):
+            manager.publish(*encode_event(_event("Ali")))
+        await _drain()
+
+        assert socket.closed == 1013
+        assert manager.active_connections == []
+        assert manager.stats()["slow_disconnects"] == 1
+
+    _run(scenario, max_queue=2, slow_policy="disconnect", replay_size=10)